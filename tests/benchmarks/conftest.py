@@ -0,0 +1,66 @@
+import os
+import pathlib
+import threading
+
+import psutil
+import pytest
+
+from tests.benchmarks.synthetic import scale_csv
+
+FIXTURES = {
+    30: pathlib.Path('tests/fixtures/IDP_UCL_VS_dataset/dummy_data_30pid.csv'),
+    200: pathlib.Path('tests/fixtures/IDP_UCL_VS_dataset/dummy_data_200pid.csv'),
+    500: pathlib.Path('tests/fixtures/IDP_UCL_VS_dataset/dummy_data_500pid.csv'),
+}
+"""The dummy data, by number of patients."""
+
+SYNTHETIC_PATH = pathlib.Path('.benchmarks/fixtures')
+
+
+def pytest_generate_tests(metafunc):
+    """Parametrize `patients` from BENCHMARK_PATIENTS, a comma separated list, default 30."""
+    if 'patients' in metafunc.fixturenames:
+        patients = [int(_) for _ in os.environ.get('BENCHMARK_PATIENTS', '30').split(',')]
+        metafunc.parametrize('patients', patients)
+
+
+@pytest.fixture
+def input_path(patients: int) -> pathlib.Path:
+    """The dummy data for this many patients, generated once if there is no fixture."""
+    if patients in FIXTURES:
+        return FIXTURES[patients]
+    path = SYNTHETIC_PATH / f"synthetic_{patients}pid.csv"
+    if not path.exists():
+        scale_csv(patients, path)
+    return path
+
+
+class PeakRSS:
+    """Sample the process' resident set size in a thread, keep the maximum."""
+
+    def __init__(self, interval: float = 0.01) -> None:
+        self.interval = interval
+        self.peak = 0
+        self._process = psutil.Process()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self) -> None:
+        while True:
+            self.peak = max(self.peak, self._process.memory_info().rss)
+            if self._stop.wait(self.interval):
+                return
+
+    def __enter__(self) -> 'PeakRSS':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+@pytest.fixture
+def peak_rss() -> type[PeakRSS]:
+    """Context manager that measures peak RSS."""
+    return PeakRSS
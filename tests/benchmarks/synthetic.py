@@ -0,0 +1,40 @@
+"""Scale the dummy data to any number of patients.
+
+Usage: python -m tests.benchmarks.synthetic PATIENTS OUTPUT_PATH
+"""
+import csv
+import pathlib
+import sys
+from collections import defaultdict
+
+SOURCE_PATH = pathlib.Path('tests/fixtures/IDP_UCL_VS_dataset/dummy_data_500pid.csv')
+"""The dummy patients that are copied."""
+
+FIRST_PATIENT_ID = 10_000_000
+"""Synthetic patient ids start here, above the dummy data's ids."""
+
+
+def scale_csv(patients: int, output_path: pathlib.Path, source_path: pathlib.Path = SOURCE_PATH) -> pathlib.Path:
+    """Write a csv of `patients` patients, each a copy of a dummy patient's rows with a new patient id."""
+    with open(source_path, newline='') as fp:
+        reader = csv.reader(fp)
+        header = next(reader)
+        rows = defaultdict(list)
+        for row in reader:
+            if row:
+                rows[row[0].split('_', 1)[0]].append(row)
+    dummy_patients = list(rows.values())
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, 'w', newline='') as fp:
+        writer = csv.writer(fp)
+        writer.writerow(header)
+        for index in range(patients):
+            patient_id = FIRST_PATIENT_ID + index
+            for row in dummy_patients[index % len(dummy_patients)]:
+                writer.writerow([f"{patient_id}_{row[0].split('_', 1)[1]}"] + row[1:])
+    return output_path
+
+
+if __name__ == '__main__':
+    print(scale_csv(int(sys.argv[1]), pathlib.Path(sys.argv[2])))
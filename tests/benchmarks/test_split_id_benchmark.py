@@ -0,0 +1,20 @@
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+pytestmark = pytest.mark.benchmark
+
+IDS = ['123_0_A', '123_0_B', '123_1_A_A', '123_1_A_B', '123_2_B_A', '123_2_B_B']
+"""A patient's ids, as they appear in the dummy data."""
+
+
+@pytest.mark.parametrize('validate', [False, True])
+def test_split_id_benchmark(benchmark, validate):
+    """The cached parser and the validating parser, per patient's rows."""
+    from ucl_stavrinides.transformer import parse_id, split_id
+
+    parse_id.cache_clear()
+    benchmark.group = 'split_id'
+    benchmark(lambda: [split_id(_, validate=validate) for _ in IDS])
+    if not validate:
+        assert parse_id.cache_info().hits > 0, "should have used the cache"
@@ -0,0 +1,119 @@
+import pathlib
+import shutil
+import time
+
+import pytest
+
+from g3t_etl.factory import helper, transform_csv
+from g3t_etl.loader import load_plugins
+
+pytest.importorskip('pytest_benchmark')
+
+pytestmark = pytest.mark.benchmark
+
+
+def _columnar(input_path: pathlib.Path, output_path: pathlib.Path):
+    from ucl_stavrinides.columnar import transform_csv_columnar
+    return transform_csv_columnar(input_path, output_path)
+
+
+def _streaming(input_path: pathlib.Path, output_path: pathlib.Path):
+    from ucl_stavrinides.streaming import transform_csv_streaming
+    return transform_csv_streaming(input_path, output_path)
+
+
+def _trusted(input_path: pathlib.Path, output_path: pathlib.Path):
+    from ucl_stavrinides.streaming import transform_csv_streaming
+    return transform_csv_streaming(input_path, output_path, trusted=True)
+
+
+ENGINES = {
+    'pydantic': transform_csv,
+    'columnar': _columnar,
+    'streaming': _streaming,
+    'trusted': _trusted,
+}
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_transform_throughput(benchmark, engine, patients, input_path, plugins, peak_rss, tmp_path):
+    """Rows/sec, resources/sec and peak RSS of each engine."""
+    load_plugins(plugins)
+    output_path = tmp_path / 'META'
+    results = []
+
+    def _setup():
+        shutil.rmtree(output_path, ignore_errors=True)
+        output_path.mkdir()
+
+    def _transform():
+        results.append(ENGINES[engine](input_path, output_path))
+
+    with peak_rss() as rss:
+        benchmark.pedantic(_transform, setup=_setup, rounds=1, iterations=1)
+
+    seconds = benchmark.stats.stats.min
+    benchmark.extra_info.update({
+        'patients': patients,
+        'rows': results[0].parsed_count,
+        'resources': results[0].emitted_count,
+        'rows_per_sec': results[0].parsed_count / seconds,
+        'resources_per_sec': results[0].emitted_count / seconds,
+        'peak_rss_mb': rss.peak / 2 ** 20,
+    })
+    print(f"{engine} {patients} patients: {benchmark.extra_info}")
+
+
+def test_transform_stages(benchmark, patients, input_path, plugins):
+    """Time spent in each stage of the default, pydantic, path."""
+    from ucl_stavrinides.columnar import create_research_study
+    from ucl_stavrinides.streaming import iter_records
+    from ucl_stavrinides.transformer import SimpleTransformer, parse_id, split_id
+
+    load_plugins(plugins)
+    stages = dict.fromkeys(['csv_parse', 'submission_validation', 'split_id', 'resource_construction',
+                            'observation_creation', 'serialization'], 0.0)
+    create_observations = SimpleTransformer.create_observations
+
+    def _timed_create_observations(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return create_observations(self, *args, **kwargs)
+        finally:
+            stages['observation_creation'] += time.perf_counter() - start
+
+    def _pipeline():
+        for stage in stages:
+            stages[stage] = 0.0
+        start = time.perf_counter()
+        records = list(iter_records(input_path))
+        stages['csv_parse'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        transformers = [SimpleTransformer(**record, helper=helper) for record in records]
+        stages['submission_validation'] = time.perf_counter() - start
+
+        parse_id.cache_clear()
+        start = time.perf_counter()
+        for transformer in transformers:
+            split_id(transformer.id)
+        stages['split_id'] = time.perf_counter() - start
+
+        research_study = create_research_study()
+        SimpleTransformer.create_observations = _timed_create_observations
+        try:
+            start = time.perf_counter()
+            resources = [resource for transformer in transformers for resource in transformer.transform(research_study)]
+            stages['resource_construction'] = time.perf_counter() - start - stages['observation_creation']
+        finally:
+            SimpleTransformer.create_observations = create_observations
+
+        start = time.perf_counter()
+        for resource in resources:
+            resource.json()
+        stages['serialization'] = time.perf_counter() - start
+        return len(records)
+
+    rows = benchmark.pedantic(_pipeline, rounds=1, iterations=1)
+    benchmark.extra_info.update({'patients': patients, 'rows': rows, 'stages': dict(stages)})
+    print(f"stages {patients} patients: " + ', '.join(f"{k} {v:.3f}s" for k, v in stages.items()))
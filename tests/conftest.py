@@ -1,4 +1,8 @@
+import pathlib
+from typing import Callable, NamedTuple
+
 import pytest
+from g3t_etl.factory import TransformationResults
 
 
 @pytest.fixture
@@ -13,3 +17,60 @@ def expected_keys():
             'adcu', 'ageDiagM', 'ageDiagY', 'align', 'best', 'bestVol', 'focality', 'gleason', 'id', 'level',
             'likert', 'loc', 'mccl', 'months.diag', 'pirads', 'ppsa', 'precise', 'prvol', 'psaBx', 'side',
             't2Vol', 'ucl', 'zone']
+
+
+@pytest.fixture
+def plugins() -> list[str]:
+    """Return a list of plugins."""
+    return ['ucl_stavrinides.transformer']
+
+
+def read_ndjson(output_path: pathlib.Path) -> dict[str, str]:
+    """Read all ndjson files in a directory, by file name; the shards of a resource type are read, in order, as its {resource_type}.ndjson."""
+    from ucl_stavrinides.writers import open_ndjson
+
+    ndjson = {}
+    for path in sorted(pathlib.Path(output_path).glob('*.ndjson*')):
+        name = f"{path.name.split('.')[0]}.ndjson"
+        with open_ndjson(path) as fp:
+            ndjson[name] = ndjson.get(name, '') + fp.read()
+    return ndjson
+
+
+class EngineOutput(NamedTuple):
+    """Where a transform wrote its ndjson, its results and the ndjson, see read_ndjson."""
+    path: pathlib.Path
+    results: TransformationResults
+    ndjson: dict[str, str]
+
+
+@pytest.fixture
+def compare_engines(plugins, tmp_path_factory) -> Callable[..., dict[str, EngineOutput]]:
+    """Transform a csv with g3t_etl.factory.transform_csv and with each engine, assert the engines emit the same ndjson.
+
+    Call it with the input_path and the engines by name, each called as transform(input_path, output_path);
+    transform_csv reads expected_input_path if given. Returns the EngineOutput of each engine, and of transform_csv as 'expected',
+    for the assertions specific to an engine.
+    """
+    from g3t_etl.factory import transform_csv
+    from g3t_etl.loader import load_plugins
+
+    load_plugins(plugins)
+
+    def _compare_engines(input_path: pathlib.Path, engines: dict[str, Callable],
+                         expected_input_path: pathlib.Path = None) -> dict[str, EngineOutput]:
+        work_path = tmp_path_factory.mktemp('engines')
+        outputs = {}
+        for name, transform in [('expected', lambda _, output_path: transform_csv(expected_input_path or input_path, output_path))] + \
+                list(engines.items()):
+            output_path = work_path / name
+            output_path.mkdir()
+            results = transform(input_path, output_path)
+            assert not results.validation_errors, f"{name} validation errors {results.validation_errors}"
+            assert not results.transformer_errors, f"{name} transformer errors {results.transformer_errors}"
+            outputs[name] = EngineOutput(path=output_path, results=results, ndjson=read_ndjson(output_path))
+        for name in engines:
+            assert outputs[name].ndjson == outputs['expected'].ndjson, f"{name} should emit the same ndjson as transform_csv"
+        return outputs
+
+    return _compare_engines
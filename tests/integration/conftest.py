@@ -3,12 +3,6 @@ import pathlib
 import pytest
 
 
-@pytest.fixture
-def plugins() -> list[str]:
-    """Return a list of plugins."""
-    return ['ucl_stavrinides.transformer']
-
-
 @pytest.fixture
 def test_fixture_paths() -> list[str]:
     """Return a path to dummy data."""
@@ -20,3 +14,16 @@ def test_fixture_paths() -> list[str]:
             'tests/fixtures/IDP_UCL_VS_dataset/dummy_data_500pid.csv',
         ]
     ]
+
+
+@pytest.fixture
+def meta_path(test_fixture_paths, plugins, tmp_path) -> pathlib.Path:
+    """Transform the 30 patient dummy data into a fresh META directory."""
+    from g3t_etl.factory import transform_csv
+    from g3t_etl.loader import load_plugins
+
+    load_plugins(plugins)
+    meta_path = tmp_path / 'META'
+    meta_path.mkdir()
+    transform_csv(test_fixture_paths[0], meta_path)
+    return meta_path
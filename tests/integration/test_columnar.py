@@ -0,0 +1,24 @@
+def test_columnar_identical(test_fixture_paths, compare_engines):
+    """The columnar engine should emit the same ndjson as the pydantic path."""
+    from ucl_stavrinides.columnar import transform_csv_columnar
+
+    compare_engines(test_fixture_paths[0], {'columnar': transform_csv_columnar})
+
+
+def test_columnar_fallback(test_fixture_paths, compare_engines, tmp_path):
+    """Rows that fail column validation should be transformed by pydantic."""
+    from ucl_stavrinides.columnar import transform_csv_columnar
+
+    lines = test_fixture_paths[0].read_text().splitlines()[:41]
+    header = lines[0].split(',')
+    column = header.index('BxPreDiag')
+    for index in range(1, len(lines)):
+        row = lines[index].split(',')
+        # pandas reads a boolean column, pydantic coerces it to an int
+        row[column] = 'True'
+        lines[index] = ','.join(row)
+    input_path = tmp_path / 'input.csv'
+    input_path.write_text('\n'.join(lines) + '\n')
+
+    outputs = compare_engines(input_path, {'columnar': transform_csv_columnar})
+    assert '"code":"BxPreDiag"' in outputs['columnar'].ndjson['Observation.ndjson'], "should have transformed the boolean column"
@@ -0,0 +1,32 @@
+def test_transform_trusted(test_fixture_paths, compare_engines):
+    """Trusted emission should emit the same ndjson as transform_csv, and every resource should validate."""
+    from ucl_stavrinides.emission import validate_ndjson
+    from ucl_stavrinides.streaming import transform_csv_streaming
+
+    outputs = compare_engines(test_fixture_paths[0], {'trusted': lambda *_: transform_csv_streaming(*_, trusted=True, validation_rate=0.1)})
+    assert outputs['trusted'].results.parsed_count == 160, "should have parsed all rows"
+    assert list(validate_ndjson(outputs['trusted'].path)) == [], "post hoc validation should pass"
+
+
+def test_sampled_validator():
+    """Sampling should be deterministic, and a drifted resource should be reported."""
+    import uuid
+
+    import pytest
+    from ucl_stavrinides.emission import SampledValidator
+
+    ids = [str(uuid.uuid5(uuid.NAMESPACE_DNS, str(_))) for _ in range(10000)]
+    validator = SampledValidator(0.01)
+    sampled = [_ for _ in ids if validator.is_sampled(_)]
+    assert 50 < len(sampled) < 150, "should sample about 1%"
+    assert sampled == [_ for _ in ids if SampledValidator(0.01).is_sampled(_)], "should sample the same ids"
+    assert not any(SampledValidator(0).is_sampled(_) for _ in ids), "should not sample"
+
+    validator = SampledValidator(1)
+    validator.validate({'resourceType': 'Patient', 'id': ids[0], 'active': True})
+    with pytest.raises(ValueError):
+        validator.validate({'resourceType': 'Patient', 'id': ids[0], 'active': 'maybe'})
+    with pytest.raises(ValueError, match='round trip'):
+        # keys out of FHIR element order
+        validator.validate({'resourceType': 'Patient', 'active': True, 'id': ids[0]})
+    assert validator.validated_count == 2
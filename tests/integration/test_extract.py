@@ -1,8 +1,8 @@
-import numpy as np
 import pandas
 from pydantic import ValidationError
 
 from g3t_etl import print_validation_error
+from ucl_stavrinides.preprocess import preprocess, records
 from ucl_stavrinides.submission import Submission
 
 
@@ -21,15 +21,63 @@ def test_submission_dummy_data(test_fixture_paths):
         assert dummy_data_path.exists(), f"do not have {dummy_data_path}"
         # clean up the data: remove leading/trailing spaces, replace NaN with None
         df = pandas.read_csv(dummy_data_path, skipinitialspace=True, skip_blank_lines=True, comment="#")
-        df = df.map(lambda x: x.strip() if isinstance(x, str) else x)
-        df = df.replace({np.nan: None})
-
-        records = df.to_dict(orient='records')
         c = 1
-        for record in records:
+        for record in records(preprocess(df).df):
             try:
                 _ = Submission(**record)
                 c += 1
             except ValidationError as e:
                 print_validation_error(e, c, dummy_data_path, record, verbose=True)
                 raise e
+
+
+def test_preprocess_equals_lambda(test_fixture_paths):
+    """The vectorized rules should clean the fixtures like the per cell lambda of g3t_etl."""
+    import numpy as np
+
+    df = pandas.read_csv(test_fixture_paths[0], skipinitialspace=True, skip_blank_lines=True, comment="#")
+    expected = df.map(lambda x: x.strip() if isinstance(x, str) else x).replace({np.nan: None}).to_dict(orient='records')
+    results = preprocess(df)
+    assert records(results.df) == expected
+    assert results.row_counts['whitespace'] > 0, "the fixtures have values with trailing spaces"
+    assert results.row_counts['excluded'] == 0
+
+
+def test_extract_parquet(test_fixture_paths, compare_engines, tmp_path):
+    """Transforming the extract should emit the same ndjson as transforming the csv."""
+    from ucl_stavrinides.columnar import transform_csv_columnar
+    from ucl_stavrinides.extract import extract_csv, is_current, read_extract
+    from ucl_stavrinides.streaming import transform_csv_streaming
+
+    input_path = test_fixture_paths[0]
+    results = extract_csv(input_path, tmp_path / 'extract.parquet')
+    assert results.row_count == 160
+    assert not results.validation_errors
+    assert is_current(results.path, input_path)
+
+    table = read_extract(results.path)
+    assert table.schema.field('months.diag').metadata[b'field'] == b'months_diag', "should keep the field metadata"
+    assert str(table.schema.field('ageDiagM').type) == 'int64', "should be typed"
+
+    compare_engines(results.path, {'columnar': transform_csv_columnar, 'streaming': transform_csv_streaming}, expected_input_path=input_path)
+
+
+def test_extract_invalid_rows(test_fixture_paths, tmp_path, monkeypatch):
+    """Invalid rows should be left out, and reported with their own row index."""
+    import ucl_stavrinides.extract
+    from ucl_stavrinides.extract import extract_csv
+
+    reported = []
+    monkeypatch.setattr(ucl_stavrinides.extract, 'print_validation_error', lambda e, index, *_: reported.append(index))
+    lines = test_fixture_paths[0].read_text().splitlines()[:5]
+    column = lines[0].split(',').index('ageDiagM')
+    for index in [2, 3]:
+        row = lines[index].split(',')
+        row[column] = 'x'
+        lines[index] = ','.join(row)
+    input_path = tmp_path / 'input.csv'
+    input_path.write_text('\n'.join(lines) + '\n')
+
+    results = extract_csv(input_path)
+    assert results.row_count == 2 and len(results.validation_errors) == 2
+    assert reported == [1, 2], "should report the index of each invalid row"
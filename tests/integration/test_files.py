@@ -0,0 +1,102 @@
+import hashlib
+import pathlib
+
+import orjson
+
+
+def test_associate_files(tmp_path):
+    """Each Specimen's files should be matched in one scan, hashed, and written as DocumentReferences."""
+    from ucl_stavrinides.files import associate_files
+
+    meta_path = tmp_path / 'META'
+    meta_path.mkdir()
+    specimens = {'123_1_A': 'a' * 8, '123_1_A_B': 'b' * 8, '124_0_B': 'c' * 8}
+    meta_path.joinpath('Specimen.ndjson').write_text(''.join(
+        orjson.dumps({'resourceType': 'Specimen', 'id': id_, 'identifier': [{'use': 'official', 'value': value}]}).decode() + '\n'
+        for value, id_ in specimens.items()
+    ))
+    files_path = tmp_path / 'files'
+    files_path.mkdir()
+    contents = {
+        '123_1_A_mri_guided_prostate_biopsy.jpeg': b'a',
+        '123_1_A_B_mri_guided_prostate_biopsy.jpeg': b'ab',
+        '124_0_B_mri_guided_prostate_biopsy.jpeg': b'b' * (1 << 20),
+        '125_0_B_mri_guided_prostate_biopsy.jpeg': b'no specimen',
+        '124_0_B_notes.txt': b'not an image',
+    }
+    for name, content in contents.items():
+        files_path.joinpath(name).write_bytes(content)
+
+    assert associate_files(meta_path, files_path, workers=2, cache_path=tmp_path / 'hashes.json') == 3, "should associate a file with each specimen"
+    document_references = [orjson.loads(_) for _ in meta_path.joinpath('DocumentReference.ndjson').read_text().splitlines()]
+    by_title = {_['content'][0]['attachment']['title']: _ for _ in document_references}
+    assert by_title['123_1_A_B_mri_guided_prostate_biopsy.jpeg']['subject'] == {'reference': 'Specimen/bbbbbbbb'}, \
+        "should match the longest specimen identifier"
+    assert by_title['123_1_A_mri_guided_prostate_biopsy.jpeg']['subject'] == {'reference': 'Specimen/aaaaaaaa'}
+    attachment = by_title['124_0_B_mri_guided_prostate_biopsy.jpeg']['content'][0]['attachment']
+    assert attachment['size'] == 1 << 20
+    assert attachment['extension'][0]['valueString'] == hashlib.md5(b'b' * (1 << 20)).hexdigest()
+    assert attachment['contentType'] == 'image/jpeg'
+
+
+def test_associate_files_merge(tmp_path, monkeypatch):
+    """Associating again should keep the other DocumentReferences, and mint the same ids from relative and absolute paths."""
+    from ucl_stavrinides.files import associate_files
+
+    meta_path = tmp_path / 'META'
+    meta_path.mkdir()
+    meta_path.joinpath('Specimen.ndjson').write_text(
+        orjson.dumps({'resourceType': 'Specimen', 'id': 'a' * 8, 'identifier': [{'use': 'official', 'value': '123_1_A'}]}).decode() + '\n')
+    other = orjson.dumps({'resourceType': 'DocumentReference', 'id': 'other', 'status': 'current'}).decode() + '\n'
+    meta_path.joinpath('DocumentReference.ndjson').write_text(other)
+    files_path = tmp_path / 'files'
+    files_path.mkdir()
+    files_path.joinpath('123_1_A_mri_guided_prostate_biopsy.jpeg').write_bytes(b'a')
+    monkeypatch.chdir(tmp_path)
+
+    assert associate_files(pathlib.Path('META'), pathlib.Path('files'), cache_path=None) == 1
+    first = meta_path.joinpath('DocumentReference.ndjson').read_text().splitlines(keepends=True)
+    assert first[0] == other and len(first) == 2, "should keep the DocumentReferences already there"
+    assert orjson.loads(first[1])['content'][0]['attachment']['url'] == 'file:///files/123_1_A_mri_guided_prostate_biopsy.jpeg'
+
+    assert associate_files(meta_path, files_path, cache_path=None) == 1
+    assert meta_path.joinpath('DocumentReference.ndjson').read_text().splitlines(keepends=True) == first, \
+        "an absolute path to the same file should replace its DocumentReference"
+
+
+def test_hash_cache(tmp_path, monkeypatch):
+    """Unchanged files and hard links should not be re-hashed."""
+    import os
+
+    import ucl_stavrinides.files
+    from ucl_stavrinides.files import HashCache, hash_files
+
+    hashed = []
+    md5 = ucl_stavrinides.files.md5
+    monkeypatch.setattr(ucl_stavrinides.files, 'md5', lambda path: hashed.append(path.name) or md5(path))
+
+    paths = [tmp_path / 'a.jpeg', tmp_path / 'b.jpeg', tmp_path / 'a_link.jpeg']
+    paths[0].write_bytes(b'a')
+    paths[1].write_bytes(b'b')
+    os.link(paths[0], paths[2])
+    cache_path = tmp_path / 'state' / 'hashes.json'
+
+    infos = hash_files(paths, cache=HashCache(cache_path))
+    assert sorted(hashed) == ['a.jpeg', 'b.jpeg'], "should hash a hard linked file once"
+    assert infos[0].md5 == infos[2].md5 == hashlib.md5(b'a').hexdigest()
+
+    assert not cache_path.exists(), "should only be saved on request"
+    cache = HashCache(cache_path)
+    hash_files(paths, cache=cache)
+    cache.save()
+    hashed.clear()
+
+    paths[1].write_bytes(b'changed')
+    os.utime(paths[1], ns=(0, 10 ** 9))
+    paths[0].rename(tmp_path / 'moved.jpeg')
+    paths[0] = tmp_path / 'moved.jpeg'
+    cache = HashCache(cache_path)
+    infos = hash_files(paths, cache=cache)
+    assert hashed == ['b.jpeg'], "should only re-hash the changed file"
+    assert cache.hits == 2, "a moved file should be found by inode"
+    assert infos[1].md5 == hashlib.md5(b'changed').hexdigest()
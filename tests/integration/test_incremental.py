@@ -0,0 +1,62 @@
+from tests.conftest import read_ndjson
+
+
+def test_transform_incremental(test_fixture_paths, compare_engines, tmp_path):
+    """Patching the previous output should emit the same ndjson as transforming the new delivery from scratch."""
+    from ucl_stavrinides.incremental import transform_csv_incremental
+
+    lines = test_fixture_paths[0].read_text().splitlines()
+    header, rows = lines[0], lines[1:41]
+    state_path = tmp_path / 'state'
+    output_path = tmp_path / 'META'
+    input_path = tmp_path / 'input.csv'
+
+    def _deliver(rows_: list[str], name: str) -> tuple[dict[str, str], int]:
+        """Transform the delivery incrementally, and from scratch for comparison."""
+        input_path.write_text('\n'.join([header] + rows_) + '\n')
+        results = transform_csv_incremental(input_path, output_path, state_path=state_path)
+        # the incremental output is patched in place, compare it to transform_csv
+        expected = compare_engines(input_path, {})['expected']
+        assert read_ndjson(output_path) == expected.ndjson, f"{name} should be identical to a full transform"
+        return read_ndjson(output_path), results.parsed_count
+
+    first, parsed_count = _deliver(rows, 'first')
+    assert parsed_count == 40, "should transform every row of the first delivery"
+
+    _, parsed_count = _deliver(rows, 'unchanged')
+    assert parsed_count == 0, "should not transform unchanged rows"
+
+    # change a value of the first patient, drop the second patient, add a patient
+    first_patient = rows[0].split('_', 1)[0]
+    second_patient = next(_ for _ in rows if not _.startswith(first_patient + '_')).split('_', 1)[0]
+    changed = [_ for _ in rows if not _.startswith(second_patient + '_')]
+    changed[0] = changed[0].replace(',focal,', ',multifocal,', 1)
+    assert changed[0] != rows[0], "should have changed the first row"
+    new_patient = [_ for _ in lines[41:] if _.split('_', 1)[0] == lines[41].split('_', 1)[0]]
+    changed += new_patient
+    patched, parsed_count = _deliver(changed, 'changed')
+    first_patient_rows = len([_ for _ in changed if _.startswith(first_patient + '_')])
+    assert parsed_count == first_patient_rows + len(new_patient), "should only transform the changed and new patients"
+    assert patched != first, "should have patched the output"
+
+
+def test_fingerprint(tmp_path):
+    """A change to the plugin's sources, the templates or the dictionary should make the manifest stale."""
+    from ucl_stavrinides.incremental import fingerprint
+
+    package_path, templates_path, dictionary_path = tmp_path / 'package', tmp_path / 'templates', tmp_path / 'dictionary.xlsx'
+    package_path.mkdir()
+    templates_path.mkdir()
+    (package_path / 'emission.py').write_text('VERSION = 1\n')
+    (templates_path / 'categories.yaml').write_text('fields: {}\n')
+    dictionary_path.write_bytes(b'1')
+
+    def _fingerprint() -> str:
+        return fingerprint(templates_path=templates_path, package_path=package_path, dictionary_path=str(dictionary_path))
+
+    fingerprints = [_fingerprint()]
+    assert _fingerprint() == fingerprints[0], "should be stable"
+    for path, content in [(package_path / 'emission.py', 'VERSION = 2\n'), (templates_path / 'categories.yaml', 'fields: []\n'), (dictionary_path, '2')]:
+        path.write_text(content)
+        fingerprints.append(_fingerprint())
+    assert len(set(fingerprints)) == 4, "each change should change the fingerprint"
@@ -0,0 +1,26 @@
+import orjson
+
+
+def test_check_integrity(meta_path):
+    """The emitted graph should be intact; duplicate ids, dangling references and orphans should be reported."""
+    from ucl_stavrinides.integrity import check_integrity
+
+    assert not list(check_integrity(meta_path)), "the transformed references should resolve"
+
+    # duplicate a Patient, point a Specimen at a missing Procedure, drop a ResearchSubject
+    patient_lines = (meta_path / 'Patient.ndjson').read_text().splitlines(keepends=True)
+    (meta_path / 'Patient.ndjson').write_text(''.join(patient_lines + patient_lines[:1]))
+    specimen_lines = (meta_path / 'Specimen.ndjson').read_text().splitlines(keepends=True)
+    specimen = orjson.loads(specimen_lines[0])
+    specimen['collection']['procedure']['reference'] = 'Procedure/00000000-0000-0000-0000-000000000000'
+    (meta_path / 'Specimen.ndjson').write_text(''.join([orjson.dumps(specimen).decode() + '\n'] + specimen_lines[1:]))
+    research_subject_lines = (meta_path / 'ResearchSubject.ndjson').read_text().splitlines(keepends=True)
+    (meta_path / 'ResearchSubject.ndjson').write_text(''.join(research_subject_lines[1:]))
+
+    problems = list(check_integrity(meta_path))
+    kinds = sorted(_.kind for _ in problems)
+    assert kinds == ['dangling', 'duplicate', 'orphan', 'orphan'], problems
+    dangling = next(_ for _ in problems if _.kind == 'dangling')
+    assert (dangling.path.name, dangling.line_number) == ('Specimen.ndjson', 1)
+    orphans = sorted(_.message for _ in problems if _.kind == 'orphan')
+    assert orphans[0].startswith('Patient/') and orphans[1].startswith('Procedure/'), orphans
@@ -0,0 +1,23 @@
+import pandas
+
+
+def test_patient_chunks():
+    """Chunks should be contiguous and never split a patient."""
+    from ucl_stavrinides.parallel import patient_chunks
+
+    ids = pandas.Series(['1_0_A', '1_0_B', '2_0_A', '3_0_A', '2_1_A', '4_0_A', '4_0_B', '5_0_A'])
+    chunks = patient_chunks(ids, chunk_size=1)
+    assert chunks == [(0, 2), (2, 5), (5, 7), (7, 8)], "patient 2 should be in a single chunk"
+    assert patient_chunks(ids, chunk_size=4) == [(0, 5), (5, 8)], "should combine patients up to chunk_size"
+    assert patient_chunks(ids, chunk_size=100) == [(0, 8)], "should have a single chunk"
+
+
+def test_transform_parallel(test_fixture_paths, compare_engines):
+    """A parallel run should emit the same ndjson as a serial run."""
+    from ucl_stavrinides.parallel import transform_csv_parallel
+
+    outputs = compare_engines(test_fixture_paths[0], {'parallel': lambda *_: transform_csv_parallel(*_, workers=2, chunk_size=10)})
+    results = outputs['parallel'].results
+    assert results.parsed_count == 160, "should have parsed all rows"
+    assert results.emitted_count == 7107, "should have emitted all resources once"
+    assert [_.name for _ in outputs['parallel'].path.iterdir() if _.is_dir()] == [], "should remove the chunks"
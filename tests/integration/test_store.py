@@ -0,0 +1,59 @@
+import csv
+
+from g3t_etl.factory import transform_csv
+from g3t_etl.loader import load_plugins
+
+
+def test_load_meta(test_fixture_paths, plugins, tmp_path):
+    """The database should answer the usual questions, and re-load only the changed files."""
+    from ucl_stavrinides.store import load_meta, query, resolve
+    from ucl_stavrinides.submission import Submission
+
+    load_plugins(plugins)
+    output_path = tmp_path / 'META'
+    output_path.mkdir()
+    transform_csv(test_fixture_paths[0], output_path)
+    database_path = tmp_path / 'meta.sqlite'
+
+    results = load_meta(output_path, database_path)
+    file_count = len(list(output_path.glob('*.ndjson')))
+    assert (results.loaded_count, results.skipped_count) == (file_count, 0)
+    line_count = sum(len(_.read_text().splitlines()) for _ in output_path.glob('*.ndjson'))
+    assert results.resource_count == line_count
+
+    with open(test_fixture_paths[0]) as fp:
+        rows = list(csv.DictReader(fp))
+
+    # one row per Specimen, one column per Submission field
+    columns, specimens = query('SELECT * FROM specimen_fields', database_path=database_path)
+    assert columns[2:] == list(Submission.model_fields), "should have a column per Submission field"
+    assert len(specimens) == len(rows)
+    _, specimens = query('SELECT id FROM specimen_fields WHERE pirads >= 4 AND likert >= 4', database_path=database_path)
+    expected = [_['id'] for _ in rows if all(_[field] not in ('', 'nan') and float(_[field]) >= 4 for field in ['pirads', 'likert'])]
+    assert expected and sorted(_[0] for _ in specimens) == sorted(expected)
+    # the Condition's fields are the patient's, one of the values of the patient's rows
+    _, gleasons = query('SELECT id, gleason FROM specimen_fields', database_path=database_path)
+    for id_, gleason in gleasons:
+        assert gleason in {_['gleason'] for _ in rows if _['id'].split('_', 1)[0] == id_.split('_', 1)[0]}, id_
+    _, ages = query('SELECT id, ageDiagM FROM specimen_fields', database_path=database_path)
+    assert dict(ages)[rows[0]['id']] == float(rows[0]['ageDiagM'])
+
+    # identifier lookup, and the Observations focused on the Specimen
+    specimen_ids = resolve(rows[0]['id'], 'Specimen', database_path=database_path)
+    assert len(specimen_ids) == 1
+    _, codes = query('SELECT code FROM observations WHERE focus_id = ?', (specimen_ids[0],), database_path=database_path)
+    assert 'pirads' in {_[0] for _ in codes}
+
+    results = load_meta(output_path, database_path)
+    assert (results.loaded_count, results.skipped_count, results.resource_count) == (0, file_count, 0), "should skip unchanged files"
+
+    # change a file, remove another
+    research_subject_path = output_path / 'ResearchSubject.ndjson'
+    research_subject_lines = research_subject_path.read_text().splitlines(keepends=True)
+    research_subject_path.write_text(''.join(research_subject_lines[1:]))
+    (output_path / 'ResearchStudy.ndjson').unlink()
+    results = load_meta(output_path, database_path)
+    assert (results.loaded_count, results.removed_count, results.resource_count) == (1, 1, len(research_subject_lines) - 1)
+    _, counts = query('SELECT resource_type, COUNT(*) FROM resources GROUP BY resource_type', database_path=database_path)
+    counts = dict(counts)
+    assert 'ResearchStudy' not in counts and counts['ResearchSubject'] == len(research_subject_lines) - 1
@@ -0,0 +1,84 @@
+from g3t_etl.loader import load_plugins
+
+
+def test_iter_records(tmp_path):
+    """Rows should be coerced like pandas.read_csv."""
+    from ucl_stavrinides.streaming import iter_records
+
+    input_path = tmp_path / 'input.csv'
+    input_path.write_text("# a comment\nid,ageDiagM,ppsa,focality,best,zone\n\n123_0_A, 558.0,9.75,focal ,nan,PZ\n124_0_A,1,1,focal,,SV\n")
+    records = list(iter_records(input_path, exclude_zones=True))
+    assert records == [{'id': '123_0_A', 'ageDiagM': 558, 'ppsa': 9.75, 'focality': 'focal', 'best': None, 'zone': 'PZ'}], "should exclude the SV row"
+    assert len(list(iter_records(input_path))) == 2, "should only exclude on request"
+
+
+def test_transform_streaming(test_fixture_paths, compare_engines, tmp_path):
+    """Streaming should emit the same ndjson as transform_csv, and skip repeated rows."""
+    from ucl_stavrinides.streaming import transform_csv_streaming
+
+    lines = test_fixture_paths[0].read_text().splitlines()
+    # repeat a row of the first patient after the second patient
+    input_path = tmp_path / 'input.csv'
+    input_path.write_text('\n'.join(lines[:12] + lines[2:3]) + '\n')
+
+    outputs = compare_engines(input_path, {'streaming': transform_csv_streaming})
+    assert outputs['streaming'].results.parsed_count == 12, "should have parsed all rows"
+
+
+def test_seen_resources(test_fixture_paths, plugins):
+    """The resources kept to de-duplicate should grow with the patients and Specimens, not with the resources."""
+    from ucl_stavrinides.columnar import create_research_study
+    from ucl_stavrinides.streaming import SeenResources, iter_records, iter_resources
+
+    load_plugins(plugins)
+    records = list(iter_records(test_fixture_paths[0]))
+    for trusted in [False, True]:
+        seen = SeenResources()
+        resources = list(iter_resources(iter(records + records), create_research_study(), trusted=trusted, seen=seen))
+        specimens = [_ for _ in resources if (_['resourceType'] if trusted else _.resource_type) == 'Specimen']
+        procedures = [_ for _ in resources if (_['resourceType'] if trusted else _.resource_type) == 'Procedure']
+        patients = [_ for _ in resources if (_['resourceType'] if trusted else _.resource_type) == 'Patient']
+        assert len(specimens) == len(records), "should skip the repeated rows"
+        assert len(seen.ids) == len(specimens) + len(procedures)
+        assert len(seen.patients) == len(patients)
+        assert len(seen) * 10 < len(resources), "should not keep the observations"
+
+
+def test_transform_streaming_sharded(test_fixture_paths, compare_engines):
+    """Sharded, compressed output should hold the same lines as transform_csv."""
+    from ucl_stavrinides.streaming import transform_csv_streaming
+
+    outputs = compare_engines(test_fixture_paths[0],
+                              {'sharded': lambda *_: transform_csv_streaming(*_, trusted=True, shard_lines=1000, compress=True)})
+    assert len(list(outputs['sharded'].path.glob('Observation.*.ndjson.gz'))) > 1, "should shard the observations"
+
+
+def test_transform_streaming_shared_procedure(test_fixture_paths, compare_engines, tmp_path):
+    """Rows of different Specimens sharing a row level resource should emit it once, as transform_csv does."""
+    from ucl_stavrinides.streaming import transform_csv_streaming
+
+    lines = test_fixture_paths[0].read_text().splitlines()
+    # 123_00_B is another Specimen of the 123_0_B biopsy Procedure
+    assert lines[2].startswith('123_0_B,')
+    input_path = tmp_path / 'input.csv'
+    input_path.write_text('\n'.join(lines[:3] + ['123_00_B' + lines[2][len('123_0_B'):]]) + '\n')
+
+    outputs = compare_engines(input_path, {'streaming': transform_csv_streaming,
+                                           'trusted': lambda *_: transform_csv_streaming(*_, trusted=True, validation_rate=1.0)})
+    assert outputs['expected'].ndjson['Procedure.ndjson'].count('\n') == 2, "should write the shared Procedure once"
+
+
+def test_transform_streaming_sample_errors(test_fixture_paths, plugins, tmp_path, monkeypatch):
+    """A sampled resource that fails validation should be reported in transformer_errors, and not written."""
+    import ucl_stavrinides.streaming
+    from ucl_stavrinides.streaming import transform_csv_streaming
+
+    load_plugins(plugins)
+    dumps = ucl_stavrinides.streaming.dumps
+    # a Specimen rendered with a drifted element
+    monkeypatch.setattr(ucl_stavrinides.streaming, 'dumps',
+                        lambda resource: dumps({**resource, 'status': 'drifted'} if resource['resourceType'] == 'Specimen' else resource))
+    results = transform_csv_streaming(test_fixture_paths[0], tmp_path, trusted=True, validation_rate=1.0)
+    assert len(results.transformer_errors) == 160, "should report every Specimen"
+    assert 'Specimen/' in results.transformer_errors[0].title
+    assert not (tmp_path / 'Specimen.ndjson').exists()
@@ -3,6 +3,8 @@ import pathlib
 from g3t_etl.factory import transform_csv
 from g3t_etl.loader import load_plugins
 
+from tests.conftest import read_ndjson
+
 
 def test_transform_dummy_data(test_fixture_paths, plugins):
     """Transform the dummy data to FHIR, store in test fixture."""
@@ -33,3 +35,119 @@ def test_transform_dummy_data(test_fixture_paths, plugins):
     print(f"emitted {emitted_count} resources out of {parsed_count} input resources")
     assert len(validation_errors) == 0, f"validation_errors errors {transformer_errors}"
     assert len(transformer_errors) == 0, f"transformer_errors errors {transformer_errors}"
+
+
+def test_transform_group_by_patient(test_fixture_paths, plugins, tmp_path):
+    """Building the shared resources once per patient should not change the output."""
+    from ucl_stavrinides.transformer import SimpleTransformer
+
+    load_plugins(plugins)
+    input_path = test_fixture_paths[0]
+    outputs = {}
+    try:
+        for group_by_patient in [False, True]:
+            SimpleTransformer.group_by_patient = group_by_patient
+            output_path = tmp_path / str(group_by_patient)
+            output_path.mkdir()
+            results = transform_csv(input_path, output_path)
+            assert results.parsed_count == 160, "should have parsed all rows"
+            outputs[group_by_patient] = read_ndjson(output_path)
+    finally:
+        SimpleTransformer.group_by_patient = True
+
+    assert outputs[True] == outputs[False], "grouping by patient should emit identical ndjson"
+    assert outputs[True]['Patient.ndjson'].count('\n') == 30, "should have one Patient per patient"
+
+
+def test_transform_observation_templates(test_fixture_paths, plugins, tmp_path):
+    """Creating observations from the compiled templates should not change the output."""
+    from ucl_stavrinides.transformer import SimpleTransformer
+
+    load_plugins(plugins)
+    input_path = test_fixture_paths[0]
+    outputs = {}
+    try:
+        for use_observation_templates in [False, True]:
+            SimpleTransformer.use_observation_templates = use_observation_templates
+            output_path = tmp_path / str(use_observation_templates)
+            output_path.mkdir()
+            transform_csv(input_path, output_path)
+            outputs[use_observation_templates] = read_ndjson(output_path)
+    finally:
+        SimpleTransformer.use_observation_templates = True
+
+    assert outputs[True] == outputs[False], "observation templates should emit identical ndjson"
+
+
+def test_transform_instrumentation(test_fixture_paths, plugins, tmp_path):
+    """Instrumentation should time each stage, and count the resources emitted by each row."""
+    from ucl_stavrinides.transformer import SimpleTransformer
+
+    load_plugins(plugins)
+    instrumentation = SimpleTransformer.instrumentation
+    instrumentation.enable()
+    try:
+        results = transform_csv(test_fixture_paths[0], tmp_path)
+    finally:
+        instrumentation.disable()
+    try:
+        assert instrumentation.row_count == results.parsed_count
+        assert instrumentation.stage_counts['Patient'] == 30, "should build a Patient once per patient"
+        assert instrumentation.stage_counts['Specimen'] == 160, "should build a Specimen per row"
+        assert sum(instrumentation.resource_counts.values()) == results.emitted_count - 1, "all but the ResearchStudy"
+    finally:
+        instrumentation.reset()
+
+
+def test_transform_identifier_cache(test_fixture_paths, plugins, tmp_path):
+    """Reusing identifiers, ids and references across rows should not change the output, even when evicted."""
+    from ucl_stavrinides.transformer import IdentifierCache, SimpleTransformer
+
+    load_plugins(plugins)
+    input_path = test_fixture_paths[0]
+    identifiers = SimpleTransformer.identifiers
+    caches = {'default': IdentifierCache(), 'small': IdentifierCache(maxsize=4)}
+    outputs = {}
+    try:
+        for name, cache in caches.items():
+            SimpleTransformer.identifiers = cache
+            output_path = tmp_path / name
+            output_path.mkdir()
+            transform_csv(input_path, output_path)
+            outputs[name] = read_ndjson(output_path)
+    finally:
+        SimpleTransformer.identifiers = identifiers
+
+    assert outputs['default'] == outputs['small'], "cached identifiers should emit identical ndjson"
+    assert caches['default'].hits > 0, "rows of a patient should share the Patient's reference"
+    assert caches['default'].evictions == 0
+    assert caches['small'].evictions > 0
+    assert len(caches['small']) <= 8, "should be bounded"
+
+
+def test_transform_excluded_zone(test_fixture_paths, compare_engines, tmp_path):
+    """Every engine should transform the SV rows, as g3t_etl does, and leave them all out with exclude_zones."""
+    from ucl_stavrinides.columnar import transform_csv_columnar
+    from ucl_stavrinides.incremental import transform_csv_incremental
+    from ucl_stavrinides.parallel import transform_csv_parallel
+    from ucl_stavrinides.streaming import transform_csv_streaming
+
+    lines = test_fixture_paths[0].read_text().splitlines()[:12]
+    header, row = lines[0], lines[1].split(',')
+    row[header.split(',').index('zone')] = 'SV'
+    input_path = tmp_path / 'excluded.csv'
+    input_path.write_text('\n'.join([header, ','.join(row)] + lines[2:]) + '\n')
+    included_path = tmp_path / 'included.csv'
+    included_path.write_text('\n'.join([header] + lines[2:]) + '\n')
+
+    engines = {
+        'columnar': transform_csv_columnar,
+        'parallel': lambda *_, **kwargs: transform_csv_parallel(*_, workers=2, chunk_size=3, **kwargs),
+        'streaming': transform_csv_streaming,
+        'trusted': lambda *_, **kwargs: transform_csv_streaming(*_, trusted=True, **kwargs),
+        'incremental': lambda *_, **kwargs: transform_csv_incremental(*_, state_path=_[1] / 'state', **kwargs),
+    }
+    outputs = compare_engines(input_path, engines)
+    assert outputs['expected'].ndjson['Specimen.ndjson'].count('\n') == 11, "should transform the SV row"
+    compare_engines(input_path, {name: lambda *_, transform=transform: transform(*_, exclude_zones=True) for name, transform in engines.items()},
+                    expected_input_path=included_path)
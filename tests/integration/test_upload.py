@@ -0,0 +1,94 @@
+import asyncio
+import socket
+
+import orjson
+import pytest
+from aiohttp import web
+
+
+class FHIRServer:
+    """A local stand-in for the FHIR server, records the resources of each transaction Bundle."""
+
+    def __init__(self, fail: dict = None) -> None:
+        self.fail = fail or {}
+        """Status to answer, by request number."""
+        self.request_count = 0
+        self.resources = {}
+        self.types = []
+        """Resource type of each accepted Bundle, in order."""
+
+    async def transaction(self, request: web.Request) -> web.Response:
+        self.request_count += 1
+        if self.request_count in self.fail:
+            return web.Response(status=self.fail[self.request_count], text='unavailable')
+        bundle = orjson.loads(await request.read())
+        assert bundle['type'] == 'transaction'
+        for entry in bundle['entry']:
+            resource = entry['resource']
+            assert entry['request'] == {'method': 'PUT', 'url': f"{resource['resourceType']}/{resource['id']}"}
+            self.resources[entry['request']['url']] = resource
+        self.types.append(bundle['entry'][0]['resource']['resourceType'])
+        return web.json_response({'resourceType': 'Bundle', 'type': 'transaction-response'})
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def run_upload(server: FHIRServer, meta_path, port: int = None, **kwargs):
+    """Serve on a local port, upload meta_path to it; the checkpoint is kept per url, so reuse the port to resume."""
+    from ucl_stavrinides.upload import upload_async
+
+    port = port or free_port()
+
+    async def _run():
+        app = web.Application()
+        app.router.add_post('/fhir', server.transaction)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', port)
+        await site.start()
+        try:
+            return await upload_async(meta_path, f"http://127.0.0.1:{port}/fhir", backoff=0.01, **kwargs)
+        finally:
+            await runner.cleanup()
+
+    return asyncio.run(_run())
+
+
+def test_upload(meta_path, tmp_path):
+    """Resources should be uploaded in dependency order, failed batches retried."""
+    expected_count = sum(len(_.read_text().splitlines()) for _ in meta_path.glob('*.ndjson'))
+
+    server = FHIRServer(fail={1: 503, 3: 429})
+    results = run_upload(server, meta_path, batch_size=50, concurrency=4, checkpoint_path=tmp_path / 'checkpoint.json')
+    assert results.uploaded_count == expected_count == len(server.resources)
+    assert results.skipped_batch_count == 0
+    order = ['ResearchStudy', 'Patient', 'ResearchSubject', 'Specimen']
+    first = [server.types.index(_) for _ in order]
+    assert first == sorted(first), "should upload in dependency order"
+    assert server.types.index('Specimen') > max(i for i, _ in enumerate(server.types) if _ in ('Condition', 'Procedure'))
+
+
+def test_upload_resume(meta_path, tmp_path):
+    """An interrupted upload should resume with the batches not yet acknowledged."""
+    from ucl_stavrinides.upload import UploadError
+
+    checkpoint_path = tmp_path / 'checkpoint.json'
+    port = free_port()
+
+    server = FHIRServer(fail={5: 400})
+    with pytest.raises(UploadError, match=r': 400 '):
+        run_upload(server, meta_path, port=port, batch_size=10, concurrency=1, checkpoint_path=checkpoint_path)
+    assert len(server.types) == 4
+
+    results = run_upload(server, meta_path, port=port, batch_size=10, concurrency=1, checkpoint_path=checkpoint_path)
+    assert results.skipped_batch_count == 4, "should skip the acknowledged batches"
+    assert len(server.types) == 4 + results.batch_count
+    expected_count = sum(len(_.read_text().splitlines()) for _ in meta_path.glob('*.ndjson'))
+    assert len(server.resources) == expected_count
+
+    results = run_upload(server, meta_path, port=port, batch_size=10, concurrency=1, checkpoint_path=checkpoint_path)
+    assert results.batch_count == 0, "should have nothing left to upload"
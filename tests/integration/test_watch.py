@@ -0,0 +1,50 @@
+import shutil
+
+import pytest
+
+from tests.conftest import read_ndjson
+
+
+def test_watch_deliveries_once(test_fixture_paths, plugins, compare_engines, tmp_path):
+    """Each delivery should be transformed into its own directory, as a full transform would; transformed deliveries are skipped."""
+    from ucl_stavrinides.watch import watch_deliveries
+
+    input_path = tmp_path / 'raw'
+    input_path.mkdir()
+    for name in ['site-1.csv', 'site-2.csv']:
+        shutil.copy(test_fixture_paths[0], input_path / name)
+    (input_path / 'notes.txt').write_text('not a delivery')
+    output_path = tmp_path / 'META'
+    state_path = tmp_path / 'state' / 'watch.json'
+
+    deliveries = list(watch_deliveries(input_path, output_path, concurrency=2, once=True, state_path=state_path, plugins=plugins))
+    assert sorted(_.input_path.name for _ in deliveries) == ['site-1.csv', 'site-2.csv']
+    assert all(_.error is None and _.parsed_count == 160 and _.latency >= _.queued >= 0 for _ in deliveries), deliveries
+
+    # the deliveries are transformed in the worker processes, compare each to transform_csv
+    assert read_ndjson(output_path / 'site-1') == compare_engines(test_fixture_paths[0], {})['expected'].ndjson
+    assert sorted(_.name for _ in output_path.iterdir()) == ['site-1', 'site-2'], "should not leave temporary directories"
+
+    assert not list(watch_deliveries(input_path, output_path, once=True, state_path=state_path, plugins=plugins)), "should skip transformed deliveries"
+    (input_path / 'site-2.csv').write_text((input_path / 'site-2.csv').read_text() + '\n')
+    deliveries = list(watch_deliveries(input_path, output_path, once=True, state_path=state_path, plugins=plugins))
+    assert [_.input_path.name for _ in deliveries] == ['site-2.csv'], "should transform a changed delivery"
+
+
+@pytest.mark.parametrize('poll', [False, True])
+def test_watcher(tmp_path, poll):
+    """A file should be reported once written, or moved in; hidden files are ignored by watch_deliveries."""
+    from ucl_stavrinides.watch import watcher
+
+    watcher_ = watcher(tmp_path, poll=poll, poll_interval=0.05)
+    try:
+        assert not watcher_.changes(0.1)
+        (tmp_path / 'site-1.csv').write_text('id\n')
+        (tmp_path / '.partial').write_text('id\n')
+        (tmp_path / '.partial').rename(tmp_path / 'site-2.csv')
+        changes = set()
+        for _ in range(10):
+            changes.update(_.name for _ in watcher_.changes(0.1) if not _.name.startswith('.'))
+        assert changes == {'site-1.csv', 'site-2.csv'}
+    finally:
+        watcher_.close()
@@ -0,0 +1,33 @@
+def test_parse_gleason():
+    """Gleason strings should be split into their primary and secondary patterns, 0 if they do not parse."""
+    from ucl_stavrinides.categories import parse_gleason
+
+    primary, secondary = parse_gleason(['3+4', 'no', None, ' 5 + 4', '6+1'])
+    assert primary.tolist() == [3, 0, 0, 5, 0]
+    assert secondary.tolist() == [4, 0, 0, 4, 0]
+
+
+def test_intern():
+    """Each distinct value should be rendered once, and shared by every row."""
+    from fhir.resources.observation import Observation
+
+    from ucl_stavrinides.categories import category, intern
+    from ucl_stavrinides.templates import compiled_observation_templates
+
+    categories = intern('gleason', ['3+4', 'no', None, '3+4'])
+    assert categories[0] is categories[3], "should be interned"
+    assert categories[2] is None
+    assert categories[0] is category('gleason', '3+4')
+    assert categories[0].concept_json['text'] == '3+4'
+    assert [_['valueCodeableConcept']['text'] for _ in categories[0].components_json] == ['3', '4']
+    assert categories[1].components is None, "no is not a Gleason score"
+
+    zone = category('zone', 'PZ')
+    assert [_.system for _ in zone.concept.coding] == ['https://aced-idp.org/test-stavrinides', 'http://snomed.info/sct']
+    assert category('zone', 'XZ').concept_json['coding'][0]['display'] == 'XZ', "an unknown value should be coded as is"
+
+    template = next(_ for _ in compiled_observation_templates('Condition') if _.field == 'gleason')
+    assert template.value_type == 'valueCodeableConcept'
+    observation = template.observation.copy(update={'valueCodeableConcept': categories[0].concept, 'component': categories[0].components,
+                                                    'subject': {'reference': 'Patient/1'}})
+    assert Observation.parse_raw(observation.json()).component[1].valueCodeableConcept.text == '4'
@@ -0,0 +1,48 @@
+import subprocess
+import sys
+
+PLUGIN_BUDGET_US = 25_000
+"""Microseconds the plugin may add to `g3t_etl` startup, it took ~80ms while it imported the models eagerly."""
+
+CLI_BUDGET_US = 150_000
+"""Microseconds `python -m ucl_stavrinides.cli --help` may spend importing."""
+
+HEAVY_MODULES = ['fhir.resources.specimen', 'fhir.resources.patient', 'ucl_stavrinides.submission', 'ucl_stavrinides.simple_transformer']
+
+
+def import_times(code: str) -> tuple[dict[str, int], list[str]]:
+    """Cumulative import time in microseconds of the top level modules imported by code, and code's stdout lines."""
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True, check=True)
+    times = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not name.startswith('  '):
+            times[name.strip()] = int(cumulative)
+    return times, completed.stdout.split()
+
+
+def test_plugin_import_time():
+    """Loading the plugin should not import the models, nor regress g3t_etl's startup."""
+    code = ("import sys; import g3t_etl.factory; import ucl_stavrinides.transformer as plugin; plugin.register(); "
+            f"print(*[_ for _ in {HEAVY_MODULES!r} if _ in sys.modules], sep='\\n')")
+    best = None
+    for _ in range(3):
+        times, loaded = import_times(code)
+        assert not loaded, f"register() should not import {loaded}"
+        elapsed = times['ucl_stavrinides.transformer'] + times.get('ucl_stavrinides', 0)
+        best = elapsed if best is None else min(best, elapsed)
+    assert best < PLUGIN_BUDGET_US, f"importing the plugin took {best}us, budget {PLUGIN_BUDGET_US}us"
+
+
+def test_cli_import_time():
+    """The cli should only import g3t_etl and the models when a command needs them."""
+    code = f"import sys; import ucl_stavrinides.cli; print(*[_ for _ in {HEAVY_MODULES + ['g3t_etl']!r} if _ in sys.modules], sep='\\n')"
+    best = None
+    for _ in range(3):
+        times, loaded = import_times(code)
+        assert not loaded, f"importing the cli should not import {loaded}"
+        elapsed = sum(times.values())
+        best = elapsed if best is None else min(best, elapsed)
+    assert best < CLI_BUDGET_US, f"importing the cli took {best}us, budget {CLI_BUDGET_US}us"
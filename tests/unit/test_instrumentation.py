@@ -0,0 +1,36 @@
+from collections import namedtuple
+
+
+def test_instrumentation_disabled():
+    """A disabled instrumentation should not measure anything."""
+    from ucl_stavrinides.instrumentation import Instrumentation
+
+    instrumentation = Instrumentation()
+    assert instrumentation.stage('Patient') is instrumentation.row('123_0_A'), "should share a no-op context"
+    with instrumentation.row('123_0_A') as resources:
+        assert resources is None
+        with instrumentation.stage('Patient'):
+            pass
+    assert instrumentation.row_count == 0
+    assert not instrumentation.stage_seconds
+
+
+def test_instrumentation_summary():
+    """Stages, resources and the slowest rows should be summarized."""
+    from ucl_stavrinides.instrumentation import Instrumentation
+
+    Resource = namedtuple('Resource', ['resource_type'])
+    instrumentation = Instrumentation(enabled=True, profile_every=2, slowest_rows=2)
+    for id_ in ['123_0_A', '123_0_B', '124_0_A']:
+        with instrumentation.row(id_) as resources:
+            with instrumentation.stage('Specimen'):
+                resources.append(Resource('Specimen'))
+            with instrumentation.stage('Observation(Specimen)'):
+                resources.extend([Resource('Observation')] * 2)
+    assert instrumentation.row_count == 3
+    assert instrumentation.stage_counts == {'Specimen': 3, 'Observation(Specimen)': 3}
+    assert instrumentation.resource_counts == {'Specimen': 3, 'Observation': 6}
+    assert len(instrumentation.slowest()) == 2, "should keep the slowest rows"
+    summary = instrumentation.summary()
+    for expected in ['rows: 3', 'Specimen:', 'Observation: 6', 'slowest rows:', 'function calls']:
+        assert expected in summary, f"summary should contain {expected}"
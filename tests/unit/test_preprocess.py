@@ -0,0 +1,23 @@
+import io
+
+import numpy as np
+import pandas
+
+
+def test_preprocess():
+    """Each rule should clean its cells, and count the rows it dropped or changed."""
+    from ucl_stavrinides.preprocess import preprocess, records
+
+    csv = ("id,ageDiagM,ppsa,focality,zone,best\n"
+           "123_0_A,558.0,9.75,focal ,PZ,nan\n"
+           "123_0_B,558.0, 9.5 ,nan ,sv ,\n"
+           "124_0_A,600.0,x,multifocal,TZ,1\n")
+    df = pandas.read_csv(io.StringIO(csv), skipinitialspace=True, skip_blank_lines=True, comment="#")
+    assert preprocess(df).df['id'].tolist() == ['123_0_A', '123_0_B', '124_0_A'], "should only exclude on request"
+    results = preprocess(df, exclude_zones=True)
+    assert results.row_counts == {'whitespace': 2, 'null': 1, 'excluded': 1, 'coerced': 2}
+    assert results.df['id'].tolist() == ['123_0_A', '124_0_A'], "should exclude the SV row"
+    assert results.df['focality'].tolist() == ['focal', 'multifocal']
+    assert results.df['ppsa'].tolist() == [9.75, 'x'], "should keep the value that does not parse, for pydantic"
+    assert records(results.df)[0] == {'id': '123_0_A', 'ageDiagM': 558.0, 'ppsa': 9.75, 'focality': 'focal', 'zone': 'PZ', 'best': None}
+    assert np.isnan(df['best'][0]), "should not modify the input"
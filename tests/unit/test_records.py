@@ -0,0 +1,38 @@
+import pathlib
+
+import pytest
+
+
+def test_submission_record_is_current():
+    """The generated record should match the schema and the pydantic Submission."""
+    from ucl_stavrinides.codegen import SCHEMA_PATH, generate_record_module
+    from ucl_stavrinides.submission import Submission
+    from ucl_stavrinides.submission_record import COLUMNS, FIELDS, TYPES, SubmissionRecord
+    from ucl_stavrinides.templates import python_type
+
+    assert generate_record_module(SCHEMA_PATH.read_bytes()) == pathlib.Path('ucl_stavrinides/submission_record.py').read_text(), \
+        "run `python -m ucl_stavrinides.cli codegen`"
+    assert FIELDS == tuple(Submission.model_fields)
+    assert COLUMNS == tuple(_.alias or field for field, _ in Submission.model_fields.items())
+    assert TYPES == tuple(python_type(_) for _ in Submission.model_fields.values())
+    assert not hasattr(SubmissionRecord(), '__dict__'), "should only have slots"
+
+
+def test_from_record():
+    """Values should be coerced like pydantic, a value that does not fit should raise a RecordError."""
+    from ucl_stavrinides.records import RecordError
+    from ucl_stavrinides.submission import Submission
+    from ucl_stavrinides.submission_record import SubmissionRecord
+
+    record = {'id': '123_0_A', 'ageDiagM': 558.0, 'ppsa': 9, 'months.diag': 51, 'focality': 'focal', 'unknown': 1}
+    row = SubmissionRecord.from_record(record)
+    assert row.as_dict() == Submission(**record).model_dump()
+    assert type(row.ageDiagM) is int and type(row.ppsa) is float
+    assert row.months_diag == 51
+    assert row.present_fields == {'id', 'ageDiagM', 'ppsa', 'months_diag', 'focality'}
+    assert row.deconstructed_id.patient_id == '123'
+    assert row == SubmissionRecord.from_record(record)
+
+    for value in [558.5, 'x']:
+        with pytest.raises(RecordError):
+            SubmissionRecord.from_record({**record, 'ageDiagM': value})
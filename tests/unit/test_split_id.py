@@ -0,0 +1,29 @@
+import pytest
+
+
+@pytest.fixture
+def ids() -> list[str]:
+    """A patient's ids, as they appear in the dummy data."""
+    return ['123_0_A', '123_0_B', '123_1_A_A', '123_1_A_B', '123_2_B_A', '123_2_B_B']
+
+
+def test_split_id():
+    """Ids should be split into their components."""
+    from ucl_stavrinides.transformer import DeconstructedID, ParsedID, split_id
+
+    assert split_id('123_0_A_B') == ParsedID(patient_id='123', mri_area=0, time_points=('A', 'B'), tissue_block=None)
+    assert split_id('123_1_A1_A2_3') == ParsedID(patient_id='123', mri_area=1, time_points=('A1', 'A2'), tissue_block=3), "should parse cluster codes"
+    assert split_id('123') is None, "should not match"
+    _ = split_id('123_0_A_B', validate=True)
+    assert isinstance(_, DeconstructedID), "should validate on request"
+    assert _.time_points == ['A', 'B']
+
+
+def test_split_id_cache(ids):
+    """Parsed ids should be cached, see tests/benchmarks for the time saved per row."""
+    from ucl_stavrinides.transformer import parse_id, split_id
+
+    parse_id.cache_clear()
+    first = [split_id(_) for _ in ids]
+    assert [split_id(_) for _ in ids] == first
+    assert parse_id.cache_info().hits == len(ids), "should have used the cache"
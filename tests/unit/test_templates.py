@@ -0,0 +1,48 @@
+def test_present_templates():
+    """Only the fields set in a row should be visited, in template order."""
+    from ucl_stavrinides.templates import compiled_observation_templates, present_fields, present_templates, presence
+
+    fields = present_fields({'best': None, 'precise': 0, 'focality': '', 'ppsa': 9.75, 'align': 'Y', 'bestVol': 1.5})
+    assert fields == {'ppsa', 'align', 'bestVol'}
+    for focus in ['Specimen', 'Condition']:
+        expected = [_ for _ in compiled_observation_templates(focus) if _.field in fields]
+        assert present_templates(focus, fields) == expected
+
+    templates = compiled_observation_templates('Specimen')[:2]
+    columns = {templates[0].field: [None, 1.5, 0], templates[1].field: ['x', None, '']}
+    assert presence(columns, templates, 3).tolist() == [[False, True], [True, False], [False, False]]
+
+
+def test_load_compiled_templates(tmp_path):
+    """Compiled templates should be saved once, then loaded; a stale cache should be rebuilt."""
+    import pickle
+
+    from g3t_etl.factory import template_condition
+    from ucl_stavrinides.templates import COMPILED_TEMPLATES, compiled_condition, load_compiled_templates
+
+    cache_path = tmp_path / 'templates.pickle'
+    assert not load_compiled_templates(cache_path), "should compile on first use"
+    expected = {focus: [_.prototype for _ in templates] for focus, templates in COMPILED_TEMPLATES.items()}
+    assert load_compiled_templates(cache_path), "should load the cache"
+    assert {focus: [_.prototype for _ in templates] for focus, templates in COMPILED_TEMPLATES.items()} == expected
+
+    cache = pickle.loads(cache_path.read_bytes())
+    cache['key'] = 'stale'
+    cache_path.write_bytes(pickle.dumps(cache))
+    assert not load_compiled_templates(cache_path), "should rebuild a stale cache"
+
+    subject = {'reference': 'Patient/123'}
+    condition = compiled_condition(subject)
+    assert condition.json() == template_condition(subject=subject).json()
+    assert compiled_condition(subject) is not condition, "should be a copy"
+
+
+def test_sources_hash(monkeypatch):
+    """A g3t_etl upgrade should invalidate the compiled templates, it mints their ids."""
+    import ucl_stavrinides.templates
+    from ucl_stavrinides.templates import library_version, sources_hash
+
+    key = sources_hash()
+    assert library_version('g3t_etl')
+    monkeypatch.setattr(ucl_stavrinides.templates, 'library_version', lambda library: library_version(library) + '.post1')
+    assert sources_hash() != key
@@ -0,0 +1,52 @@
+import gzip
+
+import pytest
+
+
+def test_sharded_writers(tmp_path):
+    """Lines should be split into numbered shards, in order, by line count and by size."""
+    from ucl_stavrinides.writers import ShardedNdjsonWriters, open_ndjson
+
+    lines = [f'{{"id": "{_:04d}"}}' for _ in range(25)]
+    (tmp_path / 'lines').mkdir()
+    with ShardedNdjsonWriters(tmp_path / 'lines', shard_lines=10, batch_size=3, queue_size=2) as writers:
+        for line in lines:
+            writers.write('Observation', line)
+        writers.write('Patient', lines[0])
+    assert [_.name for _ in writers.shards['Observation']] == [f"Observation.00{_}.ndjson.gz" for _ in range(3)]
+    assert writers.counts == {'Observation': 25, 'Patient': 1}
+    shards = [open_ndjson(_).read().splitlines() for _ in writers.shards['Observation']]
+    assert [len(_) for _ in shards] == [10, 10, 5]
+    assert sum(shards, []) == lines, "should keep the order of the lines"
+
+    (tmp_path / 'bytes').mkdir()
+    with ShardedNdjsonWriters(tmp_path / 'bytes', shard_bytes=50, compress=False, batch_size=4) as writers:
+        for line in lines:
+            writers.write('Observation', line)
+    assert not any(_.name.endswith('.gz') for _ in writers.shards['Observation'])
+    shards = [_.read_text().splitlines() for _ in writers.shards['Observation']]
+    assert [len(_) for _ in shards] == [4] * 6 + [1], "should start a new shard once 50 bytes are written"
+    assert sum(shards, []) == lines
+
+    (tmp_path / 'utf-8').mkdir()
+    with ShardedNdjsonWriters(tmp_path / 'utf-8', shard_bytes=50, compress=False) as writers:
+        for _ in range(4):
+            writers.write('Patient', '{"name": "éééééééé"}')
+    assert [len(_.read_text().splitlines()) for _ in writers.shards['Patient']] == [2, 2], \
+        "should count the encoded bytes, not the characters"
+
+    (tmp_path / 'single').mkdir()
+    with ShardedNdjsonWriters(tmp_path / 'single') as writers:
+        writers.write('Patient', lines[0])
+    assert gzip.decompress((tmp_path / 'single' / 'Patient.ndjson.gz').read_bytes()).decode() == lines[0] + '\n'
+
+
+def test_sharded_writers_error(tmp_path):
+    """An error in the writer thread should be raised in the transforming thread."""
+    from ucl_stavrinides.writers import ShardedNdjsonWriters
+
+    writers = ShardedNdjsonWriters(tmp_path / 'missing', batch_size=1, queue_size=1)
+    with pytest.raises(FileNotFoundError):
+        for _ in range(100):
+            writers.write('Patient', '{}')
+        writers.close()
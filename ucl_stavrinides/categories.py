@@ -0,0 +1,109 @@
+"""Interned CodeableConcepts of the categorical Submission fields.
+
+Fields like gleason, side or zone take a handful of distinct values. Their Observations carry a valueCodeableConcept
+in place of a valueString, coded in the project's system (the csv value) and, where templates/categories.yaml has one,
+in a standard system such as SNOMED CT. The gleason Observation also carries its primary and secondary patterns as
+components. Each distinct value is rendered once, as a fhir.resources model and as json, and shared by every row.
+"""
+import functools
+import logging
+import pathlib
+from typing import Any, NamedTuple, Optional, Sequence
+
+import numpy as np
+import orjson
+import pandas
+import yaml
+from fhir.resources.codeableconcept import CodeableConcept
+from fhir.resources.observation import ObservationComponent
+
+from g3t_etl.factory import helper
+
+logger = logging.getLogger(__name__)
+
+CATEGORIES_PATH = pathlib.Path('templates/categories.yaml')
+
+GLEASON_FIELD = 'gleason'
+
+GLEASON_PATTERN = r'^\s*([1-5])\s*\+\s*([1-5])\s*$'
+"""primary+secondary, e.g. 3+4; any other value (e.g. no) has no components."""
+
+
+class Category(NamedTuple):
+    """A distinct value of a categorical field, rendered once."""
+    concept: CodeableConcept
+    components: Optional[list[ObservationComponent]]
+    concept_json: dict
+    components_json: Optional[list[dict]]
+
+
+CATEGORIES: dict[tuple[str, Any], Category] = {}
+"""Interned categories by (field, csv value)."""
+
+
+@functools.cache
+def load_categories(path: pathlib.Path = CATEGORIES_PATH) -> dict:
+    """The fields and gleason sections of templates/categories.yaml."""
+    if not pathlib.Path(path).exists():
+        logger.info(f"{path} not found, no field is categorical")
+        return {'fields': {}, 'gleason': {}}
+    with open(path) as fp:
+        return yaml.safe_load(fp)
+
+
+def categorical_fields() -> frozenset[str]:
+    """Names of the categorical fields."""
+    return frozenset(load_categories()['fields'])
+
+
+def parse_gleason(values: Sequence) -> tuple[np.ndarray, np.ndarray]:
+    """The primary and secondary patterns of Gleason strings, 0 if a value does not parse, in one vectorized pass."""
+    patterns = pandas.Series(values, dtype=object).str.extract(GLEASON_PATTERN)
+    patterns = patterns.apply(pandas.to_numeric).fillna(0).astype(np.int64)
+    return patterns[0].to_numpy(), patterns[1].to_numpy()
+
+
+def gleason_components(primary: int, secondary: int) -> Optional[list[ObservationComponent]]:
+    """The primary and secondary pattern components of a Gleason score, None unless both parsed."""
+    gleason = load_categories()['gleason']
+    if not primary or not secondary:
+        return None
+    return [
+        ObservationComponent(code={'coding': [gleason[part]]}, valueCodeableConcept={'coding': [gleason['patterns'][pattern]], 'text': str(pattern)})
+        for part, pattern in [('primary', primary), ('secondary', secondary)]
+    ]
+
+
+def _category(field: str, value: str, components: Optional[list[ObservationComponent]]) -> Category:
+    entry = load_categories()['fields'].get(field, {}).get(value, None) or {}
+    codings = [{'system': helper.system, 'code': value, 'display': entry.get('display', value)}]
+    if 'coding' in entry:
+        codings.append(entry['coding'])
+    concept = CodeableConcept(coding=codings, text=value)
+    return Category(
+        concept=concept,
+        components=components,
+        concept_json=orjson.loads(concept.json()),
+        components_json=[orjson.loads(_.json()) for _ in components] if components else None,
+    )
+
+
+def intern(field: str, values: Sequence) -> list[Optional[Category]]:
+    """The interned category of each value, None for missing values; new values are rendered in one batch."""
+    new_values = [_ for _ in pandas.unique(pandas.Series(values, dtype=object).dropna()) if (field, _) not in CATEGORIES]
+    if new_values:
+        if field == GLEASON_FIELD:
+            primaries, secondaries = parse_gleason(new_values)
+        else:
+            primaries = secondaries = [0] * len(new_values)
+        for value, primary, secondary in zip(new_values, primaries, secondaries):
+            CATEGORIES[(field, value)] = _category(field, value, gleason_components(int(primary), int(secondary)))
+    return [CATEGORIES.get((field, _), None) if _ is not None else None for _ in values]
+
+
+def category(field: str, value: str) -> Category:
+    """The interned category of a value."""
+    category_ = CATEGORIES.get((field, value), None)
+    if category_ is None:
+        category_ = intern(field, [value])[0]
+    return category_
@@ -0,0 +1,299 @@
+"""Command line for the ucl_stavrinides transformer, complements the g3t_etl cli.
+
+Usage: python -m ucl_stavrinides.cli --help
+"""
+import sys
+from pathlib import Path
+
+import click
+
+PLUGIN = 'ucl_stavrinides.transformer'
+
+
+@click.group()
+def cli():
+    """ucl_stavrinides ETL utilities."""
+
+
+@cli.command('transform')
+@click.argument('input_path', type=click.Path(exists=True, dir_okay=False),
+                default=None, required=True)
+@click.argument('output_path', type=click.Path(dir_okay=True), default='META', required=False)
+@click.option('--columnar', default=False, show_default=True, is_flag=True,
+              help='use the columnar engine, identical output, much faster')
+@click.option('--workers', default=1, show_default=True, type=click.IntRange(min=1),
+              help='number of processes, each transforms chunks of whole patients')
+@click.option('--stream', default=False, show_default=True, is_flag=True,
+              help='read and write one row at a time, memory grows with the patients and Specimens, not the resources')
+@click.option('--trusted', default=False, show_default=True, is_flag=True,
+              help='render resources as plain dicts, one row at a time, only validate a sample with fhir.resources')
+@click.option('--validation-rate', default=0.01, show_default=True, type=click.FloatRange(min=0, max=1),
+              help='with --trusted, fraction of the resources validated')
+@click.option('--shard-lines', default=None, type=click.IntRange(min=1),
+              help='with --stream or --trusted, start a new numbered shard of a resource type every N lines')
+@click.option('--shard-bytes', default=None, type=click.IntRange(min=1),
+              help='with --stream or --trusted, start a new numbered shard of a resource type every N uncompressed bytes')
+@click.option('--compress', default=False, show_default=True, is_flag=True,
+              help='with --stream or --trusted, gzip the ndjson (.ndjson.gz), written in a background thread')
+@click.option('--incremental', default=False, show_default=True, is_flag=True,
+              help='only re-transform patients whose rows changed since the last run, patch OUTPUT_PATH in place')
+@click.option('--exclude-zones', default=False, show_default=True, is_flag=True,
+              help='leave out the rows sampled from an excluded zone (SV), see docs/preprocessing_notes.md')
+@click.option('--profile', default=False, show_default=True, is_flag=True,
+              help='time each stage of each row, print a summary')
+@click.option('--profile-every', default=0, show_default=True, type=click.IntRange(min=0),
+              help='with --profile, also profile every Nth row')
+@click.option('--verbose', default=False, show_default=True, is_flag=True,
+              help='verbose output')
+def transform_csv_cli(input_path: str, output_path: str, columnar: bool, workers: int, stream: bool, trusted: bool,
+                      validation_rate: float, shard_lines: int, shard_bytes: int, compress: bool, incremental: bool,
+                      exclude_zones: bool, profile: bool, profile_every: int, verbose: bool):
+    """Transform csv based on data dictionary to FHIR.
+
+    \b
+    INPUT_PATH: where to read spreadsheet, or its extract (.parquet). required, (convention data/raw/XXXX.xlsx)
+    OUTPUT_PATH: where to write FHIR. default: META/
+    """
+    if (stream or trusted or incremental) and (columnar or workers > 1):
+        raise click.UsageError("--stream, --trusted and --incremental transform one row at a time, they can not be combined with --columnar or --workers")
+    if (shard_lines or shard_bytes or compress) and (columnar or workers > 1 or incremental):
+        raise click.UsageError("--shard-lines, --shard-bytes and --compress can only be combined with --stream or --trusted")
+
+    if (shard_lines or shard_bytes or compress or exclude_zones or Path(input_path).suffix == '.parquet') and not (columnar or workers > 1 or trusted or incremental):
+        # g3t_etl.factory.transform_csv only reads csv, transforms every row and writes whole files, the streaming engine's output is identical
+        stream = True
+
+    from g3t_etl.loader import load_plugins
+    load_plugins([PLUGIN])
+    Path(output_path).mkdir(parents=True, exist_ok=True)
+    if profile:
+        from ucl_stavrinides.simple_transformer import SimpleTransformer
+        SimpleTransformer.instrumentation.enable(profile_every=profile_every)
+    if incremental:
+        from ucl_stavrinides.incremental import transform_csv_incremental
+        transformation_results = transform_csv_incremental(input_path=Path(input_path), output_path=Path(output_path), verbose=verbose,
+                                                           trusted=trusted, exclude_zones=exclude_zones)
+    elif stream or trusted:
+        from ucl_stavrinides.streaming import transform_csv_streaming
+        transformation_results = transform_csv_streaming(input_path=Path(input_path), output_path=Path(output_path), verbose=verbose,
+                                                         trusted=trusted, validation_rate=validation_rate,
+                                                         shard_lines=shard_lines, shard_bytes=shard_bytes, compress=compress,
+                                                         exclude_zones=exclude_zones)
+    elif workers > 1:
+        from ucl_stavrinides.parallel import transform_csv_parallel
+        transformation_results = transform_csv_parallel(input_path=Path(input_path), output_path=Path(output_path),
+                                                        workers=workers, validate_columns=columnar, verbose=verbose,
+                                                        exclude_zones=exclude_zones)
+    elif columnar:
+        from ucl_stavrinides.columnar import transform_csv_columnar
+        transformation_results = transform_csv_columnar(input_path=Path(input_path), output_path=Path(output_path), verbose=verbose,
+                                                        exclude_zones=exclude_zones)
+    else:
+        from g3t_etl.factory import transform_csv
+        transformation_results = transform_csv(input_path=Path(input_path), output_path=Path(output_path), verbose=verbose)
+    if profile:
+        click.echo(SimpleTransformer.instrumentation.summary(), file=sys.stderr)
+        click.echo(SimpleTransformer.identifiers, file=sys.stderr)
+    if not transformation_results.transformer_errors and not transformation_results.validation_errors:
+        click.secho(f"Transformed {input_path} into {output_path}", fg='green', file=sys.stderr)
+    else:
+        click.secho(f"Error transforming {input_path}", fg='red', file=sys.stderr)
+        if verbose:
+            click.secho(f"Validation errors: {transformation_results.validation_errors}", fg='red')
+            click.secho(f"Transformer errors: {transformation_results.transformer_errors}", fg='red')
+
+
+@cli.command('watch')
+@click.argument('input_path', type=click.Path(exists=True, file_okay=False), default='data/raw', required=False)
+@click.argument('output_path', type=click.Path(file_okay=False), default='META', required=False)
+@click.option('--concurrency', default=2, show_default=True, type=click.IntRange(min=1),
+              help='deliveries transformed at a time, each by a warm worker process')
+@click.option('--trusted', default=False, show_default=True, is_flag=True,
+              help='render resources as plain dicts, only validate a sample with fhir.resources')
+@click.option('--validation-rate', default=0.01, show_default=True, type=click.FloatRange(min=0, max=1),
+              help='with --trusted, fraction of the resources validated')
+@click.option('--exclude-zones', default=False, show_default=True, is_flag=True,
+              help='leave out the rows sampled from an excluded zone (SV), see docs/preprocessing_notes.md')
+@click.option('--suffix', 'suffixes', default=['.csv'], show_default=True, multiple=True,
+              help='transform files with this suffix, repeat for more, e.g. --suffix .csv --suffix .parquet')
+@click.option('--poll', default=False, show_default=True, is_flag=True,
+              help='scan the directory every --poll-interval seconds instead of using inotify')
+@click.option('--poll-interval', default=1.0, show_default=True, type=click.FloatRange(min=0.01),
+              help='seconds between scans, a file is transformed once unchanged for a scan')
+@click.option('--once', default=False, show_default=True, is_flag=True,
+              help='transform the deliveries already in INPUT_PATH, then exit')
+def watch_cli(input_path: str, output_path: str, concurrency: int, trusted: bool, validation_rate: float, exclude_zones: bool, suffixes: list[str],
+              poll: bool, poll_interval: float, once: bool):
+    """Transform each delivery into OUTPUT_PATH/<delivery name> as it lands, with warm worker processes.
+
+    \b
+    INPUT_PATH: directory of deliveries. default: data/raw/
+    OUTPUT_PATH: each delivery's FHIR is written to a directory here. default: META/
+    """
+    from ucl_stavrinides.watch import watch_deliveries
+    error_count = 0
+    deliveries = watch_deliveries(Path(input_path), Path(output_path), concurrency=concurrency, trusted=trusted, validation_rate=validation_rate,
+                                  exclude_zones=exclude_zones,
+                                  suffixes=tuple(suffixes), poll=poll, poll_interval=poll_interval, once=once)
+    if not once:
+        click.secho(f"Watching {input_path}, press Ctrl-C to stop", file=sys.stderr)
+    try:
+        for results in deliveries:
+            if results.error:
+                error_count += 1
+                click.secho(f"Error transforming {results.input_path}: {results.error}", fg='red', file=sys.stderr)
+                continue
+            click.secho(f"Transformed {results.input_path} into {results.output_path} in {results.latency:.3f}s "
+                        f"(queued {results.queued:.3f}s), {results.parsed_count} rows, {results.emitted_count} resources",
+                        fg='green', file=sys.stderr)
+    except KeyboardInterrupt:
+        pass
+    if error_count:
+        raise click.ClickException(f"{error_count} deliveries failed")
+
+
+@cli.command('extract')
+@click.argument('input_path', type=click.Path(exists=True, dir_okay=False), required=True)
+@click.argument('output_path', type=click.Path(dir_okay=False), default=None, required=False)
+@click.option('--exclude-zones', default=False, show_default=True, is_flag=True,
+              help='leave out the rows sampled from an excluded zone (SV), see docs/preprocessing_notes.md')
+@click.option('--verbose', default=False, show_default=True, is_flag=True,
+              help='verbose output')
+def extract_cli(input_path: str, output_path: str, exclude_zones: bool, verbose: bool):
+    """Validate a csv once, write its typed rows to Parquet, transform reads it in place of the csv.
+
+    \b
+    INPUT_PATH: where to read csv. required
+    OUTPUT_PATH: where to write the extract. default: INPUT_PATH with a .parquet suffix
+    """
+    from ucl_stavrinides.extract import extract_csv
+    results = extract_csv(Path(input_path), Path(output_path) if output_path else None, verbose=verbose, exclude_zones=exclude_zones)
+    if not results.validation_errors:
+        click.secho(f"Extracted {results.row_count} rows of {input_path} into {results.path}", fg='green', file=sys.stderr)
+    else:
+        click.secho(f"Extracted {results.row_count} rows of {input_path} into {results.path}, "
+                    f"{len(results.validation_errors)} invalid rows were left out", fg='yellow', file=sys.stderr)
+
+
+@cli.command('codegen')
+@click.argument('schema_path', type=click.Path(exists=True, dir_okay=False), default='templates/submission.schema.json', required=False)
+def codegen_cli(schema_path: str):
+    """Generate the SubmissionRecord class, run after `g3t_etl dictionary` and datamodel-codegen.
+
+    \b
+    SCHEMA_PATH: where to read the json schema. default: templates/submission.schema.json
+    """
+    from ucl_stavrinides.codegen import generate
+    output_path = generate(Path(schema_path))
+    click.secho(f"Generated {output_path} from {schema_path}", fg='green', file=sys.stderr)
+
+
+@cli.command('check')
+@click.argument('meta_path', type=click.Path(exists=True, file_okay=False), default='META', required=False)
+def check_cli(meta_path: str):
+    """Check the references between the resources, before `g3t commit`.
+
+    \b
+    META_PATH: directory of ndjson files. default: META/
+    """
+    from ucl_stavrinides.integrity import check_integrity
+    problem_count = 0
+    for problem in check_integrity(Path(meta_path)):
+        problem_count += 1
+        location = f"{problem.path}:{problem.line_number}" if problem.line_number else f"{problem.path}"
+        click.echo(f"{location} {problem.kind}: {problem.message}", file=sys.stderr)
+    if problem_count:
+        raise click.ClickException(f"{problem_count} problems in {meta_path}")
+    click.secho(f"All references in {meta_path} resolve", fg='green', file=sys.stderr)
+
+
+@cli.command('upload')
+@click.argument('url', required=True)
+@click.argument('meta_path', type=click.Path(exists=True, file_okay=False), default='META', required=False)
+@click.option('--batch-size', default=500, show_default=True, type=click.IntRange(min=1),
+              help='resources per transaction Bundle')
+@click.option('--concurrency', default=8, show_default=True, type=click.IntRange(min=1),
+              help='requests in flight')
+@click.option('--token', default=None, envvar='FHIR_TOKEN', show_envvar=True,
+              help='bearer token')
+@click.option('--no-checkpoint', default=False, show_default=True, is_flag=True,
+              help='upload everything, do not resume from the checkpoint in .g3t/state')
+def upload_cli(url: str, meta_path: str, batch_size: int, concurrency: int, token: str, no_checkpoint: bool):
+    """Upload the ndjson to a FHIR server, in dependency order, in batched transaction Bundles.
+
+    \b
+    URL: the FHIR server's base url, transaction Bundles are POSTed to it. required
+    META_PATH: directory of ndjson files. default: META/
+    """
+    from ucl_stavrinides.upload import CHECKPOINT_NAME, STATE_PATH, UploadError, upload_ndjson
+    try:
+        results = upload_ndjson(Path(meta_path), url, headers={'Authorization': f"Bearer {token}"} if token else None,
+                                batch_size=batch_size, concurrency=concurrency,
+                                checkpoint_path=None if no_checkpoint else STATE_PATH / CHECKPOINT_NAME)
+    except UploadError as e:
+        raise click.ClickException(f"{e}, run upload again to resume")
+    click.secho(f"Uploaded {results.uploaded_count} resources in {results.batch_count} batches from {meta_path} to {url}, "
+                f"{results.skipped_batch_count} batches were uploaded before", fg='green', file=sys.stderr)
+
+
+@cli.command('associate')
+@click.argument('files_path', type=click.Path(exists=True, file_okay=False), required=True)
+@click.argument('meta_path', type=click.Path(exists=True, file_okay=False), default='META', required=False)
+@click.option('--suffix', default='.jpeg', show_default=True,
+              help='associate files named <specimen identifier>_*<suffix>')
+@click.option('--workers', default=8, show_default=True, type=click.IntRange(min=1),
+              help='number of threads hashing files')
+@click.option('--no-cache', default=False, show_default=True, is_flag=True,
+              help='hash every file, do not use the hash cache in .g3t/state')
+def associate_cli(files_path: str, meta_path: str, suffix: str, workers: int, no_cache: bool):
+    """Create a DocumentReference for each Specimen's files.
+
+    \b
+    FILES_PATH: directory of files named <specimen identifier>_*.jpeg
+    META_PATH: directory with Specimen.ndjson, the DocumentReferences are merged into its DocumentReference.ndjson. default: META/
+    """
+    from ucl_stavrinides.files import HASH_CACHE_NAME, STATE_PATH, associate_files
+    count = associate_files(Path(meta_path), Path(files_path), suffix=suffix, workers=workers,
+                            cache_path=None if no_cache else STATE_PATH / HASH_CACHE_NAME)
+    click.secho(f"Associated {count} files in {files_path} with specimens in {meta_path}", fg='green', file=sys.stderr)
+
+
+@cli.command('load')
+@click.argument('meta_path', type=click.Path(exists=True, file_okay=False), default='META', required=False)
+@click.option('--database', 'database_path', default='.g3t/state/ucl_stavrinides-meta.sqlite', show_default=True,
+              type=click.Path(dir_okay=False), help='the SQLite database')
+def load_cli(meta_path: str, database_path: str):
+    """Load the ndjson into a SQLite database, only the files changed since the last load.
+
+    \b
+    META_PATH: directory of ndjson files. default: META/
+    """
+    from ucl_stavrinides.store import load_meta
+    results = load_meta(Path(meta_path), Path(database_path))
+    click.secho(f"Loaded {results.resource_count} resources from {results.loaded_count} files of {meta_path} into {database_path}, "
+                f"{results.skipped_count} files were unchanged, {results.removed_count} removed", fg='green', file=sys.stderr)
+
+
+@cli.command('query')
+@click.argument('sql', required=True)
+@click.option('--database', 'database_path', default='.g3t/state/ucl_stavrinides-meta.sqlite', show_default=True,
+              type=click.Path(exists=True, dir_okay=False), help='the SQLite database, see `load`')
+def query_cli(sql: str, database_path: str):
+    """Query the database, write the rows as tab separated values, e.g. `SELECT id FROM specimen_fields WHERE pirads >= 4`.
+
+    \b
+    SQL: the query, the database is opened read only. required
+    """
+    import sqlite3
+    from ucl_stavrinides.store import query
+    try:
+        columns, rows = query(sql, database_path=Path(database_path))
+    except sqlite3.Error as e:
+        raise click.ClickException(f"{e}")
+    click.echo('\t'.join(columns))
+    for row in rows:
+        click.echo('\t'.join('' if _ is None else str(_) for _ in row))
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,97 @@
+"""Generate ucl_stavrinides/submission_record.py from templates/submission.schema.json.
+
+Run after `g3t_etl dictionary` and datamodel-codegen, see the user guide. The generated `SubmissionRecord` has a
+slot per Submission field and module level tables of the fields' metadata, see ucl_stavrinides.records.
+"""
+import hashlib
+import keyword
+import logging
+import pathlib
+import re
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_PATH = pathlib.Path('templates/submission.schema.json')
+
+RECORD_PATH = pathlib.Path(__file__).parent / 'submission_record.py'
+
+TYPES = {'string': str, 'integer': int, 'number': float}
+"""Python type of each json schema type, as in datamodel-codegen."""
+
+
+def field_name(property_: str) -> str:
+    """The python name of a schema property, as datamodel-codegen names it, e.g. months.diag -> months_diag."""
+    name = re.sub(r'\W', '_', property_)
+    return f"{name}_" if keyword.iskeyword(name) else name
+
+
+def schema_fingerprint(schema: bytes) -> str:
+    """Hash of the schema, the generated module is stale if the schema changed."""
+    return hashlib.blake2b(schema, digest_size=16).hexdigest()
+
+
+def _literal(value) -> str:
+    """A value of a table, a dict has one key per line."""
+    if isinstance(value, type):
+        return value.__name__
+    if isinstance(value, dict):
+        return '{\n' + ''.join(f"        {k!r}: {v!r},\n" for k, v in value.items()) + '    }'
+    return repr(value)
+
+
+def _table(name: str, values: list, docstring: str) -> str:
+    lines = [f"{name} = ("] + [f"    {_literal(_)}," for _ in values] + [')', f'"""{docstring}"""']
+    return '\n'.join(lines)
+
+
+def generate_record_module(schema: bytes) -> str:
+    """The source of the record module of a schema."""
+    properties = orjson.loads(schema)['properties']
+    columns = list(properties)
+    fields = [field_name(_) for _ in columns]
+    types = [TYPES.get(properties[_].get('type', 'string'), str) for _ in columns]
+    parameters = ',\n'.join(f"        {field}: Optional[{type_.__name__}] = None" for field, type_ in zip(fields, types))
+    assignments = '\n'.join(f"        self.{field} = {field}" for field in fields)
+    tables = '\n\n'.join([
+        _table('FIELDS', fields, 'Field names, in schema order, the same as Submission.model_fields.'),
+        _table('COLUMNS', columns, "Csv column names, the fields' aliases."),
+        _table('TYPES', types, 'Type of each field.'),
+        _table('DESCRIPTIONS', [properties[_].get('description', None) for _ in columns], 'Description of each field.'),
+        _table('EXTRAS', [properties[_].get('json_schema_extra', {}) for _ in columns], 'json_schema_extra of each field.'),
+    ])
+    return f'''# generated by ucl_stavrinides.codegen:
+#   filename:  {SCHEMA_PATH.name}
+#   fingerprint:  {schema_fingerprint(schema)}
+"""A compact record of a submission row, one slot per Submission field, see ucl_stavrinides.records."""
+from typing import Optional
+
+from ucl_stavrinides.records import Record
+
+SCHEMA_FINGERPRINT = '{schema_fingerprint(schema)}'
+
+{tables}
+
+
+class SubmissionRecord(Record):
+    """A submission row, see Submission for the pydantic model."""
+    __slots__ = FIELDS
+    _fields = FIELDS
+    _columns = COLUMNS
+    _types = TYPES
+
+    def __init__(
+        self,
+{parameters},
+    ) -> None:
+{assignments}
+'''
+
+
+def generate(schema_path: pathlib.Path = SCHEMA_PATH, output_path: pathlib.Path = RECORD_PATH) -> pathlib.Path:
+    """Write the record module of the schema at schema_path."""
+    source = generate_record_module(pathlib.Path(schema_path).read_bytes())
+    pathlib.Path(output_path).write_text(source)
+    logger.info(f"generated {output_path} from {schema_path}")
+    return pathlib.Path(output_path)
@@ -0,0 +1,252 @@
+"""Columnar transform engine.
+
+Reads the whole csv into column arrays, validates each column against the `Submission` field metadata
+and renders the FHIR json of each Observation column in bulk from a per field template.
+Rows that fail column validation are transformed by the pydantic `SimpleTransformer`, so the emitted ndjson
+is identical to `g3t_etl.factory.transform_csv`.
+"""
+import logging
+import pathlib
+from typing import Optional
+
+import numpy as np
+import orjson
+import pandas
+from fhir.resources.researchstudy import ResearchStudy
+from pandas.api.types import is_bool_dtype, is_integer_dtype, is_numeric_dtype, is_string_dtype
+from pydantic import ValidationError
+from pydantic.fields import FieldInfo
+
+from g3t_etl import close_emitters, get_emitter, print_transformation_error, print_validation_error
+from g3t_etl.factory import RESEARCH_STUDY, TransformationResults, helper
+from ucl_stavrinides.categories import intern
+from ucl_stavrinides.emission import condition, condition_text, mint_id, observation, patient, procedure, research_subject, specimen
+from ucl_stavrinides.preprocess import excluded_rows, preprocess
+from ucl_stavrinides.simple_transformer import SimpleTransformer, lesion_identifier, split_id
+from ucl_stavrinides.submission import Submission
+from ucl_stavrinides.templates import observation_templates, presence, python_type
+
+logger = logging.getLogger(__name__)
+
+
+def read_csv(input_path: pathlib.Path, exclude_zones: bool = False) -> pandas.DataFrame:
+    """Read the csv and clean it, see preprocess.preprocess. An extract (.parquet) is memory-mapped instead."""
+    if pathlib.Path(input_path).suffix == '.parquet':
+        from ucl_stavrinides.extract import read_extract
+        df = read_extract(input_path).to_pandas()
+        if exclude_zones:
+            df = df[~excluded_rows(df)].reset_index(drop=True)
+        return df
+    results = preprocess(pandas.read_csv(input_path, skipinitialspace=True, skip_blank_lines=True, comment="#"),
+                         exclude_zones=exclude_zones)
+    logger.info(f"preprocessed {input_path}, rows per rule {results.row_counts}")
+    return results.df
+
+
+def validate_column(series: Optional[pandas.Series], field_info: FieldInfo, row_count: int) -> tuple[list, np.ndarray]:
+    """Coerce a column to the values a Submission would hold.
+
+    Returns the values (None if null or invalid) and a mask of the rows whose value the column can not vouch for,
+    those rows are left to pydantic.
+    """
+    if series is None:
+        return [None] * row_count, np.zeros(row_count, dtype=bool)
+
+    notna = series.notna().to_numpy()
+    field_type = python_type(field_info)
+
+    if field_type is str:
+        if not is_string_dtype(series):
+            return [None] * row_count, notna
+        values = series.to_numpy(dtype=object)
+        is_str = np.fromiter((isinstance(_, str) for _ in values), dtype=bool, count=row_count)
+        valid = notna & is_str
+        return np.where(valid, values, None).tolist(), notna & ~valid
+
+    if is_bool_dtype(series) or not is_numeric_dtype(series):
+        return [None] * row_count, notna
+
+    if is_integer_dtype(series):
+        values = series.tolist()
+        if field_type is float:
+            values = [float(_) for _ in values]
+        return list(values), np.zeros(row_count, dtype=bool)
+
+    array = series.to_numpy(dtype=float, na_value=np.nan)
+    valid = notna & np.isfinite(array)
+    if field_type is int:
+        valid &= np.floor(array, where=valid, out=np.zeros(row_count)) == array
+        values = np.where(valid, array, 0).astype(np.int64).tolist()
+    else:
+        values = array.tolist()
+    return [value if ok else None for value, ok in zip(values, valid)], notna & ~valid
+
+
+def create_research_study() -> ResearchStudy:
+    """Create the project's ResearchStudy, see g3t_etl.factory.transform_csv."""
+    research_study = ResearchStudy(**RESEARCH_STUDY)
+    identifier_ = helper.populate_identifier(value=helper.project_id)
+    research_study.id = helper.mint_id(identifier=identifier_, resource_type='ResearchStudy')
+    research_study.identifier = [identifier_]
+    return research_study
+
+
+def transform_csv_columnar(input_path: pathlib.Path,
+                           output_path: pathlib.Path,
+                           already_seen: set = None,
+                           verbose: bool = False,
+                           exclude_zones: bool = False) -> TransformationResults:
+    """Transform a CSV file to FHIR, a drop in replacement for g3t_etl.factory.transform_csv. If exclude_zones, the SV rows are dropped."""
+    return transform_dataframe(read_csv(input_path, exclude_zones=exclude_zones), output_path, already_seen=already_seen, verbose=verbose,
+                               input_path=input_path)
+
+
+def transform_dataframe(df: pandas.DataFrame,
+                        output_path: pathlib.Path,
+                        already_seen: set = None,
+                        verbose: bool = False,
+                        input_path: pathlib.Path = None,
+                        validate_columns: bool = True) -> TransformationResults:
+    """Transform the rows of a csv, see read_csv.
+
+    If validate_columns is False, every row is validated and transformed by pydantic.
+    """
+
+    if already_seen is None:
+        already_seen = set()
+
+    emitters = {}
+    parsed_count = 0
+    emitted_count = 0
+    validation_errors = []
+    transformer_errors = []
+
+    def emit(resource_type: str, id_: str, resource: dict | str) -> None:
+        """Write the resource, unless already written."""
+        nonlocal emitted_count
+        if id_ in already_seen:
+            return
+        already_seen.add(id_)
+        line = resource if isinstance(resource, str) else orjson.dumps(resource).decode()
+        get_emitter(emitters, resource_type, str(output_path), verbose=False).write(line + "\n")
+        emitted_count += 1
+
+    row_count = len(df)
+
+    try:
+        research_study = create_research_study()
+        emit(research_study.resource_type, research_study.id, research_study.json())
+    except ValidationError as e:
+        transformer_errors.append(e)
+        print_transformation_error(e, parsed_count, input_path, RESEARCH_STUDY, verbose)
+        raise e
+
+    # validate every Submission column, collect rows pydantic needs to look at
+    invalid = np.full(row_count, not validate_columns)
+    columns = {}
+    for field, field_info in Submission.model_fields.items():
+        column = field_info.alias or field
+        columns[field], invalid_ = validate_column(df[column] if column in df.columns else None, field_info, row_count)
+        invalid |= invalid_
+
+    deconstructed_ids = []
+    for index, id_ in enumerate(columns['id']):
+        deconstructed_id = split_id(id_) if id_ else None
+        if not deconstructed_id:
+            invalid[index] = True
+        deconstructed_ids.append(deconstructed_id)
+
+    # ids of the resources each row refers to
+    patient_ids = {}
+    condition_text_ = condition_text()
+    rows = []
+    for index, deconstructed_id in enumerate(deconstructed_ids):
+        if invalid[index]:
+            rows.append(None)
+            continue
+        patient_identifier = deconstructed_id.patient_id
+        if patient_identifier not in patient_ids:
+            patient_ids[patient_identifier] = mint_id('Patient', patient_identifier)
+        condition_identifier = f"{patient_identifier}/{condition_text_}"
+        rows.append({
+            'Patient': (patient_identifier, patient_ids[patient_identifier]),
+            'Specimen': (columns['id'][index], mint_id('Specimen', columns['id'][index])),
+            'Condition': (condition_identifier, mint_id('Condition', condition_identifier)),
+        })
+
+    # render each observation column, visit only the rows where it is set
+    templates = observation_templates()
+    templates = [_ for _ in templates if _.focus == 'Specimen'] + [_ for _ in templates if _.focus == 'Condition']
+    bitmap = presence(columns, templates, row_count)
+    bitmap[invalid] = False
+    observations = []
+    for template, is_set in zip(templates, bitmap.T):
+        lines = {}
+        values = columns[template.field]
+        if template.value_type == 'valueCodeableConcept':
+            values = intern(template.field, values)
+        for index in np.flatnonzero(is_set).tolist():
+            row = rows[index]
+            patient_identifier, patient_id = row['Patient']
+            focus_identifier, focus_id = row[template.focus]
+            observation_ = observation(template, patient_identifier, patient_id, focus_identifier, focus_id, values[index])
+            lines[index] = (observation_['id'], orjson.dumps(observation_).decode())
+        observations.append(lines)
+
+    records = None
+
+    for index in range(row_count):
+
+        if invalid[index]:
+            # pydantic path
+            if records is None:
+                records = df.replace({np.nan: None}).to_dict(orient='records')
+            record = records[index]
+            try:
+                transformer = SimpleTransformer(**record, helper=helper)
+                parsed_count += 1
+            except ValidationError as e:
+                validation_errors.append(e)
+                print_validation_error(e, parsed_count, input_path, record, verbose)
+                raise e
+            try:
+                resources = transformer.transform(research_study=research_study)
+                for resource in resources:
+                    emit(resource.resource_type, resource.id, resource.json())
+            except ValidationError as e:
+                transformer_errors.append(e)
+                print_transformation_error(e, parsed_count, input_path, record, verbose)
+                raise e
+            continue
+
+        parsed_count += 1
+        row = rows[index]
+        deconstructed_id = deconstructed_ids[index]
+        patient_identifier, patient_id = row['Patient']
+        specimen_identifier, specimen_id = row['Specimen']
+        condition_identifier, condition_id = row['Condition']
+
+        emit('Patient', patient_id, patient(patient_identifier, patient_id))
+
+        procedure_identifier = f"{patient_identifier}/{lesion_identifier(deconstructed_id)}"
+        procedure_id = mint_id('Procedure', procedure_identifier)
+        emit('Specimen', specimen_id, specimen(specimen_identifier, specimen_id, patient_id, procedure_id))
+        emit('Procedure', procedure_id, procedure(procedure_identifier, procedure_id, patient_id))
+
+        if condition_id not in already_seen:
+            emit('Condition', condition_id, condition(condition_identifier, condition_id, patient_id, columns['ageDiagM'][index]))
+
+        research_subject_ = research_subject(patient_identifier, patient_id, research_study.id)
+        emit('ResearchSubject', research_subject_['id'], research_subject_)
+
+        for template_index in np.flatnonzero(bitmap[index]).tolist():
+            emit('Observation', *observations[template_index][index])
+
+    close_emitters(emitters)
+
+    return TransformationResults(
+        parsed_count=parsed_count,
+        emitted_count=emitted_count,
+        validation_errors=validation_errors,
+        transformer_errors=transformer_errors
+    )
@@ -0,0 +1,246 @@
+"""Trusted emission, resources are rendered as plain dicts and serialized with orjson.
+
+The shape of every resource is fixed by this plugin, so fhir.resources models are only built to validate a sample
+of the emitted resources, see SampledValidator. The dicts' keys are in FHIR element order, so the json is identical
+to `Resource.json()`.
+"""
+import logging
+import pathlib
+import uuid
+from typing import Any, Iterator, Optional
+
+import orjson
+from fhir.resources import get_fhir_model_class
+
+from g3t_etl import IDENTIFIER_USE
+from g3t_etl.factory import helper
+from ucl_stavrinides.categories import Category, category
+from ucl_stavrinides.records import Record
+from ucl_stavrinides.simple_transformer import SimpleTransformer, lesion_identifier
+from ucl_stavrinides.submission import Submission
+from ucl_stavrinides.templates import ObservationTemplate, present_templates, prototype, to_json_value
+from ucl_stavrinides.writers import open_ndjson
+
+logger = logging.getLogger(__name__)
+
+VALIDATION_RATE = 0.01
+"""Fraction of the emitted resources validated by fhir.resources."""
+
+PROCEDURE_CODE = {
+    'coding': [{'system': 'http://snomed.info/sct', 'code': '312250003', 'display': 'Magnetic resonance imaging'}],
+    'text': 'Magnetic resonance imaging'
+}
+"""The biopsy Procedure's code, see SimpleTransformer._to_fhir."""
+
+_CONDITION_PROTOTYPE: dict = {}
+"""Rendered template_condition, see condition."""
+
+
+def quantity(value: Any, unit: dict) -> dict:
+    """Render a FHIR Quantity, see FHIRTransformer.to_quantity."""
+    _ = {}
+    if value is not None:
+        _['value'] = to_json_value(value)
+    _.update(unit)
+    return _
+
+
+def unit(field: str) -> dict:
+    """The Quantity system, code and unit of a Submission field."""
+    json_schema_extra = Submission.model_fields[field].json_schema_extra
+    return {'unit': json_schema_extra['uom_unit'], 'system': json_schema_extra['uom_system'], 'code': json_schema_extra['uom_code']}
+
+
+def identifier(value: str) -> dict:
+    """Render a FHIR Identifier, see TransformerHelper.populate_identifier."""
+    return {'use': IDENTIFIER_USE, 'system': helper.system, 'value': value}
+
+
+def mint_id(resource_type: str, value: str) -> str:
+    """Mint the id of a resource with an official identifier of value, see TransformerHelper.mint_id."""
+    return helper.mint_id(f"{resource_type}/{helper.system}|{value}")
+
+
+def reference(resource_type: str, id_: str) -> dict:
+    """Render a FHIR Reference of the form RESOURCE/id."""
+    return {'reference': f"{resource_type}/{id_}"}
+
+
+def patient(patient_identifier: str, patient_id: str) -> dict:
+    """Render the Patient."""
+    return {
+        'resourceType': 'Patient',
+        'id': patient_id,
+        'identifier': [identifier(patient_identifier)],
+        'active': True,
+    }
+
+
+def research_subject(patient_identifier: str, patient_id: str, research_study_id: str) -> dict:
+    """Render the Patient's ResearchSubject."""
+    return {
+        'resourceType': 'ResearchSubject',
+        'id': mint_id('ResearchSubject', patient_identifier),
+        'identifier': [identifier(patient_identifier)],
+        'status': 'active',
+        'study': reference('ResearchStudy', research_study_id),
+        'subject': reference('Patient', patient_id),
+    }
+
+
+def procedure(procedure_identifier: str, procedure_id: str, patient_id: str) -> dict:
+    """Render the biopsy Procedure."""
+    return {
+        'resourceType': 'Procedure',
+        'id': procedure_id,
+        'identifier': [identifier(procedure_identifier)],
+        'status': 'completed',
+        'code': PROCEDURE_CODE,
+        'subject': reference('Patient', patient_id),
+    }
+
+
+def specimen(specimen_identifier: str, specimen_id: str, patient_id: str, procedure_id: str) -> dict:
+    """Render the biopsy Specimen."""
+    return {
+        'resourceType': 'Specimen',
+        'id': specimen_id,
+        'identifier': [identifier(specimen_identifier)],
+        'subject': reference('Patient', patient_id),
+        'collection': {'procedure': reference('Procedure', procedure_id)},
+    }
+
+
+def condition_text() -> str:
+    """The code text of template_condition, part of the Condition's identifier."""
+    return condition_prototype()['code']['text']
+
+
+def condition_prototype() -> dict:
+    """Render template_condition once, with placeholders so the keys are in the right order."""
+    if not _CONDITION_PROTOTYPE:
+        condition_ = SimpleTransformer.template_condition(subject={'reference': 'Patient/id'})
+        condition_.id = 'id'
+        condition_.identifier = [helper.populate_identifier(value='value')]
+        condition_.onsetAge = {'value': 1, **unit('ageDiagM')}
+        _CONDITION_PROTOTYPE.update(prototype(condition_))
+    return _CONDITION_PROTOTYPE
+
+
+def condition(condition_identifier: str, condition_id: str, patient_id: str, age: Any) -> dict:
+    """Render the patient's Condition, onset at age."""
+    return {
+        **condition_prototype(),
+        'id': condition_id,
+        'identifier': [identifier(condition_identifier)],
+        'subject': reference('Patient', patient_id),
+        'onsetAge': quantity(age, unit('ageDiagM')),
+    }
+
+
+def observation(template: ObservationTemplate, patient_identifier: str, patient_id: str,
+                focus_identifier: str, focus_id: str, value: Any) -> dict:
+    """Render the Observation of a Submission field, see FHIRTransformer.create_observations."""
+    identifier_ = f"{patient_identifier}-{focus_identifier}-{template.field}"
+    components = None
+    if template.value_type == 'valueQuantity':
+        value = quantity(value, template.unit)
+    elif template.value_type == 'valueCodeableConcept':
+        # value is the csv value, or its Category if the column was interned
+        category_ = value if isinstance(value, Category) else category(template.field, value)
+        value, components = category_.concept_json, category_.components_json
+    observation_ = {
+        **template.prototype,
+        'id': mint_id('Observation', identifier_),
+        'identifier': [identifier(identifier_)],
+        'subject': reference('Patient', patient_id),
+        'focus': [reference(template.focus, focus_id)],
+        template.value_type: value,
+    }
+    if components:
+        # the last element of an Observation
+        observation_['component'] = components
+    return observation_
+
+
+def render(transformer: SimpleTransformer | Record, research_study_id: Optional[str] = None) -> list[dict]:
+    """Render a row's resources, in the same order as SimpleTransformer._to_fhir without grouping by patient.
+
+    Only the row's values are read, transformer may be a SubmissionRecord.
+    """
+    deconstructed_id = transformer.deconstructed_id
+    patient_identifier = deconstructed_id.patient_id
+    patient_id = mint_id('Patient', patient_identifier)
+    procedure_identifier = f"{patient_identifier}/{lesion_identifier(deconstructed_id)}"
+    procedure_id = mint_id('Procedure', procedure_identifier)
+    specimen_id = mint_id('Specimen', transformer.id)
+    condition_identifier = f"{patient_identifier}/{condition_text()}"
+    condition_id = mint_id('Condition', condition_identifier)
+
+    resources = [
+        patient(patient_identifier, patient_id),
+        specimen(transformer.id, specimen_id, patient_id, procedure_id),
+        procedure(procedure_identifier, procedure_id, patient_id),
+        condition(condition_identifier, condition_id, patient_id, transformer.ageDiagM),
+    ]
+    if research_study_id:
+        resources.append(research_subject(patient_identifier, patient_id, research_study_id))
+
+    focus = {'Specimen': (transformer.id, specimen_id), 'Condition': (condition_identifier, condition_id)}
+    for focus_type, (focus_identifier, focus_id) in focus.items():
+        for template in present_templates(focus_type, transformer.present_fields):
+            value = getattr(transformer, template.field)
+            resources.append(observation(template, patient_identifier, patient_id, focus_identifier, focus_id, value))
+    return resources
+
+
+def dumps(resource: dict) -> str:
+    """Serialize a resource, the same json as Resource.json()."""
+    return orjson.dumps(resource).decode()
+
+
+class SampledValidator:
+    """Validate a deterministic sample of the emitted resources with fhir.resources.
+
+    A resource is sampled by its id, so reruns validate the same resources. A sampled resource must parse,
+    and serialize back to the same json, otherwise the plugin's rendering has drifted from the FHIR model.
+    """
+
+    def __init__(self, rate: float = VALIDATION_RATE) -> None:
+        assert 0 <= rate <= 1, f"rate should be between 0 and 1, got {rate}"
+        self._threshold = int(rate * (1 << 32))
+        self.rate = rate
+        self.validated_count = 0
+
+    def is_sampled(self, id_: str) -> bool:
+        """Should the resource with this id be validated."""
+        if self.rate >= 1:
+            return True
+        return (uuid.UUID(id_).int >> 96) < self._threshold
+
+    def validate(self, resource: dict, line: str = None) -> None:
+        """Validate the resource if sampled, raise a ValidationError if invalid, or a ValueError if the json differs."""
+        if not self.is_sampled(resource['id']):
+            return
+        if line is None:
+            line = dumps(resource)
+        model = get_fhir_model_class(resource['resourceType']).parse_obj(resource)
+        self.validated_count += 1
+        if model.json() != line:
+            raise ValueError(f"{resource['resourceType']}/{resource['id']} does not round trip through fhir.resources:\n{line}\n{model.json()}")
+
+
+def validate_ndjson(output_path: pathlib.Path, rate: float = 1.0) -> Iterator[tuple[pathlib.Path, int, Exception]]:
+    """Validate a sample of the resources already written to a directory, e.g. in CI. Yields (path, line number, error).
+
+    Reads the shards of ShardedNdjsonWriters too.
+    """
+    validator = SampledValidator(rate)
+    for path in sorted(pathlib.Path(output_path).glob('*.ndjson*')):
+        with open_ndjson(path) as fp:
+            for line_number, line in enumerate(fp, start=1):
+                try:
+                    validator.validate(orjson.loads(line), line.rstrip('\n'))
+                except ValueError as e:
+                    yield path, line_number, e
+    logger.info(f"validated {validator.validated_count} resources in {output_path}")
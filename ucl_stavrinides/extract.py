@@ -0,0 +1,134 @@
+"""Extract a csv delivery once to a typed, validated Parquet file.
+
+Each row is cleaned (see streaming.iter_records) and validated against `Submission`, the valid rows are written
+with one typed column per Submission field, named as in the csv. The fields' descriptions and json_schema_extra
+are kept as Arrow field metadata, the source csv's hash and the Submission schema's hash as schema metadata.
+
+The engines accept the Parquet file as input in place of the csv, it is memory-mapped and the rows are not
+re-validated column by column. For analytics, `read_extract(path).to_pandas()`.
+"""
+import hashlib
+import logging
+import pathlib
+from typing import Iterator, NamedTuple, Optional
+
+import orjson
+import pyarrow
+import pyarrow.parquet
+from pydantic import ValidationError
+from pydantic.fields import FieldInfo
+
+from g3t_etl import print_validation_error
+from ucl_stavrinides.streaming import iter_records
+from ucl_stavrinides.submission import Submission
+from ucl_stavrinides.templates import python_type
+
+logger = logging.getLogger(__name__)
+
+EXTRACT_SUFFIX = '.parquet'
+
+METADATA_KEY = b'ucl_stavrinides'
+"""Schema metadata key of the extract's provenance."""
+
+ARROW_TYPES = {str: pyarrow.string(), int: pyarrow.int64(), float: pyarrow.float64()}
+
+BATCH_SIZE = 64 * 1024
+"""Rows per record batch, when reading and writing."""
+
+
+class ExtractResults(NamedTuple):
+    """Where the extract was written, the rows written and the rows that failed validation."""
+    path: pathlib.Path
+    row_count: int
+    validation_errors: list[ValidationError]
+
+
+def submission_fingerprint() -> str:
+    """Hash of the Submission schema, an extract of another schema must be extracted again."""
+    return hashlib.blake2b(orjson.dumps(Submission.model_json_schema(), option=orjson.OPT_SORT_KEYS), digest_size=16).hexdigest()
+
+
+def file_hash(path: pathlib.Path) -> str:
+    """Hash of a file's bytes, e.g. the source csv; see also store.load_meta."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as fp:
+        while chunk := fp.read(1 << 20):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def arrow_field(field: str, field_info: FieldInfo) -> pyarrow.Field:
+    """A nullable Arrow field named as the csv column, typed as the Submission field."""
+    metadata = {'field': field, 'description': field_info.description or ''}
+    if field_info.json_schema_extra:
+        metadata['json_schema_extra'] = orjson.dumps(field_info.json_schema_extra).decode()
+    return pyarrow.field(field_info.alias or field, ARROW_TYPES[python_type(field_info)], nullable=True, metadata=metadata)
+
+
+def arrow_schema(metadata: Optional[dict] = None) -> pyarrow.Schema:
+    """The Arrow schema of Submission."""
+    fields = [arrow_field(field, field_info) for field, field_info in Submission.model_fields.items()]
+    return pyarrow.schema(fields, metadata={METADATA_KEY: orjson.dumps(metadata or {})})
+
+
+def extract_csv(input_path: pathlib.Path, output_path: Optional[pathlib.Path] = None, verbose: bool = False,
+                exclude_zones: bool = False) -> ExtractResults:
+    """Validate the rows of a csv, write the valid rows to output_path, default: input_path with a .parquet suffix.
+
+    If exclude_zones, the SV rows are left out, see streaming.iter_records.
+    """
+    input_path = pathlib.Path(input_path)
+    output_path = pathlib.Path(output_path) if output_path else input_path.with_suffix(EXTRACT_SUFFIX)
+    columns = [field_info.alias or field for field, field_info in Submission.model_fields.items()]
+    rows = []
+    validation_errors = []
+    for index, record in enumerate(iter_records(input_path, exclude_zones=exclude_zones)):
+        try:
+            submission = Submission(**record)
+        except ValidationError as e:
+            validation_errors.append(e)
+            print_validation_error(e, index, input_path, record, verbose)
+            continue
+        rows.append(submission.model_dump(by_alias=True))
+
+    schema = arrow_schema({
+        'source': input_path.name,
+        'source_hash': file_hash(input_path),
+        'submission_fingerprint': submission_fingerprint(),
+        'row_count': len(rows),
+        'invalid_row_count': len(validation_errors),
+    })
+    table = pyarrow.Table.from_pydict({column: [_[column] for _ in rows] for column in columns}, schema=schema)
+    tmp_path = output_path.with_name(f".{output_path.name}.tmp")
+    pyarrow.parquet.write_table(table, tmp_path, row_group_size=BATCH_SIZE)
+    tmp_path.replace(output_path)
+    logger.info(f"extracted {len(rows)} rows of {input_path} into {output_path}, {len(validation_errors)} invalid rows")
+    return ExtractResults(path=output_path, row_count=len(rows), validation_errors=validation_errors)
+
+
+def extract_metadata(schema: pyarrow.Schema) -> dict:
+    """The provenance of an extract, see extract_csv."""
+    return orjson.loads((schema.metadata or {}).get(METADATA_KEY, b'{}'))
+
+
+def read_extract(path: pathlib.Path) -> pyarrow.Table:
+    """Memory-map an extract, raise a ValueError if it was extracted with another Submission schema."""
+    table = pyarrow.parquet.read_table(path, memory_map=True)
+    metadata = extract_metadata(table.schema)
+    if metadata.get('submission_fingerprint') != submission_fingerprint():
+        raise ValueError(f"{path} was extracted with another Submission schema, run `extract` on {metadata.get('source', 'the csv')} again")
+    return table
+
+
+def is_current(path: pathlib.Path, input_path: pathlib.Path) -> bool:
+    """Was the extract at path made from this csv, with this Submission schema."""
+    if not pathlib.Path(path).exists():
+        return False
+    metadata = extract_metadata(pyarrow.parquet.read_schema(path))
+    return metadata.get('submission_fingerprint') == submission_fingerprint() and metadata.get('source_hash') == file_hash(input_path)
+
+
+def iter_extract_records(path: pathlib.Path) -> Iterator[dict]:
+    """Read the rows of an extract one at a time, keyed on csv column, see streaming.iter_records."""
+    for batch in read_extract(path).to_batches(max_chunksize=BATCH_SIZE):
+        yield from batch.to_pylist()
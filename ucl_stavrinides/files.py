@@ -0,0 +1,247 @@
+"""Associate image files with Specimens.
+
+Replaces one `g3t add --specimen` process per Specimen: META/Specimen.ndjson is streamed, the image directory is
+scanned once, files named `<specimen identifier>_*.jpeg` are hashed in a thread pool and a DocumentReference
+for each file is merged into META/DocumentReference.ndjson in one batch, by id.
+Hashes are cached in .g3t/state, a file is only re-hashed if its size, modification time or inode changed.
+"""
+import hashlib
+import logging
+import mimetypes
+import os
+import pathlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Iterator, NamedTuple, Optional
+
+import orjson
+from fhir.resources.documentreference import DocumentReference
+
+from g3t_etl.factory import helper
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 8 << 20
+"""Bytes read at a time when hashing, large images are never read into memory whole."""
+
+HASH_WORKERS = 8
+"""Threads hashing files, hashlib releases the GIL while hashing a chunk."""
+
+FILE_SUFFIX = '.jpeg'
+
+STATE_PATH = pathlib.Path('.g3t/state')
+"""Where the hash cache is kept, see also ucl_stavrinides.incremental."""
+
+HASH_CACHE_NAME = 'ucl_stavrinides-file-hashes.json'
+
+MD5_EXTENSION = 'http://aced-idp.org/fhir/StructureDefinition/md5'
+SOURCE_PATH_EXTENSION = 'http://aced-idp.org/fhir/StructureDefinition/source_path'
+
+
+class SpecimenFile(NamedTuple):
+    """A file, and the Specimen it was matched to."""
+    path: pathlib.Path
+    specimen_identifier: str
+    specimen_id: str
+
+
+class FileInfo(NamedTuple):
+    """A file's size, modification time and content hash."""
+    path: pathlib.Path
+    size: int
+    mtime: float
+    md5: str
+
+
+def iter_specimens(specimen_path: pathlib.Path) -> Iterator[tuple[str, str]]:
+    """Stream (official identifier value, id) of the Specimens in an ndjson file."""
+    with open(specimen_path, 'rb') as fp:
+        for line in fp:
+            specimen = orjson.loads(line)
+            identifier = next(iter(_ for _ in specimen.get('identifier', []) if _.get('use') == 'official'), None)
+            if identifier:
+                yield identifier['value'], specimen['id']
+
+
+def match_files(specimens: dict[str, str], files_path: pathlib.Path, suffix: str = FILE_SUFFIX) -> list[SpecimenFile]:
+    """Match `<specimen identifier>_*<suffix>` files in a single scan of files_path.
+
+    Identifiers contain underscores (e.g. 123_1_A and 123_1_A_B), a file is matched to the longest identifier
+    it starts with.
+    """
+    matched = []
+    with os.scandir(files_path) as entries:
+        for entry in entries:
+            if not entry.name.endswith(suffix) or not entry.is_file():
+                continue
+            name = entry.name
+            specimen_identifier = None
+            position = name.find('_')
+            while position > 0:
+                if name[:position] in specimens:
+                    specimen_identifier = name[:position]
+                position = name.find('_', position + 1)
+            if specimen_identifier:
+                matched.append(SpecimenFile(pathlib.Path(files_path) / name, specimen_identifier, specimens[specimen_identifier]))
+    return sorted(matched)
+
+
+def md5(path: pathlib.Path, chunk_size: int = CHUNK_SIZE) -> str:
+    """Hash a file in chunks."""
+    digest = hashlib.md5()
+    with open(path, 'rb', buffering=0) as fp:
+        while chunk := fp.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class HashCache:
+    """Persistent md5 of files, keyed on path; an entry is valid while the file's size, mtime and inode are unchanged.
+
+    Entries are also indexed by inode, so a moved or hard linked file is not re-hashed.
+    """
+
+    def __init__(self, path: Optional[pathlib.Path] = STATE_PATH / HASH_CACHE_NAME) -> None:
+        self.path = pathlib.Path(path) if path else None
+        self._entries: dict[str, list] = {}
+        """[size, mtime_ns, dev, ino, md5] by path."""
+        if self.path and self.path.exists():
+            self._entries = orjson.loads(self.path.read_bytes())
+        self._by_inode = {tuple(_[:4]): _[4] for _ in self._entries.values()}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(stat: os.stat_result) -> tuple[int, int, int, int]:
+        return stat.st_size, stat.st_mtime_ns, stat.st_dev, stat.st_ino
+
+    def get(self, path: pathlib.Path, stat: os.stat_result) -> Optional[str]:
+        """The md5 of the file, None if not cached or changed since."""
+        key = self._key(stat)
+        entry = self._entries.get(str(path), None)
+        md5_ = entry[4] if entry and tuple(entry[:4]) == key else self._by_inode.get(key, None)
+        if md5_:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return md5_
+
+    def put(self, path: pathlib.Path, stat: os.stat_result, md5_: str) -> None:
+        """Remember the md5 of the file."""
+        key = self._key(stat)
+        self._entries[str(path)] = [*key, md5_]
+        self._by_inode[key] = md5_
+
+    def save(self) -> None:
+        """Write the cache, through a temporary file."""
+        if not self.path:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f".{self.path.name}.tmp")
+        tmp_path.write_bytes(orjson.dumps(self._entries))
+        os.replace(tmp_path, self.path)
+
+
+def hash_files(paths: list[pathlib.Path], workers: int = HASH_WORKERS, cache: Optional[HashCache] = None) -> list[FileInfo]:
+    """Stat and hash files in a thread pool, in the order given.
+
+    Files in the cache are not read; files sharing an inode (hard links) are hashed once.
+    """
+    if cache is None:
+        cache = HashCache(path=None)
+    stats = [path.stat() for path in paths]
+    md5s = [cache.get(path, stat) for path, stat in zip(paths, stats)]
+    # one path per inode to hash
+    pending = {}
+    for path, stat, md5_ in zip(paths, stats, md5s):
+        if not md5_:
+            pending.setdefault((stat.st_dev, stat.st_ino), path)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        hashed = dict(zip(pending, executor.map(md5, pending.values())))
+    logger.info(f"hashed {len(hashed)} of {len(paths)} files")
+
+    infos = []
+    for path, stat, md5_ in zip(paths, stats, md5s):
+        if not md5_:
+            md5_ = hashed[(stat.st_dev, stat.st_ino)]
+            cache.put(path, stat, md5_)
+        infos.append(FileInfo(path=path, size=stat.st_size, mtime=stat.st_mtime, md5=md5_))
+    return infos
+
+
+def file_name(path: pathlib.Path, root: Optional[pathlib.Path] = None) -> str:
+    """The name a file's DocumentReference is minted from: its path relative to root (default: the project, the working directory), absolute if outside it.
+
+    Relative and absolute paths to the same file have the same name.
+    """
+    path = pathlib.Path(path).resolve()
+    root = pathlib.Path(root or os.getcwd()).resolve()
+    return (path.relative_to(root) if path.is_relative_to(root) else path).as_posix()
+
+
+def document_reference(info: FileInfo, specimen_id: str, root: Optional[pathlib.Path] = None) -> DocumentReference:
+    """Create the DocumentReference of a file, its subject is the Specimen, see `g3t utilities meta create`."""
+    file_name_ = file_name(info.path, root)
+    url = f"file:///{file_name_.lstrip('/')}"
+    identifier = helper.populate_identifier(value=file_name_)
+    created = datetime.fromtimestamp(info.mtime, tz=timezone.utc).isoformat()
+    content_type, _ = mimetypes.guess_type(info.path.name)
+    return DocumentReference(
+        id=helper.mint_id(identifier=identifier, resource_type='DocumentReference'),
+        identifier=[identifier],
+        status='current',
+        docStatus='final',
+        subject={'reference': f"Specimen/{specimen_id}"},
+        date=created,
+        content=[{
+            'attachment': {
+                'extension': [
+                    {'url': MD5_EXTENSION, 'valueString': info.md5},
+                    {'url': SOURCE_PATH_EXTENSION, 'valueUrl': url},
+                ],
+                'contentType': content_type or 'application/octet-stream',
+                'url': url,
+                'size': info.size,
+                'title': info.path.name,
+                'creation': created,
+            }
+        }]
+    )
+
+
+def merge_ndjson(path: pathlib.Path, lines: list[str]) -> None:
+    """Write lines to an ndjson file, replacing the resources with the same id and keeping the others, through a temporary file."""
+    path = pathlib.Path(path)
+    resources = {}
+    if path.exists():
+        with open(path, 'rb') as fp:
+            for line in fp:
+                if line.strip():
+                    resources[orjson.loads(line)['id']] = line.decode().rstrip('\n') + '\n'
+    for line in lines:
+        resources[orjson.loads(line)['id']] = line
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, 'w') as fp:
+        fp.writelines(resources.values())
+    os.replace(tmp_path, path)
+
+
+def associate_files(meta_path: pathlib.Path, files_path: pathlib.Path, suffix: str = FILE_SUFFIX,
+                    workers: int = HASH_WORKERS, output_path: Optional[pathlib.Path] = None,
+                    cache_path: Optional[pathlib.Path] = STATE_PATH / HASH_CACHE_NAME,
+                    root: Optional[pathlib.Path] = None) -> int:
+    """Add a DocumentReference for each Specimen's files to META/DocumentReference.ndjson, return the count.
+
+    DocumentReferences already there (earlier associations, `g3t add`) are kept, those of the same files are replaced.
+    Ids are minted from the files' paths relative to root, see file_name. Set cache_path to None to hash every file.
+    """
+    meta_path = pathlib.Path(meta_path)
+    specimens = dict(iter_specimens(meta_path / 'Specimen.ndjson'))
+    specimen_files = match_files(specimens, pathlib.Path(files_path), suffix=suffix)
+    logger.info(f"matched {len(specimen_files)} files to {len(specimens)} specimens")
+    cache = HashCache(cache_path)
+    infos = hash_files([_.path for _ in specimen_files], workers=workers, cache=cache)
+    cache.save()
+    lines = [document_reference(info, specimen_file.specimen_id, root).json() + '\n' for info, specimen_file in zip(infos, specimen_files)]
+    merge_ndjson(output_path or meta_path / 'DocumentReference.ndjson', lines)
+    return len(lines)
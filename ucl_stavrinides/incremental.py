@@ -0,0 +1,184 @@
+"""Incremental transform, only re-transform the patients whose csv rows changed since the last run.
+
+A manifest of each row's content hash, keyed on `id` and grouped by patient, is kept in the .g3t/state directory.
+Every resource but the ResearchStudy is either the Patient or has the Patient as its subject, so a changed patient's
+resources are found in the ndjson without remembering their ids. They are replaced in place by the patient's
+re-transformed resources; a deleted patient's resources are dropped and new patients are appended.
+Resource types without changes are left untouched.
+"""
+import hashlib
+import logging
+import os
+import pathlib
+from collections import defaultdict
+from typing import Iterator
+
+import orjson
+
+from g3t_etl.factory import TransformationResults, helper
+from ucl_stavrinides.columnar import create_research_study
+from ucl_stavrinides.emission import dumps, mint_id
+from ucl_stavrinides.streaming import iter_records, iter_resources
+from ucl_stavrinides.templates import library_version
+from ucl_stavrinides.transformer import DICTIONARY_PATH
+
+logger = logging.getLogger(__name__)
+
+STATE_PATH = pathlib.Path('.g3t/state')
+"""Where the manifest is kept."""
+
+MANIFEST_NAME = 'ucl_stavrinides-transform-manifest.json'
+
+TEMPLATES_PATH = pathlib.Path('templates')
+"""A change to a template or to the data dictionary re-transforms every row."""
+
+PACKAGE_PATH = pathlib.Path(__file__).parent
+"""A change to the plugin's sources (SimpleTransformer, emission, categories ...) re-transforms every row."""
+
+LIBRARIES = ('g3t_etl', 'fhir.resources', 'pydantic')
+"""An upgrade of a library rendering the resources re-transforms every row."""
+
+
+def row_hash(record: dict) -> str:
+    """Hash of a row's values, see iter_records."""
+    return hashlib.blake2b(orjson.dumps(record, option=orjson.OPT_SORT_KEYS), digest_size=16).hexdigest()
+
+
+def patient_identifier(id_: str) -> str:
+    """The patient prefix of a row's id, see split_id."""
+    return str(id_ or '').split('_', 1)[0]
+
+
+def fingerprint(templates_path: pathlib.Path = TEMPLATES_PATH, package_path: pathlib.Path = PACKAGE_PATH,
+                dictionary_path: str = DICTIONARY_PATH) -> str:
+    """Hash of everything besides the rows that shapes the output: the project, the library versions, the plugin's sources,
+    the templates and the dictionary, see also templates.sources_hash."""
+    digest = hashlib.blake2b(helper.system.encode(), digest_size=16)
+    digest.update('|'.join(f"{_}={library_version(_)}" for _ in LIBRARIES).encode())
+    paths = sorted(pathlib.Path(package_path).glob('*.py')) + sorted(pathlib.Path(templates_path).glob('*')) + [pathlib.Path(dictionary_path)]
+    for path in paths:
+        if path.is_file():
+            digest.update(path.name.encode())
+            digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def read_manifest(manifest_path: pathlib.Path, output_path: pathlib.Path) -> dict[str, list[list[str]]]:
+    """The rows of the last run into output_path, by patient; empty if there was none, or it is stale."""
+    if not manifest_path.exists():
+        return {}
+    manifest = orjson.loads(manifest_path.read_bytes())
+    if manifest.get('output_path') != str(output_path.resolve()) or manifest.get('fingerprint') != fingerprint():
+        logger.info(f"manifest {manifest_path} is stale, transforming all rows")
+        return {}
+    if not (output_path / 'ResearchStudy.ndjson').exists():
+        logger.info(f"no previous output in {output_path}, transforming all rows")
+        return {}
+    return manifest['patients']
+
+
+def write_manifest(manifest_path: pathlib.Path, output_path: pathlib.Path, patients: dict[str, list[list[str]]]) -> None:
+    """Save the rows of this run."""
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    manifest = {'output_path': str(output_path.resolve()), 'fingerprint': fingerprint(), 'patients': patients}
+    _replace(manifest_path, [orjson.dumps(manifest).decode() + '\n'])
+
+
+def _replace(path: pathlib.Path, lines: Iterator[str]) -> None:
+    """Write the lines to a temporary file, then rename it over path."""
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, 'w') as fp:
+        fp.writelines(lines)
+    os.replace(tmp_path, path)
+
+
+def _patient_reference(line: str) -> str:
+    """The Patient a resource belongs to, as Patient/id."""
+    resource = orjson.loads(line)
+    if resource['resourceType'] == 'Patient':
+        return f"Patient/{resource['id']}"
+    return resource.get('subject', {}).get('reference', '')
+
+
+def patch_ndjson(path: pathlib.Path, replacements: dict[str, list[str]]) -> Iterator[str]:
+    """Lines of path, each changed patient's lines replaced by its new lines where its first line was.
+
+    replacements: new lines by Patient/id, an empty list drops the patient. Patients not in path are appended.
+    """
+    pending = dict(replacements)
+    if path.exists():
+        with open(path) as fp:
+            for line in fp:
+                reference = _patient_reference(line)
+                if reference not in replacements:
+                    yield line
+                    continue
+                yield from pending.pop(reference, [])
+    for lines in pending.values():
+        yield from lines
+
+
+def transform_csv_incremental(input_path: pathlib.Path,
+                              output_path: pathlib.Path,
+                              verbose: bool = False,
+                              trusted: bool = False,
+                              state_path: pathlib.Path = STATE_PATH,
+                              exclude_zones: bool = False) -> TransformationResults:
+    """Transform only the patients with new, changed or deleted rows since the last run, patch the ndjson in output_path.
+
+    If exclude_zones, the SV rows are skipped, see iter_records.
+    """
+    output_path = pathlib.Path(output_path)
+    manifest_path = pathlib.Path(state_path) / MANIFEST_NAME
+    previous = read_manifest(manifest_path, output_path)
+
+    records = defaultdict(list)
+    patients = defaultdict(list)
+    for record in iter_records(input_path, exclude_zones=exclude_zones):
+        key = patient_identifier(record.get('id', None))
+        records[key].append(record)
+        patients[key].append([record.get('id', None), row_hash(record)])
+
+    changed = [_ for _ in patients if previous.get(_, None) != patients[_]]
+    deleted = [_ for _ in previous if _ not in patients]
+    logger.info(f"{len(changed)} new or changed patients, {len(deleted)} deleted patients, "
+                f"{len(patients) - len(changed)} unchanged patients")
+
+    research_study = create_research_study()
+    replacements = defaultdict(dict)
+    for key in deleted + changed:
+        patient_reference = f"Patient/{mint_id('Patient', key)}"
+        for resource_type in ['Patient', 'ResearchSubject', 'Condition', 'Procedure', 'Specimen', 'Observation']:
+            replacements[resource_type][patient_reference] = []
+
+    counts = {}
+    changed_records = (record for key in changed for record in records[key])
+    for resource in iter_resources(changed_records, research_study, input_path=input_path, verbose=verbose,
+                                   counts=counts, trusted=trusted):
+        if trusted:
+            resource_type, line = resource['resourceType'], dumps(resource)
+        else:
+            resource_type, line = resource.resource_type, resource.json()
+        replacements[resource_type][_patient_reference(line)].append(line + '\n')
+
+    output_path.mkdir(parents=True, exist_ok=True)
+    research_study_path = output_path / 'ResearchStudy.ndjson'
+    if not previous or not research_study_path.exists():
+        _replace(research_study_path, [research_study.json() + '\n'])
+    emitted_count = 0
+    for resource_type, replacements_ in replacements.items():
+        if not previous:
+            # nothing to patch, do not carry over lines of an unrelated run
+            (output_path / f"{resource_type}.ndjson").unlink(missing_ok=True)
+        path = output_path / f"{resource_type}.ndjson"
+        _replace(path, patch_ndjson(path, replacements_))
+        emitted_count += sum(len(_) for _ in replacements_.values())
+
+    write_manifest(manifest_path, output_path, patients)
+
+    return TransformationResults(
+        parsed_count=counts.get('parsed_count', 0),
+        emitted_count=emitted_count,
+        validation_errors=[],
+        transformer_errors=[]
+    )
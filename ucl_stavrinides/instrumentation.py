@@ -0,0 +1,146 @@
+"""Per stage timers, counters and sampled profiles of SimpleTransformer.
+
+Disabled by default, a disabled stage or row is a shared no-op context manager.
+Enable with `python -m ucl_stavrinides.cli transform --profile`, or set UCL_STAVRINIDES_PROFILE=1 (every Nth row is
+profiled if set to N > 1) for `g3t_etl transform`, the summary is logged when the process exits.
+"""
+import contextlib
+import cProfile
+import heapq
+import io
+import logging
+import pstats
+import time
+from collections import Counter, defaultdict
+from typing import Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+SLOWEST_ROWS = 10
+"""Number of slowest rows kept for the summary."""
+
+_DISABLED = contextlib.nullcontext()
+
+
+class Instrumentation:
+    """Time the stages of each row, count the resources per type, profile a sample of rows."""
+
+    def __init__(self, enabled: bool = False, profile_every: int = 0, slowest_rows: int = SLOWEST_ROWS) -> None:
+        self.enabled = enabled
+        self.profile_every = profile_every
+        """Profile every Nth row, 0 to not profile."""
+        self.slowest_rows = slowest_rows
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget all measurements."""
+        self.stage_seconds: dict[str, float] = defaultdict(float)
+        self.stage_counts: Counter = Counter()
+        self.resource_counts: Counter = Counter()
+        self.row_count = 0
+        self.row_seconds = 0.0
+        self._slowest: list[tuple[float, str]] = []
+        self._profiler = None
+        self._profile_stats: Optional[pstats.Stats] = None
+        self._profile_text: list[str] = []
+
+    def enable(self, profile_every: int = 0) -> None:
+        """Start measuring, profile every Nth row if profile_every > 0."""
+        self.enabled = True
+        self.profile_every = profile_every
+
+    def disable(self) -> None:
+        """Stop measuring, keep the measurements."""
+        self.enabled = False
+
+    def stage(self, name: str) -> contextlib.AbstractContextManager:
+        """Time a stage of a row, e.g. 'Patient'."""
+        if not self.enabled:
+            return _DISABLED
+        return self._stage(name)
+
+    @contextlib.contextmanager
+    def _stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_seconds[name] += time.perf_counter() - start
+            self.stage_counts[name] += 1
+
+    def row(self, id_: str) -> contextlib.AbstractContextManager:
+        """Time a row, profile it if sampled. Set the context's value to the row's resources to count them."""
+        if not self.enabled:
+            return _DISABLED
+        return self._row(id_)
+
+    @contextlib.contextmanager
+    def _row(self, id_: str) -> Iterator[list]:
+        resources = []
+        profile = self.profile_every > 0 and self.row_count % self.profile_every == 0
+        if profile:
+            self._start_profile()
+        start = time.perf_counter()
+        try:
+            yield resources
+        finally:
+            seconds = time.perf_counter() - start
+            if profile:
+                self._stop_profile()
+            self.row_count += 1
+            self.row_seconds += seconds
+            self.resource_counts.update(_.resource_type for _ in resources)
+            if len(self._slowest) < self.slowest_rows:
+                heapq.heappush(self._slowest, (seconds, id_))
+            elif seconds > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, (seconds, id_))
+
+    def _start_profile(self) -> None:
+        """Profile with pyinstrument if installed, cProfile otherwise."""
+        try:
+            import pyinstrument
+        except ImportError:
+            pyinstrument = None
+        if pyinstrument:
+            self._profiler = pyinstrument.Profiler()
+            self._profiler.start()
+        else:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def _stop_profile(self) -> None:
+        if isinstance(self._profiler, cProfile.Profile):
+            self._profiler.disable()
+            if self._profile_stats is None:
+                self._profile_stats = pstats.Stats(self._profiler, stream=io.StringIO())
+            else:
+                self._profile_stats.add(self._profiler)
+        else:
+            self._profiler.stop()
+            self._profile_text.append(self._profiler.output_text())
+        self._profiler = None
+
+    def slowest(self) -> list[tuple[float, str]]:
+        """The slowest rows, (seconds, id), slowest first."""
+        return sorted(self._slowest, reverse=True)
+
+    def summary(self, profile_lines: int = 20) -> str:
+        """Time per stage, resources per type, the slowest rows and the sampled profiles."""
+        lines = [f"rows: {self.row_count} in {self.row_seconds:.3f}s"]
+        lines.append("stages:")
+        for name, seconds in sorted(self.stage_seconds.items(), key=lambda _: -_[1]):
+            share = seconds / self.row_seconds * 100 if self.row_seconds else 0
+            lines.append(f"  {name}: {seconds:.3f}s {share:.1f}% ({self.stage_counts[name]} calls)")
+        lines.append("resources:")
+        for resource_type, count in sorted(self.resource_counts.items()):
+            lines.append(f"  {resource_type}: {count}")
+        lines.append("slowest rows:")
+        for seconds, id_ in self.slowest():
+            lines.append(f"  {id_}: {seconds * 1000:.1f}ms")
+        if self._profile_stats:
+            stream = io.StringIO()
+            self._profile_stats.stream = stream
+            self._profile_stats.sort_stats('cumulative').print_stats(profile_lines)
+            lines.append(stream.getvalue())
+        lines.extend(self._profile_text)
+        return '\n'.join(lines)
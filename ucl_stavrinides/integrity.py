@@ -0,0 +1,161 @@
+"""Referential integrity of the emitted FHIR graph, a quick check before `g3t commit`.
+
+Two passes over the ndjson in a directory (plain files or the shards of ShardedNdjsonWriters):
+1. the id of every resource is indexed, as a sorted array of 16 byte keys per resource type, duplicate ids are reported,
+2. every `"reference": "RESOURCE/id"` is looked up in the index, in batches, dangling references are reported.
+
+Resources that should be referred to (e.g. a Patient by its ResearchSubject) but are not, and resources that refer
+to nothing, are reported as orphans. Memory is ~16 bytes per resource, millions of Observations fit easily.
+"""
+import hashlib
+import logging
+import pathlib
+import re
+import uuid
+from collections import defaultdict
+from typing import Iterator, NamedTuple, Optional
+
+import numpy as np
+import orjson
+
+from ucl_stavrinides.writers import open_ndjson
+
+logger = logging.getLogger(__name__)
+
+REFERENCE_PATTERN = re.compile(rb'"reference"\s*:\s*"([A-Za-z]+)/([^"/]+)"')
+"""A literal reference RESOURCE/id, conditional references (RESOURCE?identifier=...) are not resolved."""
+
+EXPECTED_REFERRERS = {
+    'ResearchStudy': 'ResearchSubject',
+    'Patient': 'ResearchSubject',
+    'Procedure': 'Specimen',
+}
+"""A resource of the key's type is an orphan unless a resource of the value's type refers to it."""
+
+ROOT_TYPES = frozenset(['ResearchStudy', 'Patient'])
+"""Resource types that need not refer to anything."""
+
+BATCH_SIZE = 64 * 1024
+"""References looked up at a time."""
+
+
+class Problem(NamedTuple):
+    """A duplicate id, dangling reference or orphan resource."""
+    kind: str
+    """One of duplicate, dangling, orphan or misplaced (a resource in another resource type's file)."""
+    path: pathlib.Path
+    line_number: Optional[int]
+    message: str
+
+
+def key(id_: str | bytes) -> bytes:
+    """The 16 byte key of an id, its UUID bytes, or a hash of any other id."""
+    if isinstance(id_, bytes):
+        id_ = id_.decode()
+    try:
+        return uuid.UUID(id_).bytes
+    except ValueError:
+        return hashlib.blake2b(id_.encode(), digest_size=16).digest()
+
+
+def to_id(key_: bytes) -> str:
+    """The id of a key, hashed ids can not be recovered and are shown as the UUID of their hash."""
+    return str(uuid.UUID(bytes=key_.ljust(16, b'\0')))
+
+
+def ndjson_paths(meta_path: pathlib.Path) -> Iterator[tuple[str, pathlib.Path]]:
+    """(resource type, path) of the ndjson files and shards in a directory."""
+    for path in sorted(pathlib.Path(meta_path).glob('*.ndjson*')):
+        yield path.name.split('.', 1)[0], path
+
+
+class IdIndex:
+    """The ids of one resource type, appended as bytes, then sorted into an array of 16 byte keys."""
+
+    def __init__(self) -> None:
+        self._buffer = bytearray()
+        self.keys: Optional[np.ndarray] = None
+
+    def add(self, key_: bytes) -> None:
+        self._buffer += key_
+
+    def freeze(self) -> np.ndarray:
+        """Sort the ids, return the duplicated keys."""
+        keys = np.sort(np.frombuffer(bytes(self._buffer), dtype='S16'))
+        self._buffer = bytearray()
+        is_duplicate = keys[1:] == keys[:-1]
+        self.keys = keys[np.concatenate([[True], ~is_duplicate])] if len(keys) else keys
+        return np.unique(keys[1:][is_duplicate])
+
+    def contains(self, keys: np.ndarray) -> np.ndarray:
+        """Mask of the keys in the index."""
+        if not len(self.keys):
+            return np.zeros(len(keys), dtype=bool)
+        positions = np.searchsorted(self.keys, keys)
+        positions[positions == len(self.keys)] = 0
+        return self.keys[positions] == keys
+
+    def __len__(self) -> int:
+        return len(self.keys) if self.keys is not None else len(self._buffer) // 16
+
+
+def check_integrity(meta_path: pathlib.Path) -> Iterator[Problem]:
+    """Yield the duplicate ids, dangling references and orphan resources of the ndjson in meta_path."""
+    paths = list(ndjson_paths(meta_path))
+
+    # pass 1, index the ids
+    indexes: dict[str, IdIndex] = defaultdict(IdIndex)
+    first_path = {}
+    for resource_type, path in paths:
+        first_path.setdefault(resource_type, path)
+        with open_ndjson(path, binary=True) as fp:
+            for line_number, line in enumerate(fp, start=1):
+                resource = orjson.loads(line)
+                if resource.get('resourceType') != resource_type:
+                    yield Problem('misplaced', path, line_number, f"{resource.get('resourceType')}/{resource.get('id')} in a {resource_type} file")
+                indexes[resource['resourceType']].add(key(resource['id']))
+    for resource_type, index in indexes.items():
+        for duplicate in index.freeze():
+            yield Problem('duplicate', first_path.get(resource_type, pathlib.Path(meta_path)), None, f"{resource_type}/{to_id(duplicate)} is not unique")
+
+    # pass 2, resolve the references
+    referenced = defaultdict(IdIndex)
+    """Keys of the EXPECTED_REFERRERS' resources that are referred to."""
+    for resource_type, path in paths:
+        pending = defaultdict(list)
+        """(line number, reference) by referred resource type."""
+        with open_ndjson(path, binary=True) as fp:
+            for line_number, line in enumerate(fp, start=1):
+                references = REFERENCE_PATTERN.findall(line)
+                if not references and resource_type not in ROOT_TYPES:
+                    yield Problem('orphan', path, line_number, f"{resource_type} does not refer to any resource")
+                for target_type, id_ in references:
+                    target_type = target_type.decode()
+                    pending[target_type].append((line_number, id_))
+                    if EXPECTED_REFERRERS.get(target_type, None) == resource_type:
+                        referenced[target_type].add(key(id_))
+                if sum(len(_) for _ in pending.values()) >= BATCH_SIZE:
+                    yield from _resolve(path, pending, indexes)
+                    pending = defaultdict(list)
+        yield from _resolve(path, pending, indexes)
+
+    for resource_type, referrer_type in EXPECTED_REFERRERS.items():
+        if resource_type not in indexes:
+            continue
+        referenced[resource_type].freeze()
+        keys = indexes[resource_type].keys
+        for orphan in keys[~referenced[resource_type].contains(keys)]:
+            yield Problem('orphan', first_path[resource_type], None, f"{resource_type}/{to_id(orphan)} is not referred to by a {referrer_type}")
+
+
+def _resolve(path: pathlib.Path, pending: dict[str, list[tuple[int, bytes]]], indexes: dict[str, IdIndex]) -> Iterator[Problem]:
+    """Look up a batch of references, yield the dangling ones."""
+    for target_type, references in pending.items():
+        index = indexes.get(target_type, None)
+        if index is None:
+            found = np.zeros(len(references), dtype=bool)
+        else:
+            found = index.contains(np.array([key(id_) for _, id_ in references], dtype='S16'))
+        for (line_number, id_), ok in zip(references, found):
+            if not ok:
+                yield Problem('dangling', path, line_number, f"{target_type}/{id_.decode()} does not exist")
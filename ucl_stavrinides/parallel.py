@@ -0,0 +1,125 @@
+"""Multi-process transform.
+
+The csv is split into contiguous chunks of whole patients, each chunk is transformed in a process pool
+and the per resource type ndjson of the chunks is merged in input order.
+Ids are minted from content, so the output is identical to a serial run.
+"""
+import logging
+import math
+import pathlib
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import orjson
+import pandas
+
+from g3t_etl.factory import TransformationResults
+from g3t_etl.loader import load_plugins
+from ucl_stavrinides.columnar import read_csv, transform_dataframe
+
+logger = logging.getLogger(__name__)
+
+CHUNKS_PER_WORKER = 4
+"""Smaller chunks balance the load across workers."""
+
+
+def patient_chunks(ids: pandas.Series, chunk_size: int) -> list[tuple[int, int]]:
+    """Split rows into contiguous [start, stop) ranges of at least chunk_size rows, a patient's rows are never split.
+
+    Rows are grouped by the patient prefix of their id, see split_id.
+    """
+    row_count = len(ids)
+    if row_count == 0:
+        return []
+    patients = ids.fillna('').astype(str).str.split('_', n=1).str[0].to_numpy()
+    positions = pandas.Series(np.arange(row_count), index=patients)
+    last_row = positions.groupby(level=0).max().reindex(patients).to_numpy()
+    # a chunk can end after row i if no patient seen so far has rows after i
+    reach = np.maximum.accumulate(last_row)
+    chunks = []
+    start = 0
+    for stop in np.flatnonzero(reach == np.arange(row_count)) + 1:
+        if stop - start >= chunk_size or stop == row_count:
+            chunks.append((start, int(stop)))
+            start = int(stop)
+    return chunks
+
+
+def _initialize_worker(plugins: list[str]) -> None:
+    """Register the transformer in the worker process."""
+    load_plugins(plugins)
+
+
+def _transform_chunk(df: pandas.DataFrame, output_path: pathlib.Path, input_path: pathlib.Path,
+                     validate_columns: bool, verbose: bool) -> TransformationResults:
+    """Transform a chunk of rows into its own directory."""
+    output_path.mkdir(parents=True, exist_ok=True)
+    return transform_dataframe(df.reset_index(drop=True), output_path, verbose=verbose, input_path=input_path,
+                               validate_columns=validate_columns)
+
+
+def transform_csv_parallel(input_path: pathlib.Path,
+                           output_path: pathlib.Path,
+                           workers: int,
+                           validate_columns: bool = True,
+                           verbose: bool = False,
+                           chunk_size: int = None,
+                           exclude_zones: bool = False) -> TransformationResults:
+    """Transform a CSV file to FHIR using a pool of worker processes.
+
+    If validate_columns is False, every row is validated and transformed by pydantic, see transform_dataframe.
+    If exclude_zones, the SV rows are dropped, see read_csv.
+    """
+    output_path = pathlib.Path(output_path)
+    df = read_csv(input_path, exclude_zones=exclude_zones)
+    if not chunk_size:
+        chunk_size = max(math.ceil(len(df) / (workers * CHUNKS_PER_WORKER)), 1)
+    chunks = patient_chunks(df['id'], chunk_size) if 'id' in df.columns else [(0, len(df))]
+
+    work_path = pathlib.Path(tempfile.mkdtemp(prefix='.chunks-', dir=output_path))
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_initialize_worker,
+                                 initargs=(['ucl_stavrinides.transformer'],)) as executor:
+            futures = [
+                executor.submit(_transform_chunk, df.iloc[start:stop], work_path / f"{index:05d}", input_path,
+                                validate_columns, verbose)
+                for index, (start, stop) in enumerate(chunks)
+            ]
+            # raise the first error, as a serial run would
+            chunk_results = [_.result() for _ in futures]
+
+        chunk_paths = [work_path / f"{index:05d}" for index in range(len(chunks))]
+        emitted_count = merge_ndjson(chunk_paths, output_path)
+    finally:
+        shutil.rmtree(work_path, ignore_errors=True)
+
+    return TransformationResults(
+        parsed_count=sum(_.parsed_count for _ in chunk_results),
+        emitted_count=emitted_count,
+        validation_errors=[e for _ in chunk_results for e in _.validation_errors],
+        transformer_errors=[e for _ in chunk_results for e in _.transformer_errors]
+    )
+
+
+def merge_ndjson(chunk_paths: list[pathlib.Path], output_path: pathlib.Path) -> int:
+    """Concatenate each resource type's ndjson in chunk order, skip resources already written. Returns lines written."""
+    resource_types = sorted({_.stem for chunk_path in chunk_paths for _ in chunk_path.glob('*.ndjson')})
+    emitted_count = 0
+    for resource_type in resource_types:
+        already_seen = set()
+        with open(output_path / f"{resource_type}.ndjson", 'w') as fp:
+            for chunk_path in chunk_paths:
+                path = chunk_path / f"{resource_type}.ndjson"
+                if not path.exists():
+                    continue
+                with open(path) as chunk:
+                    for line in chunk:
+                        id_ = orjson.loads(line)['id']
+                        if id_ in already_seen:
+                            continue
+                        already_seen.add(id_)
+                        fp.write(line)
+                        emitted_count += 1
+    return emitted_count
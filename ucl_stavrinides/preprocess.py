@@ -0,0 +1,107 @@
+"""Vectorized cleaning of a csv delivery, column by column rather than cell by cell.
+
+A drop in replacement for the `df.map(lambda x: x.strip() ...)` and `df.replace({np.nan: None})` of
+g3t_etl.factory.transform_csv. The rules are applied in order, each reports the rows it dropped or changed:
+
+1. whitespace: strip leading and trailing whitespace from strings, e.g. 'focal ',
+2. null: map the null tokens ('nan', 'NULL', 'N/A' ...) left after stripping to missing,
+3. excluded: if exclude_zones, drop the rows whose zone is SV, see docs/preprocessing_notes.md; off by default, as
+   g3t_etl.factory.transform_csv transforms every row,
+4. coerced: parse the strings of int and float Submission fields to numbers, a value that does not parse is kept
+   for pydantic to report.
+
+streaming.iter_records applies the same rules to one row at a time.
+"""
+import logging
+from typing import Mapping, NamedTuple
+
+import numpy as np
+import pandas
+from pandas.api.types import infer_dtype, is_object_dtype, is_string_dtype
+from pydantic.fields import FieldInfo
+
+from ucl_stavrinides.submission import Submission
+from ucl_stavrinides.templates import python_type
+
+logger = logging.getLogger(__name__)
+
+RULES = ('whitespace', 'null', 'excluded', 'coerced')
+
+NULL_TOKENS = frozenset([
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN', '<NA>',
+    'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'
+])
+"""Values read as None, the same as pandas.read_csv defaults."""
+
+EXCLUDED_ZONES = frozenset(['SV'])
+"""Rows sampled from these zones (seminal vesicles) are excluded, compared case insensitively."""
+
+
+class PreprocessResults(NamedTuple):
+    """The cleaned rows, and the number of rows each rule dropped or changed."""
+    df: pandas.DataFrame
+    row_counts: dict[str, int]
+
+
+def is_excluded(record: Mapping) -> bool:
+    """Is the row excluded, see EXCLUDED_ZONES."""
+    zone = record.get('zone', None)
+    return isinstance(zone, str) and zone.strip().upper() in EXCLUDED_ZONES
+
+
+def excluded_rows(df: pandas.DataFrame) -> np.ndarray:
+    """Mask of the excluded rows, see EXCLUDED_ZONES."""
+    if 'zone' not in df.columns or not _strings(df['zone']):
+        return np.zeros(len(df), dtype=bool)
+    return df['zone'].str.strip().str.upper().isin(EXCLUDED_ZONES).to_numpy()
+
+
+def _strings(series: pandas.Series) -> bool:
+    """Does the column hold strings, infer_dtype scans the column in C."""
+    return (is_object_dtype(series) or is_string_dtype(series)) and infer_dtype(series, skipna=True) in ('string', 'mixed', 'mixed-integer')
+
+
+def preprocess(df: pandas.DataFrame, model_fields: dict[str, FieldInfo] = Submission.model_fields,
+               exclude_zones: bool = False) -> PreprocessResults:
+    """Apply the RULES to the rows of a csv read by pandas.read_csv, the columns are named as in the csv."""
+    df = df.copy(deep=False)
+    row_count = len(df)
+    changed = {rule: np.zeros(row_count, dtype=bool) for rule in RULES}
+    field_types = {(field_info.alias or field): python_type(field_info) for field, field_info in model_fields.items()}
+
+    for column in df.columns:
+        series = df[column]
+        if not _strings(series):
+            continue
+        notna = series.notna()
+        stripped = series.str.strip()
+        # .str yields NaN for the values that are not strings, keep them
+        stripped = stripped.where(stripped.notna() | ~notna, series)
+        changed['whitespace'] |= (notna & (stripped != series)).to_numpy()
+        is_null = stripped.isin(NULL_TOKENS)
+        changed['null'] |= is_null.to_numpy()
+        stripped = stripped.mask(is_null, np.nan)
+
+        if field_types.get(column, str) is not str:
+            numbers = pandas.to_numeric(stripped, errors='coerce')
+            parsed = numbers.notna() & stripped.notna()
+            changed['coerced'] |= parsed.to_numpy()
+            if (parsed | stripped.isna()).all():
+                stripped = numbers
+            else:
+                stripped = stripped.where(~parsed, numbers)
+        df[column] = stripped
+
+    if exclude_zones:
+        changed['excluded'] = excluded_rows(df)
+    if changed['excluded'].any():
+        df = df[~changed['excluded']].reset_index(drop=True)
+
+    row_counts = {rule: int(mask.sum()) for rule, mask in changed.items()}
+    logger.debug(f"preprocessed {row_count} rows {row_counts}")
+    return PreprocessResults(df=df, row_counts=row_counts)
+
+
+def records(df: pandas.DataFrame) -> list[dict]:
+    """The rows as dicts keyed on csv column, missing values as None, for pydantic."""
+    return df.astype(object).where(df.notna(), None).to_dict(orient='records')
@@ -0,0 +1,64 @@
+"""Compact, slots only records of submission rows, a fast path around the pydantic Submission.
+
+A row validated by pydantic costs a model with a __dict__, a fields set and the validation of every field, and
+SimpleTransformer is re-created per row. The trusted engine only needs the values: `SubmissionRecord.from_record`
+checks the type of each value against the per field tables generated by ucl_stavrinides.codegen, with the same
+int/float coercions as pydantic. A row that does not fit raises RecordError, it is then validated by Submission,
+which reports the error.
+"""
+from typing import Any, Mapping, Optional
+
+from ucl_stavrinides.simple_transformer import ParsedID, split_id
+
+
+class RecordError(ValueError):
+    """A value does not fit its field, validate the row with Submission to report it."""
+
+
+def _convert(value: Any, field_type: type, column: str) -> int | float | str:
+    """Coerce a value of another type, as pydantic would in lax mode."""
+    if field_type is float and type(value) is int:
+        return float(value)
+    if field_type is int and type(value) is float and value.is_integer():
+        return int(value)
+    raise RecordError(f"{column}: {value!r} is not a {field_type.__name__}")
+
+
+class Record:
+    """Base of the generated records, the subclass defines a slot per field and the _fields, _columns and _types tables."""
+    __slots__ = ()
+    _fields: tuple[str, ...] = ()
+    _columns: tuple[str, ...] = ()
+    _types: tuple[type, ...] = ()
+
+    @classmethod
+    def from_record(cls, record: Mapping[str, Any]) -> 'Record':
+        """A record of a row keyed on csv column (see streaming.iter_records), raise RecordError if a value does not fit."""
+        values = []
+        for column, field_type in zip(cls._columns, cls._types):
+            value = record.get(column, None)
+            if value is not None and type(value) is not field_type:
+                value = _convert(value, field_type, column)
+            values.append(value)
+        return cls(*values)
+
+    @property
+    def deconstructed_id(self) -> Optional[ParsedID]:
+        """Deconstruct the ID, parsed ids are cached, see parse_id."""
+        return split_id(self.id)
+
+    @property
+    def present_fields(self) -> frozenset[str]:
+        """The fields set in this row, see templates.present_fields."""
+        return frozenset([field for field in self._fields if getattr(self, field)])
+
+    def as_dict(self, by_alias: bool = False) -> dict[str, Any]:
+        """The values by field name, or by csv column."""
+        return dict(zip(self._columns if by_alias else self._fields, (getattr(self, _) for _ in self._fields)))
+
+    def __eq__(self, other: Any) -> bool:
+        return type(other) is type(self) and all(getattr(self, _) == getattr(other, _) for _ in self._fields)
+
+    def __repr__(self) -> str:
+        values = ', '.join(f"{field}={getattr(self, field)!r}" for field in self._fields if getattr(self, field) is not None)
+        return f"{type(self).__name__}({values})"
@@ -0,0 +1,448 @@
+"""SimpleTransformer, a Submission row to FHIR resources; imported by the plugin only when a row is transformed."""
+import functools
+import logging
+import re
+import sys
+from collections import OrderedDict
+from typing import Any, ClassVar, NamedTuple, Optional
+
+from fhir.resources.condition import Condition
+from fhir.resources.identifier import Identifier
+from fhir.resources.observation import Observation
+from fhir.resources.patient import Patient
+from fhir.resources.procedure import Procedure
+from fhir.resources.quantity import Quantity
+from fhir.resources.reference import Reference
+from fhir.resources.researchstudy import ResearchStudy
+from fhir.resources.researchsubject import ResearchSubject
+from fhir.resources.resource import Resource
+from fhir.resources.specimen import Specimen
+from pydantic import BaseModel, computed_field
+
+from g3t_etl import factory
+from g3t_etl.factory import FHIRTransformer
+from ucl_stavrinides.categories import categorical_fields, category
+from ucl_stavrinides.instrumentation import Instrumentation
+from ucl_stavrinides.submission import Submission
+from ucl_stavrinides.templates import compiled_condition, present_fields, present_templates
+
+logger = logging.getLogger(__name__)
+
+PATIENT_CACHE_SIZE = 1024
+"""Maximum number of patients whose shared resources are kept in memory."""
+
+IDENTIFIER_CACHE_SIZE = 1 << 16
+"""Maximum number of minted identifiers, and of references, kept in memory."""
+
+
+class DeconstructedID(BaseModel):
+    """Split the id into component parts."""
+    patient_id: str
+    mri_area: Optional[int] = None
+    time_points: Optional[list[str]] = None
+    tissue_block: Optional[int] = None
+
+
+class ParsedID(NamedTuple):
+    """Split the id into component parts, a lightweight, immutable DeconstructedID."""
+    patient_id: str
+    mri_area: Optional[int]
+    time_points: tuple[str, ...]
+    tissue_block: Optional[int]
+
+
+ID_PATTERN = re.compile(
+    r"^(?P<patient_id>[^_]+)_(?P<mri_area>[^_]+)_(?P<time_points>[AB][0-9]*(?:_[AB][0-9]*)*)(?:_(?P<tissue_block>[^_]+))?$"
+)
+"""XXX_Y_Z_H, see split_id. A time point may carry a cluster number e.g. A1, A2."""
+
+ID_CACHE_SIZE = 1 << 16
+"""Maximum number of parsed ids kept in memory."""
+
+
+@functools.lru_cache(maxsize=ID_CACHE_SIZE)
+def parse_id(id_str: str) -> None | ParsedID:
+    """Parse the id, see split_id. Results are cached by id."""
+    match = ID_PATTERN.match(id_str)
+    if not match:
+        return None
+    patient_id, mri_area, time_points, tissue_block = match.groups()
+    try:
+        return ParsedID(
+            patient_id=patient_id,
+            mri_area=int(mri_area),
+            time_points=tuple(time_points.split("_")),
+            tissue_block=int(tissue_block) if tissue_block else None
+        )
+    except ValueError:
+        # let pydantic report the component that is not a number
+        DeconstructedID(patient_id=patient_id, mri_area=mri_area, time_points=time_points.split("_"),
+                        tissue_block=tissue_block if tissue_block else None)
+        raise
+
+
+def split_id(id_str, validate: bool = False) -> None | ParsedID | DeconstructedID:
+    """Format: XXX_Y_Z_H, where:
+    XXX is patient ID,
+    Y is the MRI area number,
+    Z are the time points (A or B, optionally followed by a cluster number e.g. A1), which may occur multiple times,
+    H is the tissue block number in case of multiple biopsy blocks per area
+
+    Returns None if the id does not match, a validated DeconstructedID if `validate` is set.
+    """
+    parsed_id = parse_id(id_str)
+    if parsed_id and validate:
+        return DeconstructedID(**parsed_id._asdict())
+    return parsed_id
+
+
+def lesion_identifier(deconstructed_id: ParsedID | DeconstructedID) -> str:
+    """The MRI area, time points and tissue block of the id, identifies the biopsy Procedure of a patient."""
+    time_points = '_'.join(deconstructed_id.time_points)
+    _ = f"{deconstructed_id.mri_area}_{time_points}"
+    if deconstructed_id.tissue_block:
+        _ += f"_{deconstructed_id.tissue_block}"
+    return _
+
+
+class PatientGroup(NamedTuple):
+    """Resources shared by all rows (specimens) of a patient."""
+    patient: Patient
+    condition: Condition
+    research_subject: Optional[ResearchSubject]
+    condition_observations: list[Observation]
+    pending_condition_fields: set[str]
+    """Condition fields that were empty in the rows seen so far, a later row may provide their observation."""
+
+
+class PatientGroupCache:
+    """Bounded LRU of PatientGroup, keyed on patient_id.
+
+    The cache is scoped to a single research study instance, i.e. a single call to transform_csv;
+    it is cleared whenever a different research study is passed in.
+    """
+
+    def __init__(self, maxsize: int = PATIENT_CACHE_SIZE) -> None:
+        self.maxsize = maxsize
+        self._research_study = None
+        self._groups: OrderedDict[str, PatientGroup] = OrderedDict()
+
+    def get(self, patient_id: str, research_study: ResearchStudy) -> None | PatientGroup:
+        """Return the group for this patient, None if not seen in this research study."""
+        if research_study is not self._research_study:
+            self.clear()
+            self._research_study = research_study
+            return None
+        group = self._groups.get(patient_id, None)
+        if group:
+            self._groups.move_to_end(patient_id)
+        return group
+
+    def put(self, patient_id: str, group: PatientGroup) -> None:
+        """Save the group, evict the least recently used patient if full."""
+        self._groups[patient_id] = group
+        self._groups.move_to_end(patient_id)
+        if len(self._groups) > self.maxsize:
+            self._groups.popitem(last=False)
+
+    def clear(self) -> None:
+        """Forget all patients."""
+        self._groups.clear()
+        self._research_study = None
+
+
+class IdentifierCache:
+    """Bounded LRUs of minted (Identifier, id), keyed on (resource_type, system, value), and of References, keyed on RESOURCE/id.
+
+    The cache is scoped to a single helper, i.e. a single project; it is cleared whenever a different helper is passed in.
+    """
+
+    def __init__(self, maxsize: int = IDENTIFIER_CACHE_SIZE) -> None:
+        self.maxsize = maxsize
+        self._helper = None
+        self._identifiers: OrderedDict[tuple[str, str, str], tuple[Identifier, str]] = OrderedDict()
+        self._references: OrderedDict[str, Reference] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def identify(self, helper: factory.TransformerHelper, resource_type: str, value: str, cache: bool = True) -> tuple[Identifier, str]:
+        """Return the official Identifier of value, and the id minted from it for resource_type.
+
+        Set cache to False for values unique to a row (e.g. the Specimen), they would only evict shared values.
+        """
+        if not cache:
+            identifier = helper.populate_identifier(value=value)
+            return identifier, helper.mint_id(identifier=identifier, resource_type=resource_type)
+        if helper is not self._helper:
+            self.clear()
+            self._helper = helper
+        key = (resource_type, helper.system, value)
+        _ = self._identifiers.get(key, None)
+        if _:
+            self.hits += 1
+            self._identifiers.move_to_end(key)
+            return _
+        self.misses += 1
+        identifier = helper.populate_identifier(value=value)
+        _ = self._identifiers[key] = (identifier, helper.mint_id(identifier=identifier, resource_type=resource_type))
+        self._evict(self._identifiers)
+        return _
+
+    def to_reference(self, resource: Resource) -> Reference:
+        """Return the Reference of the form RESOURCE/id."""
+        key = f"{resource.resource_type}/{resource.id}"
+        reference = self._references.get(key, None)
+        if reference:
+            self.hits += 1
+            self._references.move_to_end(key)
+            return reference
+        self.misses += 1
+        reference = self._references[key] = Reference(reference=key)
+        self._evict(self._references)
+        return reference
+
+    def _evict(self, entries: OrderedDict) -> None:
+        if len(entries) > self.maxsize:
+            entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        """Forget all identifiers and references, keep the stats."""
+        self._identifiers.clear()
+        self._references.clear()
+        self._helper = None
+
+    def __len__(self) -> int:
+        return len(self._identifiers) + len(self._references)
+
+    def __repr__(self) -> str:
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups * 100 if lookups else 0
+        return (f"IdentifierCache(identifiers={len(self._identifiers)}, references={len(self._references)}, maxsize={self.maxsize}, "
+                f"hits={self.hits}, misses={self.misses}, hit_rate={hit_rate:.1f}%, evictions={self.evictions})")
+
+
+class SimpleTransformer(Submission, FHIRTransformer):
+    """Performs the most simple transformation possible."""
+
+    group_by_patient: ClassVar[bool] = True
+    """Build Patient, ResearchSubject, Condition and Condition observations once per patient, not once per row."""
+    patient_groups: ClassVar[PatientGroupCache] = PatientGroupCache()
+    use_observation_templates: ClassVar[bool] = True
+    """Create observations from the templates compiled (or loaded from .g3t/state) on first use, not from each field's json_schema_extra."""
+    instrumentation: ClassVar[Instrumentation] = Instrumentation()
+    """Per stage timers, disabled by default, see ucl_stavrinides.instrumentation."""
+    identifiers: ClassVar[IdentifierCache] = IdentifierCache()
+    """Identifiers, ids and references repeated across rows, e.g. every row of a patient refers to the same Patient."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:  # noqa
+        """Initialize the transformer, initialize the dictionary and the helper class."""
+        Submission.__init__(self, **kwargs, )
+        FHIRTransformer.__init__(self, **kwargs, )
+
+    @computed_field
+    @functools.cached_property
+    def deconstructed_id(self) -> Optional[ParsedID]:
+        """Deconstruct the ID, once per row."""
+        return split_id(self.id)
+
+    @functools.cached_property
+    def present_fields(self) -> frozenset[str]:
+        """The fields set in this row, once per row, shared by the Specimen's and the Condition's observations."""
+        return present_fields(self.__dict__)
+
+    @classmethod
+    def template_condition(cls, subject: Reference | dict) -> Condition:
+        """Create a generic prostate cancer condition, a copy of the one validated on first use."""
+        return compiled_condition(subject)
+
+    def identify(self, value: str, resource_type: str, cache: bool = True) -> tuple[Identifier, str]:
+        """The official Identifier of value, and the id of the resource_type with that identifier, see IdentifierCache."""
+        return self.identifiers.identify(self._helper, resource_type, value, cache=cache)
+
+    def to_reference(self, resource: Resource) -> Reference:
+        """Create a reference of the form RESOURCE/id, shared by all rows referring to the resource."""
+        return self.identifiers.to_reference(resource)
+
+    def transform(self, research_study: ResearchStudy = None) -> list[Resource]:
+        """Plugin manager will call this function to transform the data to FHIR."""
+        with self.instrumentation.row(self.id) as row_resources:
+            resources = self._to_fhir(self.deconstructed_id, research_study=research_study)
+            if row_resources is not None:
+                row_resources.extend(resources)
+        return resources
+
+    def _to_fhir(self, deconstructed_id: ParsedID, research_study: ResearchStudy) -> [Resource]:
+        """Convert to FHIR.
+
+        The Patient, ResearchSubject, Condition and the Condition's observations are shared by all rows of a patient,
+        when `group_by_patient` is set they are only created (and returned) for the first row of each patient.
+        """
+        group = None
+        if self.group_by_patient:
+            group = self.patient_groups.get(deconstructed_id.patient_id, research_study)
+        is_new_patient = group is None
+        if is_new_patient:
+            group = self._patient_group(deconstructed_id, research_study)
+        patient = group.patient
+
+        exception_msg_part = None
+        try:
+
+            exception_msg_part = 'Procedure'
+            with self.instrumentation.stage(exception_msg_part):
+                identifier, id_ = self.identify(f"{deconstructed_id.patient_id}/{lesion_identifier(deconstructed_id)}", 'Procedure')
+                procedure = Procedure(id=id_,
+                                      identifier=[identifier],
+                                      status="completed",
+                                      subject=self.to_reference(patient))
+                procedure.code = self.populate_codeable_concept(system="http://snomed.info/sct", code="312250003",
+                                                                display="Magnetic resonance imaging")
+
+            exception_msg_part = 'Specimen'
+            with self.instrumentation.stage(exception_msg_part):
+                identifier, id_ = self.identify(f"{self.id}", 'Specimen', cache=False)
+                specimen = Specimen(id=id_,
+                                    identifier=[identifier],
+                                    collection={'procedure': self.to_reference(procedure)},
+                                    subject=self.to_reference(patient))
+
+            # TODO confirm these fields as Observations of the Specimen
+            specimen_observations = self.create_observations(subject=patient, focus=specimen)
+
+        except Exception as e:
+            print(f"Error transforming {self.id} to {exception_msg_part}: {e}", file=sys.stderr)
+            raise e
+
+        if not is_new_patient:
+            # the patient's shared resources were emitted with an earlier row
+            return [specimen, procedure] + specimen_observations + self._pending_condition_observations(group)
+
+        if self.group_by_patient:
+            self.patient_groups.put(deconstructed_id.patient_id, group)
+
+        patient_graph = [patient, specimen, procedure, group.condition]
+        if research_study and group.research_subject:
+            patient_graph.append(group.research_subject)
+
+        return patient_graph + specimen_observations + group.condition_observations
+
+    def _patient_group(self, deconstructed_id: ParsedID, research_study: ResearchStudy) -> PatientGroup:
+        """Create the resources shared by all rows of a patient."""
+        exception_msg_part = None
+        research_subject = None
+        try:
+
+            exception_msg_part = 'Patient'
+            with self.instrumentation.stage(exception_msg_part):
+                identifier, id_ = self.identify(deconstructed_id.patient_id, 'Patient')
+                patient = Patient(id=id_,
+                                  identifier=[identifier],
+                                  active=True)
+
+            if research_study:
+                exception_msg_part = 'ResearchSubject'
+                with self.instrumentation.stage(exception_msg_part):
+                    identifier, id_ = self.identify(deconstructed_id.patient_id, 'ResearchSubject')
+                    research_subject = ResearchSubject(
+                        id=id_,
+                        identifier=[identifier],
+                        status="active",
+                        study={'reference': f"ResearchStudy/{research_study.id}"},
+                        subject={'reference': f"Patient/{patient.id}"}
+                    )
+
+            exception_msg_part = 'Condition'
+            with self.instrumentation.stage(exception_msg_part):
+                condition = self.template_condition(subject=self.to_reference(patient))
+                identifier, condition.id = self.identify(f"{deconstructed_id.patient_id}/{condition.code.text}", 'Condition')
+                condition.identifier = [identifier]
+                condition.onsetAge = self.to_quantity(field="ageDiagM", field_info=self.model_fields['ageDiagM'])
+
+            condition_observations = self.create_observations(subject=patient, focus=condition)
+
+        except Exception as e:
+            print(f"Error transforming {self.id} to {exception_msg_part}: {e}", file=sys.stderr)
+            raise e
+
+        pending_condition_fields = set(self.condition_fields()) - {self._observation_field(_) for _ in condition_observations}
+        return PatientGroup(patient=patient, condition=condition, research_subject=research_subject,
+                            condition_observations=condition_observations,
+                            pending_condition_fields=pending_condition_fields)
+
+    def _pending_condition_observations(self, group: PatientGroup) -> list[Observation]:
+        """Create observations for Condition fields empty in the patient's earlier rows, but set in this row."""
+        fields = group.pending_condition_fields & self.present_fields
+        if not fields:
+            return []
+        try:
+            observations = self.create_observations(subject=group.patient, focus=group.condition)
+        except Exception as e:
+            print(f"Error transforming {self.id} to Condition: {e}", file=sys.stderr)
+            raise e
+        group.pending_condition_fields.difference_update(fields)
+        return [_ for _ in observations if self._observation_field(_) in fields]
+
+    def create_observations(self, subject: Resource, focus: Resource) -> list[Observation]:
+        """Create observations from the compiled templates, only the id, identifier, subject, focus and value are set per row.
+
+        Equivalent to FHIRTransformer.create_observations.
+        """
+        with self.instrumentation.stage(f"Observation({focus.resource_type})"):
+            return self._create_observations(subject=subject, focus=focus)
+
+    def _create_observations(self, subject: Resource, focus: Resource) -> list[Observation]:
+        if not self.use_observation_templates:
+            return self._categorize(FHIRTransformer.create_observations(self, subject=subject, focus=focus))
+        observations = []
+        subject_identifier = self._helper.get_official_identifier(subject).value
+        focus_identifier = self._helper.get_official_identifier(focus).value
+        subject_reference = self.to_reference(subject)
+        focus_reference = self.to_reference(focus)
+        # a Specimen's observations are unique to the row, a Condition's are shared by the rows of the patient
+        cache = focus.resource_type != 'Specimen'
+        for template in present_templates(focus.resource_type, self.present_fields):
+            value = getattr(self, template.field)
+            identifier, id_ = self.identify(f"{subject_identifier}-{focus_identifier}-{template.field}", 'Observation', cache=cache)
+            update = {
+                'id': id_,
+                'identifier': [identifier],
+                'subject': subject_reference,
+                'focus': [focus_reference],
+            }
+            if template.value_type == 'valueQuantity':
+                update['valueQuantity'] = Quantity(**self.to_quantity(template.field, self.model_fields[template.field]))
+            elif template.value_type == 'valueCodeableConcept':
+                category_ = category(template.field, value)
+                update['valueCodeableConcept'] = category_.concept
+                update['component'] = category_.components
+            else:
+                update[template.value_type] = value
+            observations.append(template.observation.copy(update=update))
+        return observations
+
+    def _categorize(self, observations: list[Observation]) -> list[Observation]:
+        """Replace the valueString of the categorical fields' observations with their interned CodeableConcept."""
+        fields = categorical_fields()
+        for index, observation in enumerate(observations):
+            field = self._observation_field(observation)
+            if field in fields and observation.valueString is not None:
+                category_ = category(field, observation.valueString)
+                observations[index] = observation.copy(update={
+                    'valueString': None,
+                    'valueCodeableConcept': category_.concept,
+                    'component': category_.components,
+                })
+        return observations
+
+    @classmethod
+    def condition_fields(cls) -> list[str]:
+        """Names of the fields that are observations of the Condition."""
+        return [field for field, field_info in cls.model_fields.items()
+                if field_info.json_schema_extra and field_info.json_schema_extra.get('observation_subject', None) == 'Condition']
+
+    @staticmethod
+    def _observation_field(observation: Observation) -> str:
+        """The submission field an observation was created from."""
+        return observation.code.coding[0].code
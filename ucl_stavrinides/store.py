@@ -0,0 +1,241 @@
+"""Load the ndjson in META into a local SQLite database, for indexed lookups in place of `jq` scans.
+
+Tables, each indexed for its lookups:
+- resources: every resource's json by id,
+- identifiers: identifier value -> resource, e.g. a specimen identifier to its minted id,
+- refs: every literal reference, by referring resource and by target,
+- observations: code (the Submission field), subject, focus and value of every Observation,
+- files: the hash of each loaded file.
+
+The specimen_fields view is wide, one row per Specimen and one column per Submission field, e.g.
+`SELECT id FROM specimen_fields WHERE pirads >= 4 AND gleason = '4+3'`.
+
+Loading is incremental, a file (or shard) is re-loaded only if its hash changed, the rows of removed files are deleted.
+"""
+import logging
+import pathlib
+import sqlite3
+from typing import Any, Iterator, NamedTuple, Optional
+
+import orjson
+
+from ucl_stavrinides.extract import file_hash
+from ucl_stavrinides.integrity import ndjson_paths
+from ucl_stavrinides.submission import Submission
+from ucl_stavrinides.writers import open_ndjson
+
+logger = logging.getLogger(__name__)
+
+STATE_PATH = pathlib.Path('.g3t/state')
+"""Where the database is kept by default, see also ucl_stavrinides.incremental."""
+
+DATABASE_NAME = 'ucl_stavrinides-meta.sqlite'
+
+BATCH_SIZE = 10_000
+"""Rows inserted at a time."""
+
+TABLES = ['resources', 'identifiers', 'refs', 'observations']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (name TEXT PRIMARY KEY, hash TEXT NOT NULL, resource_count INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS resources (id TEXT PRIMARY KEY, resource_type TEXT NOT NULL, file TEXT NOT NULL, json TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS identifiers (value TEXT NOT NULL, system TEXT, resource_type TEXT NOT NULL, id TEXT NOT NULL, file TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS refs (id TEXT NOT NULL, resource_type TEXT NOT NULL, element TEXT NOT NULL,
+                                 target_type TEXT NOT NULL, target_id TEXT NOT NULL, file TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS observations (id TEXT PRIMARY KEY, code TEXT, subject_id TEXT, focus_type TEXT, focus_id TEXT,
+                                         value, file TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS resources_type ON resources (resource_type);
+CREATE INDEX IF NOT EXISTS resources_file ON resources (file);
+CREATE INDEX IF NOT EXISTS identifiers_value ON identifiers (value);
+CREATE INDEX IF NOT EXISTS identifiers_id ON identifiers (id);
+CREATE INDEX IF NOT EXISTS identifiers_file ON identifiers (file);
+CREATE INDEX IF NOT EXISTS refs_id ON refs (id, element);
+CREATE INDEX IF NOT EXISTS refs_target ON refs (target_id, resource_type);
+CREATE INDEX IF NOT EXISTS refs_file ON refs (file);
+CREATE INDEX IF NOT EXISTS observations_code ON observations (code, value);
+CREATE INDEX IF NOT EXISTS observations_focus ON observations (focus_id, code);
+CREATE INDEX IF NOT EXISTS observations_subject ON observations (subject_id, code);
+CREATE INDEX IF NOT EXISTS observations_file ON observations (file);
+"""
+
+
+class LoadResults(NamedTuple):
+    """Files loaded, skipped because unchanged and removed, and the resources loaded."""
+    loaded_count: int
+    skipped_count: int
+    removed_count: int
+    resource_count: int
+
+
+def _column(field: str) -> str:
+    return '"' + field.replace('"', '""') + '"'
+
+
+def specimen_fields_view(model_fields: dict = Submission.model_fields) -> str:
+    """The wide view of the Specimens, one column per Submission field.
+
+    id is the Specimen's identifier, ageDiagM the onset of the patient's Condition; the other fields are the values
+    of the Observations of the Specimen, or of the patient's Condition.
+    """
+    columns = []
+    pivots = {'Specimen': [], 'Condition': []}
+    for field, field_info in model_fields.items():
+        focus = (field_info.json_schema_extra or {}).get('observation_subject', None)
+        if field == 'id':
+            columns.append(f"(SELECT value FROM identifiers WHERE identifiers.id = specimen.id LIMIT 1) AS {_column(field)}")
+        elif field == 'ageDiagM':
+            columns.append("(SELECT json_extract(condition.json, '$.onsetAge.value') FROM refs JOIN resources condition ON condition.id = refs.id "
+                           "WHERE refs.target_id = subject.target_id AND refs.resource_type = 'Condition' AND refs.element = 'subject' LIMIT 1) "
+                           f"AS {_column(field)}")
+        elif focus in pivots:
+            pivots[focus].append(f"MAX(CASE code WHEN '{field}' THEN value END) AS {_column(field)}")
+            columns.append(f"{focus.lower()}_values.{_column(field)}")
+        else:
+            columns.append(f"NULL AS {_column(field)}")
+    return f"""
+CREATE VIEW specimen_fields AS
+WITH specimen_values AS (
+    SELECT focus_id, {', '.join(pivots['Specimen']) or 'NULL'} FROM observations WHERE focus_type = 'Specimen' GROUP BY focus_id
+), condition_values AS (
+    SELECT subject_id, {', '.join(pivots['Condition']) or 'NULL'} FROM observations WHERE focus_type = 'Condition' GROUP BY subject_id
+)
+SELECT specimen.id AS specimen_id, subject.target_id AS patient_id, {', '.join(columns)}
+FROM resources specimen
+LEFT JOIN refs subject ON subject.id = specimen.id AND subject.element = 'subject'
+LEFT JOIN specimen_values ON specimen_values.focus_id = specimen.id
+LEFT JOIN condition_values ON condition_values.subject_id = subject.target_id
+WHERE specimen.resource_type = 'Specimen'
+"""
+
+
+def connect(database_path: pathlib.Path) -> sqlite3.Connection:
+    """Open the database, create the tables, indexes and view if needed."""
+    database_path = pathlib.Path(database_path)
+    database_path.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(database_path)
+    connection.execute('PRAGMA journal_mode = WAL')
+    connection.executescript(SCHEMA)
+    connection.execute('DROP VIEW IF EXISTS specimen_fields')
+    connection.execute(specimen_fields_view())
+    connection.commit()
+    return connection
+
+
+def references(resource: dict) -> Iterator[tuple[str, str, str]]:
+    """(top level element, target type, target id) of each literal reference of a resource."""
+    for element, value in resource.items():
+        stack = [value]
+        while stack:
+            value = stack.pop()
+            if isinstance(value, dict):
+                reference = value.get('reference', None)
+                if isinstance(reference, str) and '/' in reference and '?' not in reference:
+                    target_type, target_id = reference.split('/', 1)
+                    yield element, target_type, target_id
+                stack.extend(_ for _ in value.values() if isinstance(_, (dict, list)))
+            elif isinstance(value, list):
+                stack.extend(_ for _ in value if isinstance(_, (dict, list)))
+
+
+def observation_value(observation: dict) -> Any:
+    """The value of an Observation: a number, a CodeableConcept's text or a string."""
+    for key, value in observation.items():
+        if not key.startswith('value'):
+            continue
+        if key == 'valueQuantity':
+            return value.get('value', None)
+        if key == 'valueCodeableConcept':
+            return value.get('text', None) or next(iter(_.get('code') for _ in value.get('coding', [])), None)
+        return value
+    return None
+
+
+def _load_file(connection: sqlite3.Connection, path: pathlib.Path, name: str) -> int:
+    """Insert the resources of a file, in batches; returns the number of resources."""
+    rows = {table: [] for table in TABLES}
+    count = 0
+
+    def flush() -> None:
+        connection.executemany('INSERT OR REPLACE INTO resources VALUES (?, ?, ?, ?)', rows['resources'])
+        connection.executemany('INSERT INTO identifiers VALUES (?, ?, ?, ?, ?)', rows['identifiers'])
+        connection.executemany('INSERT INTO refs VALUES (?, ?, ?, ?, ?, ?)', rows['refs'])
+        connection.executemany('INSERT OR REPLACE INTO observations VALUES (?, ?, ?, ?, ?, ?, ?)', rows['observations'])
+        for _ in rows.values():
+            _.clear()
+
+    with open_ndjson(path, binary=True) as fp:
+        for line in fp:
+            if not line.strip():
+                continue
+            resource = orjson.loads(line)
+            resource_type, id_ = resource['resourceType'], resource['id']
+            rows['resources'].append((id_, resource_type, name, line.decode().rstrip('\n')))
+            for identifier in resource.get('identifier', []):
+                rows['identifiers'].append((identifier.get('value', None), identifier.get('system', None), resource_type, id_, name))
+            refs = list(references(resource))
+            rows['refs'].extend((id_, resource_type, element, target_type, target_id, name) for element, target_type, target_id in refs)
+            if resource_type == 'Observation':
+                code = next(iter(_.get('code', None) for _ in resource.get('code', {}).get('coding', [])), None)
+                subject = next(iter(target_id for element, _, target_id in refs if element == 'subject'), None)
+                focus = next(iter((target_type, target_id) for element, target_type, target_id in refs if element == 'focus'), (None, None))
+                rows['observations'].append((id_, code, subject, *focus, observation_value(resource), name))
+            count += 1
+            if len(rows['resources']) >= BATCH_SIZE:
+                flush()
+    flush()
+    return count
+
+
+def _delete_file(connection: sqlite3.Connection, name: str) -> None:
+    for table in TABLES:
+        connection.execute(f"DELETE FROM {table} WHERE file = ?", (name,))
+    connection.execute('DELETE FROM files WHERE name = ?', (name,))
+
+
+def load_meta(meta_path: pathlib.Path, database_path: pathlib.Path = STATE_PATH / DATABASE_NAME) -> LoadResults:
+    """Load the ndjson files and shards of meta_path into the database, skip the files loaded before and unchanged."""
+    connection = connect(database_path)
+    loaded_count = skipped_count = resource_count = 0
+    try:
+        hashes = dict(connection.execute('SELECT name, hash FROM files'))
+        names = set()
+        for _, path in ndjson_paths(meta_path):
+            name = path.name
+            names.add(name)
+            hash_ = file_hash(path)
+            if hashes.get(name, None) == hash_:
+                skipped_count += 1
+                continue
+            with connection:
+                _delete_file(connection, name)
+                count = _load_file(connection, path, name)
+                connection.execute('INSERT INTO files VALUES (?, ?, ?)', (name, hash_, count))
+            loaded_count += 1
+            resource_count += count
+            logger.info(f"loaded {count} resources of {path}")
+        removed = [name for name in hashes if name not in names]
+        with connection:
+            for name in removed:
+                _delete_file(connection, name)
+        if loaded_count or removed:
+            connection.execute('ANALYZE')
+    finally:
+        connection.close()
+    return LoadResults(loaded_count=loaded_count, skipped_count=skipped_count, removed_count=len(removed), resource_count=resource_count)
+
+
+def query(sql: str, parameters: tuple = (), database_path: pathlib.Path = STATE_PATH / DATABASE_NAME) -> tuple[list[str], list[tuple]]:
+    """Run a query, return the column names and the rows."""
+    connection = sqlite3.connect(f"file:{pathlib.Path(database_path)}?mode=ro", uri=True)
+    try:
+        cursor = connection.execute(sql, parameters)
+        return [_[0] for _ in cursor.description or []], cursor.fetchall()
+    finally:
+        connection.close()
+
+
+def resolve(identifier: str, resource_type: Optional[str] = None, database_path: pathlib.Path = STATE_PATH / DATABASE_NAME) -> list[str]:
+    """The ids of the resources with an identifier, e.g. of a Specimen by its csv id."""
+    sql = 'SELECT id FROM identifiers WHERE value = ?' + (' AND resource_type = ?' if resource_type else '')
+    _, rows = query(sql, (identifier, resource_type) if resource_type else (identifier,), database_path=database_path)
+    return [_[0] for _ in rows]
@@ -0,0 +1,281 @@
+"""Streaming transform, memory grows with the number of patients and Specimens, not with the resources.
+
+csv rows -> SimpleTransformer.transform -> per resource type buffered ndjson writers.
+Only the ids needed for de-duplication are kept, see SeenResources.
+"""
+import csv
+import logging
+import pathlib
+import uuid
+from typing import Any, Iterator, Optional
+
+from fhir.resources.reference import Reference
+from fhir.resources.researchstudy import ResearchStudy
+from fhir.resources.resource import Resource
+from pydantic import ValidationError
+from pydantic.fields import FieldInfo
+from pydantic.v1 import ValidationError as PydanticV1ValidationError
+
+from g3t_etl import print_transformation_error, print_validation_error
+from g3t_etl.factory import RESEARCH_STUDY, TransformationResults, helper
+from ucl_stavrinides.columnar import create_research_study
+from ucl_stavrinides.emission import VALIDATION_RATE, SampledValidator, dumps, render
+from ucl_stavrinides.preprocess import NULL_TOKENS, is_excluded
+from ucl_stavrinides.records import RecordError
+from ucl_stavrinides.simple_transformer import SimpleTransformer
+from ucl_stavrinides.submission import Submission
+from ucl_stavrinides.submission_record import SubmissionRecord
+from ucl_stavrinides.templates import python_type
+from ucl_stavrinides.writers import NdjsonWriters, ShardedNdjsonWriters
+
+logger = logging.getLogger(__name__)
+
+
+def _coerce(value: str, field_type: type) -> Optional[str | int | float]:
+    """Strip a csv value, map null tokens to None and numbers to int or float, as pandas would."""
+    value = value.strip()
+    if value in NULL_TOKENS:
+        return None
+    if field_type is str:
+        return value
+    try:
+        number = float(value)
+    except ValueError:
+        # let pydantic report it
+        return value
+    if field_type is int and number.is_integer():
+        return int(number)
+    return number
+
+
+def iter_records(input_path: pathlib.Path, model_fields: dict[str, FieldInfo] = Submission.model_fields,
+                 exclude_zones: bool = False) -> Iterator[dict]:
+    """Read csv rows one at a time, skip comments and blank lines, coerce values to the field's type.
+
+    The same rules as preprocess.preprocess, one row at a time; if exclude_zones, the excluded rows are skipped.
+    An extract (.parquet) is read as is, its rows were validated by extract_csv.
+    """
+    excluded_count = 0
+    for record in _iter_records(input_path, model_fields):
+        if exclude_zones and is_excluded(record):
+            excluded_count += 1
+            continue
+        yield record
+    if excluded_count:
+        logger.info(f"excluded {excluded_count} rows of {input_path}, see preprocess.EXCLUDED_ZONES")
+
+
+def _iter_records(input_path: pathlib.Path, model_fields: dict[str, FieldInfo]) -> Iterator[dict]:
+    if pathlib.Path(input_path).suffix == '.parquet':
+        from ucl_stavrinides.extract import iter_extract_records
+        yield from iter_extract_records(input_path)
+        return
+    field_types = {(field_info.alias or field): python_type(field_info) for field, field_info in model_fields.items()}
+    with open(input_path, newline='') as fp:
+        lines = (line.split('#', 1)[0] for line in fp)
+        reader = csv.reader((line for line in lines if line.strip()), skipinitialspace=True)
+        header = [_.strip() for _ in next(reader, [])]
+        types = [field_types.get(column, str) for column in header]
+        for row in reader:
+            yield {column: _coerce(value, field_type) for column, value, field_type in zip(header, row, types)}
+
+
+PATIENT_RESOURCE_BITS = {'Patient': 1, 'ResearchSubject': 2, 'Condition': 4}
+"""Bit of each resource shared by the rows of a patient, in SeenResources.patients."""
+
+CONDITION_FIELD_BITS = {field: 8 << index for index, field in enumerate(SimpleTransformer.condition_fields())}
+"""Bit of each Condition observation, by Submission field, in SeenResources.patients."""
+
+
+class SeenResources:
+    """The resources already written, proportional to the number of patients and Specimens, not resources.
+
+    The Specimens and Procedures are kept as 16 byte UUIDs, a Specimen's observations are only written with a new Specimen.
+    The resources shared by a patient are kept as the bits of a single entry per patient.
+    """
+
+    def __init__(self) -> None:
+        self.ids = set()
+        self.patients = {}
+
+    def add(self, id_: str) -> bool:
+        """Add a Specimen or Procedure, return False if already seen."""
+        key = uuid.UUID(id_).bytes
+        if key in self.ids:
+            return False
+        self.ids.add(key)
+        return True
+
+    def add_patient_resource(self, patient_id: str, bit: int) -> bool:
+        """Add a resource shared by the rows of a patient, return False if already seen."""
+        key = uuid.UUID(patient_id).bytes
+        written = self.patients.get(key, 0)
+        if written & bit:
+            return False
+        self.patients[key] = written | bit
+        return True
+
+    def __len__(self) -> int:
+        return len(self.ids) + len(self.patients)
+
+
+def _get(resource: Resource | dict, name: str) -> Any:
+    """An element of a fhir.resources model or a rendered dict."""
+    if isinstance(resource, dict):
+        return resource.get(name)
+    return getattr(resource, name)
+
+
+def _reference(reference: Reference | dict) -> tuple[str, str]:
+    """The resource type and id of a reference."""
+    return tuple(_get(reference, 'reference').split('/', 1))
+
+
+def _resource_type_and_id(resource: Resource | dict) -> tuple[str, str]:
+    """The resource type and id of a fhir.resources model or a rendered dict."""
+    if isinstance(resource, dict):
+        return resource['resourceType'], resource['id']
+    return resource.resource_type, resource.id
+
+
+def is_row_resource(resource: Resource | dict) -> bool:
+    """Resources unique to a row's Specimen, the Specimen and its observations."""
+    resource_type, _ = _resource_type_and_id(resource)
+    if resource_type == 'Specimen':
+        return True
+    if resource_type == 'Observation':
+        return any(_reference(_)[0] == 'Specimen' for _ in _get(resource, 'focus') or [])
+    return False
+
+
+def patient_resource_key(resource: Resource | dict) -> tuple[str, int]:
+    """The patient id and bit of a resource shared by the rows of a patient."""
+    resource_type, id_ = _resource_type_and_id(resource)
+    if resource_type == 'Patient':
+        return id_, PATIENT_RESOURCE_BITS[resource_type]
+    _, patient_id = _reference(_get(resource, 'subject'))
+    if resource_type == 'Observation':
+        return patient_id, CONDITION_FIELD_BITS[_get(_get(_get(resource, 'code'), 'coding')[0], 'code')]
+    return patient_id, PATIENT_RESOURCE_BITS[resource_type]
+
+
+def iter_resources(records: Iterator[dict], research_study: ResearchStudy, input_path: pathlib.Path = None,
+                   verbose: bool = False, counts: dict = None, trusted: bool = False,
+                   seen: SeenResources = None) -> Iterator[Resource | dict]:
+    """Transform records, yield each resource once.
+
+    Resources are de-duplicated as g3t_etl.factory.transform_csv does, without keeping every id, see SeenResources:
+    a repeated row is skipped through its Specimen id, the Procedure of a tissue block is shared by the rows of its Specimens,
+    the rest are shared by a patient.
+    If trusted, the resources are rendered as dicts from a SubmissionRecord, see ucl_stavrinides.emission and records.
+    """
+    if counts is None:
+        counts = {}
+    counts['parsed_count'] = 0
+    if seen is None:
+        seen = SeenResources()
+    for record in records:
+        transformer = None
+        if trusted:
+            # render needs only the values, a row that does not fit is validated by pydantic to report it
+            try:
+                transformer = SubmissionRecord.from_record(record)
+            except RecordError:
+                pass
+        try:
+            if transformer is None:
+                transformer = SimpleTransformer(**record, helper=helper)
+            counts['parsed_count'] += 1
+        except ValidationError as e:
+            print_validation_error(e, counts['parsed_count'], input_path, record, verbose)
+            raise e
+
+        try:
+            if trusted:
+                resources = render(transformer, research_study_id=research_study.id if research_study else None)
+            else:
+                resources = transformer.transform(research_study=research_study)
+            assert resources is not None, f"transformer {transformer} returned None"
+            assert len(resources) > 0, f"transformer {transformer} returned empty list"
+        except ValidationError as e:
+            print_transformation_error(e, counts['parsed_count'], input_path, record, verbose)
+            raise e
+
+        specimen = next((_ for _ in resources if _resource_type_and_id(_)[0] == 'Specimen'), None)
+        is_new_row = specimen is None or seen.add(_resource_type_and_id(specimen)[1])
+        for resource in resources:
+            resource_type, id_ = _resource_type_and_id(resource)
+            if resource_type == 'Procedure':
+                is_new = seen.add(id_)
+            elif is_row_resource(resource):
+                is_new = is_new_row
+            else:
+                is_new = seen.add_patient_resource(*patient_resource_key(resource))
+            if is_new:
+                yield resource
+
+
+def sample_error(resource: dict, error: Exception) -> ValidationError:
+    """The error of a sampled resource, as the pydantic ValidationError TransformationResults holds."""
+    return ValidationError.from_exception_data(
+        f"{resource['resourceType']}/{resource['id']}",
+        [{'type': 'value_error', 'loc': (resource['resourceType'],), 'input': resource['id'], 'ctx': {'error': error}}]
+    )
+
+
+def transform_csv_streaming(input_path: pathlib.Path,
+                            output_path: pathlib.Path,
+                            verbose: bool = False,
+                            trusted: bool = False,
+                            validation_rate: float = VALIDATION_RATE,
+                            shard_lines: Optional[int] = None,
+                            shard_bytes: Optional[int] = None,
+                            compress: bool = False,
+                            exclude_zones: bool = False) -> TransformationResults:
+    """Transform a CSV file to FHIR one row at a time.
+
+    If trusted, resources are rendered as dicts and only a `validation_rate` sample is validated by fhir.resources;
+    a sampled resource that fails is not written, it is reported in the results' transformer_errors.
+    A row that fails validation raises, as in g3t_etl.factory.transform_csv. If exclude_zones, the SV rows are skipped, see iter_records.
+    If sharded or compressed, the ndjson is written by a background thread, see ShardedNdjsonWriters.
+    """
+    counts = {}
+    transformer_errors = []
+    validator = SampledValidator(validation_rate)
+    if shard_lines or shard_bytes or compress:
+        writers = ShardedNdjsonWriters(output_path, shard_lines=shard_lines, shard_bytes=shard_bytes, compress=compress)
+    else:
+        writers = NdjsonWriters(output_path)
+    with writers:
+        try:
+            research_study = create_research_study()
+            writers.write(research_study.resource_type, research_study.json())
+        except ValidationError as e:
+            print_transformation_error(e, 0, input_path, RESEARCH_STUDY, verbose)
+            raise e
+
+        records = iter_records(input_path, exclude_zones=exclude_zones)
+        for resource in iter_resources(records, research_study, input_path=input_path, verbose=verbose, counts=counts,
+                                       trusted=trusted):
+            if not trusted:
+                writers.write(resource.resource_type, resource.json())
+                continue
+            line = dumps(resource)
+            try:
+                validator.validate(resource, line)
+            except (PydanticV1ValidationError, ValueError) as e:
+                error = sample_error(resource, e)
+                print_transformation_error(error, counts['parsed_count'], input_path, resource, verbose)
+                transformer_errors.append(error)
+                continue
+            writers.write(resource['resourceType'], line)
+
+    if trusted:
+        logger.info(f"validated {validator.validated_count} of {sum(writers.counts.values())} resources")
+
+    return TransformationResults(
+        parsed_count=counts['parsed_count'],
+        emitted_count=sum(writers.counts.values()),
+        validation_errors=[],
+        transformer_errors=transformer_errors
+    )
@@ -0,0 +1,683 @@
+# generated by ucl_stavrinides.codegen:
+#   filename:  submission.schema.json
+#   fingerprint:  a83dfa46e1ac73583e2ead25731e8fc2
+"""A compact record of a submission row, one slot per Submission field, see ucl_stavrinides.records."""
+from typing import Optional
+
+from ucl_stavrinides.records import Record
+
+SCHEMA_FINGERPRINT = 'a83dfa46e1ac73583e2ead25731e8fc2'
+
+FIELDS = (
+    'id',
+    'align',
+    'ageDiagM',
+    'ageDiagY',
+    'ppsa',
+    'BxPreDiag',
+    'psaBx',
+    'months_diag',
+    'gleason',
+    'mccl',
+    'ucl',
+    'prvol',
+    'side',
+    'zone',
+    'loc',
+    'level',
+    'likert',
+    'pirads',
+    'precise',
+    'adcMean',
+    'adcn',
+    'adcu',
+    'focality',
+    'best',
+    'bestVol',
+    't2Vol',
+    'Epi_Count',
+    'Stroma_Count',
+    'Lymphocyte_Count',
+    'Lymphocyte_Percentage',
+    'Irani_Gscore',
+    'Tissue_Area',
+    'Epithelial_Area',
+    'Stromal_Area',
+    'Inflammatory_Area',
+    'Epithelial_Area_Percentage',
+    'Stromal_Area_Percentage',
+    'Inflammatory_Area_Percentage',
+    'Epithelial_Stromal_Ratio',
+    'Lumen_Area',
+    'Lumen_Density',
+    'Lumen_Density_Gland',
+    'Annotated_Cancer_Area',
+    'Normal_Area',
+    'PIN_Area',
+    'Gleason_3_Area',
+    'Gleason_4_Area',
+    'Gleason_5_Area',
+    'Gleason_Primary',
+    'Gleason_Secondary',
+    'Grade_Group',
+)
+"""Field names, in schema order, the same as Submission.model_fields."""
+
+COLUMNS = (
+    'id',
+    'align',
+    'ageDiagM',
+    'ageDiagY',
+    'ppsa',
+    'BxPreDiag',
+    'psaBx',
+    'months.diag',
+    'gleason',
+    'mccl',
+    'ucl',
+    'prvol',
+    'side',
+    'zone',
+    'loc',
+    'level',
+    'likert',
+    'pirads',
+    'precise',
+    'adcMean',
+    'adcn',
+    'adcu',
+    'focality',
+    'best',
+    'bestVol',
+    't2Vol',
+    'Epi_Count',
+    'Stroma_Count',
+    'Lymphocyte_Count',
+    'Lymphocyte_Percentage',
+    'Irani_Gscore',
+    'Tissue_Area',
+    'Epithelial_Area',
+    'Stromal_Area',
+    'Inflammatory_Area',
+    'Epithelial_Area_Percentage',
+    'Stromal_Area_Percentage',
+    'Inflammatory_Area_Percentage',
+    'Epithelial_Stromal_Ratio',
+    'Lumen_Area',
+    'Lumen_Density',
+    'Lumen_Density_Gland',
+    'Annotated_Cancer_Area',
+    'Normal_Area',
+    'PIN_Area',
+    'Gleason_3_Area',
+    'Gleason_4_Area',
+    'Gleason_5_Area',
+    'Gleason_Primary',
+    'Gleason_Secondary',
+    'Grade_Group',
+)
+"""Csv column names, the fields' aliases."""
+
+TYPES = (
+    str,
+    str,
+    int,
+    int,
+    float,
+    int,
+    float,
+    int,
+    str,
+    int,
+    str,
+    float,
+    str,
+    str,
+    str,
+    str,
+    int,
+    int,
+    int,
+    float,
+    float,
+    float,
+    str,
+    str,
+    float,
+    float,
+    int,
+    int,
+    int,
+    float,
+    int,
+    float,
+    float,
+    float,
+    float,
+    float,
+    float,
+    float,
+    float,
+    float,
+    float,
+    float,
+    float,
+    float,
+    float,
+    float,
+    float,
+    float,
+    int,
+    int,
+    int,
+)
+"""Type of each field."""
+
+DESCRIPTIONS = (
+    'Patient ID',
+    'Aligned lesion',
+    'Age at Diagnosis in Months',
+    'Age at Diagnosis in Years',
+    'Presenting PSA at diagnosis',
+    'Biopsy before diagnosis',
+    'PSA at Biopsy A',
+    'Months that elapsed since prostate cancer diagnosis',
+    'Gleason grade',
+    'Maximum Cancer Core Length in mm',
+    'UCL Definition',
+    'Prostate volume on MRI',
+    'Sampled area side (Left or Right)',
+    'Sampled area zone (Peripheral, Transition, Both)',
+    'Sampled area location (Posterior, Anterior or combinations)',
+    'Sampled area level (Base, Mid-gland, Apex or combinations)',
+    'Likert score of sampled MRI area',
+    'PI-RADSv2 score of sampled MRI area',
+    'PRECISE score of sampled MRI area (only for timepoint B)',
+    'Mean apparent diffusion coefficient of sampled MRI area',
+    'Mean apparent diffusion coefficient of sampled MRI area (normalised by contralateral benign prostate ADC)',
+    'Mean apparent diffusion coefficient of sampled MRI area (normalised by urine ADC)',
+    'Lesion focality',
+    'MRI sequence on which lesion is best seen',
+    'Volume of lesion on best sequence (ml)',
+    'Lesion volume on T2 (ml)',
+    'Total number of epithelial cells within all tissue areas on H&E',
+    'Total number of stromal cells within all tissue areas on H&E',
+    'Total number of lymphocytes within all tissue areas on H&E',
+    '% of lymphocytes within all tissue areas on H&E',
+    'Irani score (number of lymphocytes in largest inflammatory cluster)',
+    'Tissue area (square mm)',
+    'Epithelial area (square mm)',
+    'Stromal area (square mm)',
+    'Inflammation area (square mm)',
+    '% epithelial area (epithelial area fraction)',
+    '% stromal area (stromal area fraction)',
+    '% inflammation area (inflammation area fraction)',
+    'Epithelial area/Stromal area (square mm)',
+    'Total area detected as lumen within all tissue areas (square mm)',
+    'Lumen area/tissue area',
+    'Lumen area/epithelial area',
+    'Total area of cancer annotated by pathologist',
+    'Area classified as normal by classifier',
+    'Area classified as PIN by classifier',
+    'Area classified as G3 by classifier',
+    'Area classified as G4 by classifier',
+    'Area classified as G5 or higher by classifier',
+    'Primary Gleason according to classifier',
+    'Secondary Gleason according to classifier',
+    'Grade Group according to classifier',
+)
+"""Description of each field."""
+
+EXTRAS = (
+    {
+        'fhir_resource_type': 'Patient, Specimen, Condition',
+    },
+    {
+        'csv_type_notes': 'Binary',
+        'fhir_resource_type': 'Observation',
+        'observation_subject': 'Condition',
+    },
+    {
+        'fhir_resource_type': 'Condition.age',
+        'uom_system': 'http://unitsofmeasure.org',
+        'uom_code': 'mo',
+        'uom_unit': 'month',
+    },
+    {
+        'fhir_resource_type': 'Observation',
+        'coding_system': 'https://loinc.org/',
+        'coding_code': '63932-8',
+        'coding_display': 'Age at diagnosis',
+        'observation_subject': 'Condition',
+        'uom_system': 'http://unitsofmeasure.org',
+        'uom_code': '/ a',
+        'uom_unit': '/ year',
+    },
+    {
+        'fhir_resource_type': 'Observation',
+        'coding_system': 'http://snomed.info/sct/',
+        'coding_code': '63476009',
+        'coding_display': 'Prostate specific antigen measurement',
+        'observation_subject': 'Condition',
+        'uom_system': 'http://unitsofmeasure.org',
+        'uom_code': 'ng/mL',
+        'uom_unit': 'nanograms per milliliter (ng/mL)',
+    },
+    {
+        'fhir_resource_type': 'Observation',
+        'observation_subject': 'Condition',
+    },
+    {
+        'fhir_resource_type': 'Observation',
+        'coding_system': 'http://snomed.info/sct/',
+        'coding_code': '63476009',
+        'coding_display': 'Prostate specific antigen measurement',
+        'observation_subject': 'Condition',
+        'uom_system': 'http://unitsofmeasure.org',
+        'uom_code': 'ng/mL',
+        'uom_unit': 'nanograms per milliliter (ng/mL)',
+    },
+    {
+        'fhir_resource_type': 'Observation',
+        'observation_subject': 'Condition',
+        'uom_system': 'http://unitsofmeasure.org',
+        'uom_code': 'mo',
+        'uom_unit': 'month',
+    },
+    {
+        'fhir_resource_type': 'Observation',
+        'coding_system': 'http://snomed.info/sct',
+        'coding_code': 372278000,
+        'coding_display': 'Gleason score',
+        'observation_subject': 'Condition',
+    },
+    {
+        'fhir_resource_type': 'Observation',
+        'coding_system': 'http://snomed.info/sct',
+        'coding_code': '399598003',
+        'coding_display': 'Length of core in specimen obtained by needle biopsy',
+        'observation_subject': 'Specimen',
+        'uom_system': 'http://unitsofmeasure.org',
+        'uom_code': 'millimeter',
+        'uom_unit': 'mm',
+    },
+    {
+        'fhir_resource_type': 'Observation',
+        'observation_subject': 'Specimen',
+    },
+    {
+        'fhir_resource_type': 'Observation',
+        'coding_system': 'https://loinc.org/',
+        'coding_code': '15325-4',
+        'coding_display': 'Prostate specific Ag/Prostate volume calculated',
+        'observation_subject': 'Specimen',
+        'uom_system': 'http://unitsofmeasure.org',
+        'uom_code': 'mL',
+        'uom_unit': 'milliliter',
+    },
+    {
+        'fhir_resource_type': 'Observation',
+        'observation_subject': 'Specimen',
+    },
+    {
+        'fhir_resource_type': 'Observation',
+        'observation_subject': 'Specimen',
+    },
+    {
+        'fhir_resource_type': 'Observation',
+        'observation_subject': 'Specimen',
+    },
+    {
+        'fhir_resource_type': 'Observation',
+        'observation_subject': 'Specimen',
+    },
+    {
+        'csv_type_notes': '2024-05-01T00:00:00',
+        'fhir_resource_type': 'Observation',
+        'coding_system': 'http://snomed.info/sct/',
+        'coding_code': 273575009,
+        'coding_display': 'ikert scale (assessment scale}',
+        'observation_subject': 'Specimen',
+    },
+    {
+        'csv_type_notes': '2024-05-01T00:00:00',
+        'fhir_resource_type': 'Observation',
+        'coding_system': 'http://dicom.nema.org/resources/ontology/DCM/',
+        'coding_code': '130564',
+        'coding_display': 'PI-RADS v2.0',
+        'observation_subject': 'Specimen',
+    },
+    {
+        'csv_type_notes': '2024-05-01T00:00:00',
+        'fhir_resource_type': 'Observation',
+        'observation_subject': 'Specimen',
+    },
+    {
+        'fhir_resource_type': 'Observation',
+        'coding_system': 'http://snomed.info/sct',
+        'coding_code': '46638006',
+        'coding_display': 'Diffusion',
+        'observation_subject': 'Specimen',
+        'uom_system': 'http://unitsofmeasure.org',
+        'uom_code': 'm2/s',
+        'uom_unit': 'square meters per second',
+    },
+    {
+        'fhir_resource_type': 'Observation',
+        'observation_subject': 'Specimen',
+        'uom_system': 'http://unitsofmeasure.org',
+        'uom_code': 'm2/s',
+        'uom_unit': 'square meters per second',
+    },
+    {
+        'fhir_resource_type': 'Observation',
+        'observation_subject': 'Specimen',
+        'uom_system': 'http://unitsofmeasure.org',
+        'uom_code': 'm2/s',
+        'uom_unit': 'square meters per second',
+    },
+    {
+        'csv_type_notes': 'Binary',
+        'fhir_resource_type': 'Observation',
+        'observation_subject': 'Specimen',
+    },
+    {
+        'fhir_resource_type': 'Observation',
+        'coding_system': 'http://snomed.info/sct/',
+        'coding_code': '396199003',
+        'coding_display': 'Tumour focality',
+        'observation_subject': 'Specimen',
+    },
+    {
+        'fhir_resource_type': 'Observation',
+        'observation_subject': 'Specimen',
+        'uom_system': 'http://unitsofmeasure.org',
+        'uom_code': 'mL',
+        'uom_unit': 'milliliter',
+    },
+    {
+        'fhir_resource_type': 'Observation',
+        'observation_subject': 'Specimen',
+        'uom_system': 'http://unitsofmeasure.org',
+        'uom_code': 'mL',
+        'uom_unit': 'milliliter',
+    },
+    {
+        'fhir_resource_type': 'Observation',
+        'coding_system': 'http://snomed.info/sct/',
+        'coding_code': '393942000',
+        'coding_display': 'Epithelial cell count',
+        'observation_subject': 'Specimen',
+    },
+    {
+        'fhir_resource_type': 'Observation',
+        'coding_system': 'http://snomed.info/sct/',
+        'coding_code': '74765001',
+        'coding_display': 'Lymphocyte',
+        'observation_subject': 'Specimen',
+        'uom_system': 'http://unitsofmeasure.org',
+        'uom_code': 'mL',
+        'uom_unit': 'milliliter',
+    },
+    {
+        'fhir_resource_type': 'Observation',
+        'coding_system': 'http://snomed.info/sct/',
+        'coding_code': '271036002',
+        'coding_display': 'Lymphocyte percent differential count',
+        'observation_subject': 'Specimen',
+    },
+    {
+        'fhir_resource_type': 'Observation',
+        'observation_subject': 'Specimen',
+    },
+    {
+        'fhir_resource_type': 'Observation',
+        'observation_subject': 'Specimen',
+    },
+    {
+        'fhir_resource_type': 'Observation',
+        'observation_subject': 'Specimen',
+        'uom_system': 'http://unitsofmeasure.org',
+        'uom_code': 'mm2',
+        'uom_unit': 'square millimeter',
+    },
+    {
+        'fhir_resource_type': 'Observation',
+        'observation_subject': 'Specimen',
+        'uom_system': 'http://unitsofmeasure.org',
+        'uom_code': 'mm2',
+        'uom_unit': 'square millimeter',
+    },
+    {
+        'fhir_resource_type': 'Observation',
+        'observation_subject': 'Specimen',
+        'uom_system': 'http://unitsofmeasure.org',
+        'uom_code': 'mm2',
+        'uom_unit': 'square millimeter',
+    },
+    {
+        'fhir_resource_type': 'Observation',
+        'observation_subject': 'Specimen',
+        'uom_system': 'http://unitsofmeasure.org',
+        'uom_code': 'mm2',
+        'uom_unit': 'square millimeter',
+    },
+    {
+        'fhir_resource_type': 'Observation',
+        'observation_subject': 'Specimen',
+    },
+    {
+        'fhir_resource_type': 'Observation',
+        'observation_subject': 'Specimen',
+    },
+    {
+        'fhir_resource_type': 'Observation',
+        'observation_subject': 'Specimen',
+    },
+    {
+        'fhir_resource_type': 'Observation',
+        'observation_subject': 'Specimen',
+        'uom_system': 'http://unitsofmeasure.org',
+        'uom_code': 'mm2',
+        'uom_unit': 'square millimeter',
+    },
+    {
+        'fhir_resource_type': 'Observation',
+        'observation_subject': 'Specimen',
+        'uom_system': 'http://unitsofmeasure.org',
+        'uom_code': 'mm2',
+        'uom_unit': 'square millimeter',
+    },
+    {
+        'fhir_resource_type': 'Observation',
+        'observation_subject': 'Specimen',
+        'uom_system': 'http://unitsofmeasure.org',
+        'uom_code': 'mm2',
+        'uom_unit': 'square millimeter',
+    },
+    {
+        'fhir_resource_type': 'Observation',
+        'observation_subject': 'Specimen',
+        'uom_system': 'http://unitsofmeasure.org',
+        'uom_code': 'mm2',
+        'uom_unit': 'square millimeter',
+    },
+    {
+        'fhir_resource_type': 'Observation',
+        'observation_subject': 'Specimen',
+        'uom_system': 'http://unitsofmeasure.org',
+        'uom_code': 'mm2',
+        'uom_unit': 'square millimeter',
+    },
+    {
+        'fhir_resource_type': 'Observation',
+        'observation_subject': 'Specimen',
+        'uom_system': 'http://unitsofmeasure.org',
+        'uom_code': 'mm2',
+        'uom_unit': 'square millimeter',
+    },
+    {
+        'fhir_resource_type': 'Observation',
+        'observation_subject': 'Specimen',
+        'uom_system': 'http://unitsofmeasure.org',
+        'uom_code': 'mm2',
+        'uom_unit': 'square millimeter',
+    },
+    {
+        'fhir_resource_type': 'Observation',
+        'observation_subject': 'Specimen',
+        'uom_system': 'http://unitsofmeasure.org',
+        'uom_code': 'mm2',
+        'uom_unit': 'square millimeter',
+    },
+    {
+        'fhir_resource_type': 'Observation',
+        'observation_subject': 'Specimen',
+        'uom_system': 'http://unitsofmeasure.org',
+        'uom_code': 'mm2',
+        'uom_unit': 'square millimeter',
+    },
+    {
+        'fhir_resource_type': 'Observation',
+        'observation_subject': 'Specimen',
+        'uom_system': 'http://unitsofmeasure.org',
+        'uom_code': 'mm2',
+        'uom_unit': 'square millimeter',
+    },
+    {
+        'csv_type_notes': 'Ordinal',
+        'fhir_resource_type': 'Observation',
+        'coding_system': 'http://snomed.info/sct',
+        'coding_code': 372278000,
+        'coding_display': 'Gleason score',
+        'observation_subject': 'Specimen',
+    },
+    {
+        'csv_type_notes': 'Ordinal',
+        'fhir_resource_type': 'Observation',
+        'coding_system': 'http://snomed.info/sct',
+        'coding_code': 372278000,
+        'coding_display': 'Gleason score',
+        'observation_subject': 'Specimen',
+    },
+    {
+        'csv_type_notes': 'Ordinal',
+        'fhir_resource_type': 'Observation',
+        'observation_subject': 'Specimen',
+    },
+)
+"""json_schema_extra of each field."""
+
+
+class SubmissionRecord(Record):
+    """A submission row, see Submission for the pydantic model."""
+    __slots__ = FIELDS
+    _fields = FIELDS
+    _columns = COLUMNS
+    _types = TYPES
+
+    def __init__(
+        self,
+        id: Optional[str] = None,
+        align: Optional[str] = None,
+        ageDiagM: Optional[int] = None,
+        ageDiagY: Optional[int] = None,
+        ppsa: Optional[float] = None,
+        BxPreDiag: Optional[int] = None,
+        psaBx: Optional[float] = None,
+        months_diag: Optional[int] = None,
+        gleason: Optional[str] = None,
+        mccl: Optional[int] = None,
+        ucl: Optional[str] = None,
+        prvol: Optional[float] = None,
+        side: Optional[str] = None,
+        zone: Optional[str] = None,
+        loc: Optional[str] = None,
+        level: Optional[str] = None,
+        likert: Optional[int] = None,
+        pirads: Optional[int] = None,
+        precise: Optional[int] = None,
+        adcMean: Optional[float] = None,
+        adcn: Optional[float] = None,
+        adcu: Optional[float] = None,
+        focality: Optional[str] = None,
+        best: Optional[str] = None,
+        bestVol: Optional[float] = None,
+        t2Vol: Optional[float] = None,
+        Epi_Count: Optional[int] = None,
+        Stroma_Count: Optional[int] = None,
+        Lymphocyte_Count: Optional[int] = None,
+        Lymphocyte_Percentage: Optional[float] = None,
+        Irani_Gscore: Optional[int] = None,
+        Tissue_Area: Optional[float] = None,
+        Epithelial_Area: Optional[float] = None,
+        Stromal_Area: Optional[float] = None,
+        Inflammatory_Area: Optional[float] = None,
+        Epithelial_Area_Percentage: Optional[float] = None,
+        Stromal_Area_Percentage: Optional[float] = None,
+        Inflammatory_Area_Percentage: Optional[float] = None,
+        Epithelial_Stromal_Ratio: Optional[float] = None,
+        Lumen_Area: Optional[float] = None,
+        Lumen_Density: Optional[float] = None,
+        Lumen_Density_Gland: Optional[float] = None,
+        Annotated_Cancer_Area: Optional[float] = None,
+        Normal_Area: Optional[float] = None,
+        PIN_Area: Optional[float] = None,
+        Gleason_3_Area: Optional[float] = None,
+        Gleason_4_Area: Optional[float] = None,
+        Gleason_5_Area: Optional[float] = None,
+        Gleason_Primary: Optional[int] = None,
+        Gleason_Secondary: Optional[int] = None,
+        Grade_Group: Optional[int] = None,
+    ) -> None:
+        self.id = id
+        self.align = align
+        self.ageDiagM = ageDiagM
+        self.ageDiagY = ageDiagY
+        self.ppsa = ppsa
+        self.BxPreDiag = BxPreDiag
+        self.psaBx = psaBx
+        self.months_diag = months_diag
+        self.gleason = gleason
+        self.mccl = mccl
+        self.ucl = ucl
+        self.prvol = prvol
+        self.side = side
+        self.zone = zone
+        self.loc = loc
+        self.level = level
+        self.likert = likert
+        self.pirads = pirads
+        self.precise = precise
+        self.adcMean = adcMean
+        self.adcn = adcn
+        self.adcu = adcu
+        self.focality = focality
+        self.best = best
+        self.bestVol = bestVol
+        self.t2Vol = t2Vol
+        self.Epi_Count = Epi_Count
+        self.Stroma_Count = Stroma_Count
+        self.Lymphocyte_Count = Lymphocyte_Count
+        self.Lymphocyte_Percentage = Lymphocyte_Percentage
+        self.Irani_Gscore = Irani_Gscore
+        self.Tissue_Area = Tissue_Area
+        self.Epithelial_Area = Epithelial_Area
+        self.Stromal_Area = Stromal_Area
+        self.Inflammatory_Area = Inflammatory_Area
+        self.Epithelial_Area_Percentage = Epithelial_Area_Percentage
+        self.Stromal_Area_Percentage = Stromal_Area_Percentage
+        self.Inflammatory_Area_Percentage = Inflammatory_Area_Percentage
+        self.Epithelial_Stromal_Ratio = Epithelial_Stromal_Ratio
+        self.Lumen_Area = Lumen_Area
+        self.Lumen_Density = Lumen_Density
+        self.Lumen_Density_Gland = Lumen_Density_Gland
+        self.Annotated_Cancer_Area = Annotated_Cancer_Area
+        self.Normal_Area = Normal_Area
+        self.PIN_Area = PIN_Area
+        self.Gleason_3_Area = Gleason_3_Area
+        self.Gleason_4_Area = Gleason_4_Area
+        self.Gleason_5_Area = Gleason_5_Area
+        self.Gleason_Primary = Gleason_Primary
+        self.Gleason_Secondary = Gleason_Secondary
+        self.Grade_Group = Grade_Group
@@ -0,0 +1,248 @@
+"""Observation templates, rendered once per Submission field.
+
+Everything but the id, identifier, subject, focus and value of an Observation depends only on the field,
+so the code, status and category are validated once, see `compile_observation_templates`.
+The same goes for the Condition of templates/Condition.yaml, see `compiled_condition`.
+
+The compiled templates are pickled in .g3t/state, keyed on the hash of their sources (the yaml templates, the
+data dictionary, the Submission model, ucl_stavrinides.categories, this module and the g3t_etl and fhir.resources
+versions), so the first row of every process loads them in milliseconds.
+"""
+import hashlib
+import importlib.metadata
+import logging
+import os
+import pathlib
+import pickle
+import sys
+from decimal import Decimal
+from typing import Any, Mapping, NamedTuple, Optional
+
+import fhir.resources
+import numpy as np
+import orjson
+from fhir.resources.condition import Condition
+from fhir.resources.observation import Observation
+from fhir.resources.reference import Reference
+from fhir.resources.resource import Resource
+from pydantic.fields import FieldInfo
+from pydantic.v1.json import decimal_encoder
+
+from g3t_etl.factory import OBSERVATION, additional_observation_codings, helper, template_condition
+from ucl_stavrinides import categories, submission
+from ucl_stavrinides.categories import categorical_fields
+from ucl_stavrinides.submission import Submission
+from ucl_stavrinides.transformer import DICTIONARY_PATH
+
+logger = logging.getLogger(__name__)
+
+TEMPLATES_PATH = pathlib.Path('templates')
+
+CACHE_PATH = pathlib.Path('.g3t/state/ucl_stavrinides-templates.pickle')
+"""Where the compiled templates are kept, see load_compiled_templates."""
+
+
+class ObservationTemplate(NamedTuple):
+    """The parts of an Observation that are the same for every row of a Submission field."""
+    field: str
+    """Submission field name, used in the Observation's code and identifier."""
+    column: str
+    """Csv column name (the field's alias)."""
+    focus: str
+    """Resource type of the Observation's focus, Specimen or Condition."""
+    value_type: str
+    """One of valueInteger, valueQuantity, valueCodeableConcept (see categories), valueString."""
+    prototype: dict
+    """Rendered Observation, only id, identifier, subject, focus and value vary by row."""
+    unit: dict
+    """Quantity system, code and unit."""
+    observation: Observation
+    """Validated Observation with status, category and code, copied for each row."""
+
+
+def python_type(field_info: FieldInfo) -> type:
+    """The type a field's annotation resolves to, see FHIRTransformer.create_observations."""
+    # the annotations are often decorated with Optional, so cast to string and check for the type
+    field_type = str(field_info.annotation)
+    if 'int' in field_type:
+        return int
+    if 'float' in field_type or 'decimal' in field_type or 'number' in field_type:
+        return float
+    return str
+
+
+def to_json_value(value: Any) -> Any:
+    """Mimic fhir.resources encoding of a Decimal, i.e. an int unless the value has a fractional part."""
+    return decimal_encoder(Decimal(str(value).strip()))
+
+
+def prototype(resource: Resource) -> dict:
+    """Render a resource, the dict's keys are in FHIR element order."""
+    return orjson.loads(resource.json())
+
+
+def observation_templates(model_fields: dict[str, FieldInfo] = Submission.model_fields) -> list[ObservationTemplate]:
+    """Render an Observation for each Observation field, in field order."""
+    templates = []
+    observation_template = {k: v for k, v in OBSERVATION.items() if k != 'code'}
+    for field, field_info in model_fields.items():
+        if not field_info.json_schema_extra or 'observation_subject' not in field_info.json_schema_extra:
+            continue
+        field_type = python_type(field_info)
+        unit = {}
+        if 'uom_system' in field_info.json_schema_extra:
+            unit = {
+                'unit': field_info.json_schema_extra['uom_unit'],
+                'system': field_info.json_schema_extra['uom_system'],
+                'code': field_info.json_schema_extra['uom_code'],
+            }
+        observation = Observation(
+            **observation_template,
+            code=helper.populate_codeable_concept(code=field, display=field_info.description)
+        )
+        more_codings = additional_observation_codings(field_info)
+        if more_codings:
+            observation.code.coding.extend(more_codings)
+        template_observation = observation.copy()
+        # placeholders, so the prototype has all the keys in the right order
+        observation.id = 'id'
+        observation.identifier = [helper.populate_identifier(value='value')]
+        observation.subject = {'reference': 'Patient/id'}
+        observation.focus = [{'reference': f"{field_info.json_schema_extra['observation_subject']}/id"}]
+        if field_type is int:
+            value_type = 'valueInteger'
+            observation.valueInteger = 1
+        elif field_type is float:
+            value_type = 'valueQuantity'
+            observation.valueQuantity = {'value': 1.5, **unit}
+        elif field in categorical_fields():
+            value_type = 'valueCodeableConcept'
+            observation.valueCodeableConcept = {'text': 'value'}
+        else:
+            value_type = 'valueString'
+            observation.valueString = 'value'
+        templates.append(
+            ObservationTemplate(
+                field=field,
+                column=field_info.alias or field,
+                focus=field_info.json_schema_extra['observation_subject'],
+                value_type=value_type,
+                prototype=prototype(observation),
+                unit=unit,
+                observation=template_observation,
+            )
+        )
+    return templates
+
+
+COMPILED_TEMPLATES: dict[str, list[ObservationTemplate]] = {}
+"""Observation templates by focus resource type, see compile_observation_templates."""
+
+
+def compile_observation_templates(model_fields: dict[str, FieldInfo] = Submission.model_fields) -> dict[str, list[ObservationTemplate]]:
+    """Render the Observation templates once, see load_compiled_templates."""
+    COMPILED_TEMPLATES.clear()
+    for template in observation_templates(model_fields):
+        COMPILED_TEMPLATES.setdefault(template.focus, []).append(template)
+    logger.debug(f"compiled observation templates {({k: len(v) for k, v in COMPILED_TEMPLATES.items()})}")
+    return COMPILED_TEMPLATES
+
+
+def compiled_observation_templates(focus: str) -> list[ObservationTemplate]:
+    """The templates of the fields observing a resource type, loaded (or compiled) on first use."""
+    if not COMPILED_TEMPLATES:
+        load_compiled_templates()
+    return COMPILED_TEMPLATES.get(focus, [])
+
+
+COMPILED_RESOURCES: dict[str, Resource] = {}
+"""Validated resource templates by resource type, see compiled_condition."""
+
+
+def compiled_condition(subject: Reference | dict) -> Condition:
+    """A shallow copy of the validated templates/Condition.yaml, see g3t_etl.factory.template_condition.
+
+    Only top level elements may be assigned on the copy, nested elements are shared.
+    """
+    condition = COMPILED_RESOURCES.get('Condition', None)
+    if condition is None:
+        condition = COMPILED_RESOURCES['Condition'] = template_condition(subject={'reference': 'Patient/id'})
+    if isinstance(subject, dict):
+        subject = Reference.parse_obj(subject)
+    return condition.copy(update={'subject': subject})
+
+
+def library_version(library: str) -> str:
+    """The installed version of a distribution, empty if not installed; g3t_etl has no __version__."""
+    try:
+        return importlib.metadata.version(library)
+    except importlib.metadata.PackageNotFoundError:
+        return ''
+
+
+def sources_hash(templates_path: pathlib.Path = TEMPLATES_PATH, dictionary_path: str = DICTIONARY_PATH) -> str:
+    """Hash of everything the compiled templates are made from, including the project's system and the library versions.
+
+    g3t_etl's TransformerHelper mints the ids and provides the identifier system, so its version is included.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{helper.system}|{fhir.resources.__version__}|g3t_etl={library_version('g3t_etl')}|{sys.version}".encode())
+    sources = [dictionary_path, submission.__file__, categories.__file__, __file__]
+    paths = sorted(pathlib.Path(templates_path).glob('*.yaml')) + [pathlib.Path(_) for _ in sources]
+    for path in paths:
+        if path.exists():
+            digest.update(path.name.encode())
+            digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def load_compiled_templates(cache_path: Optional[pathlib.Path] = CACHE_PATH) -> bool:
+    """Load the compiled templates from cache_path, or compile and save them if a source changed. Returns True if loaded.
+
+    Set cache_path to None to always compile.
+    """
+    key = sources_hash()
+    if cache_path and pathlib.Path(cache_path).exists():
+        try:
+            with open(cache_path, 'rb') as fp:
+                cache = pickle.load(fp)
+            if cache['key'] == key:
+                COMPILED_TEMPLATES.clear()
+                COMPILED_TEMPLATES.update(cache['templates'])
+                COMPILED_RESOURCES.clear()
+                COMPILED_RESOURCES.update(cache['resources'])
+                return True
+        except Exception as e:  # noqa - a stale or unreadable cache is rebuilt
+            logger.info(f"ignoring template cache {cache_path}: {e}")
+    compile_observation_templates()
+    COMPILED_RESOURCES.clear()
+    compiled_condition(subject={'reference': 'Patient/id'})
+    if cache_path:
+        cache_path = pathlib.Path(cache_path)
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_name(f".{cache_path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'wb') as fp:
+            pickle.dump({'key': key, 'templates': COMPILED_TEMPLATES, 'resources': COMPILED_RESOURCES}, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    return False
+
+
+def present_fields(values: Mapping[str, Any]) -> frozenset[str]:
+    """Names of the fields that are set (not None, empty or 0), computed once per row.
+
+    Most imaging features are missing from most rows, observations are only created for the fields that are set.
+    """
+    return frozenset([field for field, value in values.items() if value])
+
+
+def present_templates(focus: str, fields: frozenset[str]) -> list[ObservationTemplate]:
+    """The compiled templates of a focus whose field is set, in template order."""
+    return [template for template in compiled_observation_templates(focus) if template.field in fields]
+
+
+def presence(columns: Mapping[str, list], templates: list[ObservationTemplate], row_count: int) -> np.ndarray:
+    """Rows x templates bitmap of the values that are set, one column at a time, see present_fields."""
+    bitmap = np.zeros((row_count, len(templates)), dtype=bool)
+    for index, template in enumerate(templates):
+        bitmap[:, index] = np.fromiter(map(bool, columns[template.field]), dtype=bool, count=row_count)
+    return bitmap
@@ -0,0 +1,229 @@
+"""Upload the ndjson in META to a FHIR server, in batched transaction Bundles.
+
+Resource types are uploaded in dependency order, so every reference resolves when it arrives:
+ResearchStudy, Patient, then ResearchSubject, Condition and Procedure, then Specimen, then Observation and
+DocumentReference; the types of a level are uploaded together. Each file (or shard) is streamed into batches of
+`PUT RESOURCE/id` entries, sent by a bounded number of concurrent requests over one pooled aiohttp session.
+PUT is idempotent, so a failed batch is retried with exponential backoff, honouring Retry-After.
+
+Completed batches are checkpointed in .g3t/state, keyed on the server and on each file's size and modification
+time; an interrupted upload resumes, skipping the batches already acknowledged.
+"""
+import asyncio
+import logging
+import os
+import pathlib
+import random
+from typing import Iterator, NamedTuple, Optional
+
+import aiohttp
+import orjson
+
+from ucl_stavrinides.writers import open_ndjson
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_ORDER = [
+    ['ResearchStudy'],
+    ['Patient'],
+    ['ResearchSubject', 'Condition', 'Procedure'],
+    ['Specimen'],
+    ['Observation', 'DocumentReference'],
+]
+"""Levels of resource types, a level is uploaded once the levels it refers to are; other types are uploaded last."""
+
+BATCH_SIZE = 500
+"""Resources per transaction Bundle."""
+
+CONCURRENCY = 8
+"""Requests in flight, and connections in the pool."""
+
+MAX_RETRIES = 5
+
+BACKOFF = 0.5
+"""Seconds before the first retry, doubled on each retry."""
+
+RETRY_STATUSES = frozenset([408, 425, 429, 500, 502, 503, 504])
+
+STATE_PATH = pathlib.Path('.g3t/state')
+"""Where the checkpoint is kept, see also ucl_stavrinides.incremental."""
+
+CHECKPOINT_NAME = 'ucl_stavrinides-upload-checkpoint.json'
+
+CHECKPOINT_EVERY = 20
+"""Batches acknowledged between checkpoint writes, the checkpoint is also written after each level."""
+
+
+class UploadError(Exception):
+    """The server rejected a batch, or kept failing after all retries."""
+
+
+class UploadResults(NamedTuple):
+    """Resources and batches sent, and the batches skipped because an earlier run had sent them."""
+    uploaded_count: int
+    batch_count: int
+    skipped_batch_count: int
+
+
+class Batch(NamedTuple):
+    """A transaction Bundle of a file's lines."""
+    path: pathlib.Path
+    index: int
+    resource_count: int
+    body: bytes
+
+
+def upload_levels(meta_path: pathlib.Path) -> list[list[pathlib.Path]]:
+    """The ndjson files and shards of meta_path, grouped by UPLOAD_ORDER level."""
+    paths = {}
+    for path in sorted(pathlib.Path(meta_path).glob('*.ndjson*')):
+        paths.setdefault(path.name.split('.', 1)[0], []).append(path)
+    levels = []
+    for resource_types in UPLOAD_ORDER:
+        levels.append([path for resource_type in resource_types for path in paths.pop(resource_type, [])])
+    levels.append([path for resource_type in sorted(paths) for path in paths[resource_type]])
+    return [_ for _ in levels if _]
+
+
+def bundle(lines: list[bytes]) -> bytes:
+    """A transaction Bundle that PUTs each resource."""
+    entries = []
+    for line in lines:
+        resource = orjson.loads(line)
+        entries.append({'resource': resource, 'request': {'method': 'PUT', 'url': f"{resource['resourceType']}/{resource['id']}"}})
+    return orjson.dumps({'resourceType': 'Bundle', 'type': 'transaction', 'entry': entries})
+
+
+def iter_batches(path: pathlib.Path, batch_size: int = BATCH_SIZE, skip: frozenset[int] = frozenset()) -> Iterator[Batch]:
+    """Stream a file's lines into batches, the batches in skip are not rendered."""
+    with open_ndjson(path, binary=True) as fp:
+        lines = []
+        index = 0
+        for line in fp:
+            if line.strip():
+                lines.append(line)
+            if len(lines) == batch_size:
+                if index not in skip:
+                    yield Batch(path, index, len(lines), bundle(lines))
+                lines = []
+                index += 1
+        if lines and index not in skip:
+            yield Batch(path, index, len(lines), bundle(lines))
+
+
+class Checkpoint:
+    """Batches acknowledged by the server, per file; a file that changed since is uploaded again."""
+
+    def __init__(self, path: Optional[pathlib.Path], url: str, batch_size: int) -> None:
+        self.path = pathlib.Path(path) if path else None
+        self._key = f"{url}|{batch_size}"
+        self._files: dict[str, dict] = {}
+        if self.path and self.path.exists():
+            self._files = orjson.loads(self.path.read_bytes()).get(self._key, {})
+
+    @staticmethod
+    def _fingerprint(path: pathlib.Path) -> list[int]:
+        stat = path.stat()
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def done(self, path: pathlib.Path) -> frozenset[int]:
+        """The batches of path acknowledged by an earlier run."""
+        entry = self._files.get(str(path), None)
+        if not entry or entry['fingerprint'] != self._fingerprint(path):
+            self._files[str(path)] = {'fingerprint': self._fingerprint(path), 'batches': []}
+            return frozenset()
+        return frozenset(entry['batches'])
+
+    def add(self, batch: Batch) -> None:
+        """Remember an acknowledged batch."""
+        self._files[str(batch.path)]['batches'].append(batch.index)
+
+    def save(self) -> None:
+        """Write the checkpoint, through a temporary file."""
+        if not self.path:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        checkpoints = orjson.loads(self.path.read_bytes()) if self.path.exists() else {}
+        checkpoints[self._key] = self._files
+        tmp_path = self.path.with_name(f".{self.path.name}.tmp")
+        tmp_path.write_bytes(orjson.dumps(checkpoints))
+        os.replace(tmp_path, self.path)
+
+
+async def post_batch(session: aiohttp.ClientSession, url: str, batch: Batch, max_retries: int = MAX_RETRIES,
+                     backoff: float = BACKOFF) -> None:
+    """POST a batch, retry on connection errors and retryable statuses with exponential backoff."""
+    for attempt in range(max_retries + 1):
+        delay = backoff * (2 ** attempt) * (0.5 + random.random() / 2)
+        try:
+            async with session.post(url, data=batch.body, headers={'Content-Type': 'application/fhir+json'}) as response:
+                if response.status < 300:
+                    await response.read()
+                    return
+                text = await response.text()
+                if response.status not in RETRY_STATUSES:
+                    raise UploadError(f"{batch.path} batch {batch.index}: {response.status} {text[:1000]}")
+                retry_after = response.headers.get('Retry-After', None)
+                if retry_after and retry_after.isdigit():
+                    delay = max(delay, float(retry_after))
+                error = f"{response.status} {text[:200]}"
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            error = repr(e)
+        if attempt < max_retries:
+            logger.info(f"{batch.path} batch {batch.index}: {error}, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+    raise UploadError(f"{batch.path} batch {batch.index}: {error} after {max_retries} retries")
+
+
+async def upload_async(meta_path: pathlib.Path, url: str, headers: Optional[dict] = None, batch_size: int = BATCH_SIZE,
+                       concurrency: int = CONCURRENCY, max_retries: int = MAX_RETRIES, backoff: float = BACKOFF,
+                       checkpoint_path: Optional[pathlib.Path] = STATE_PATH / CHECKPOINT_NAME) -> UploadResults:
+    """Upload the ndjson in meta_path level by level, see upload_ndjson."""
+    checkpoint = Checkpoint(checkpoint_path, url, batch_size)
+    uploaded_count = batch_count = skipped_batch_count = 0
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, headers=headers or {}) as session:
+        for level in upload_levels(meta_path):
+            # producer streams batches into a bounded queue, workers post them
+            batches: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+
+            async def produce() -> None:
+                nonlocal skipped_batch_count
+                for path in level:
+                    done = checkpoint.done(path)
+                    skipped_batch_count += len(done)
+                    for batch in iter_batches(path, batch_size, skip=done):
+                        await batches.put(batch)
+                for _ in range(concurrency):
+                    await batches.put(None)
+
+            async def work() -> None:
+                nonlocal uploaded_count, batch_count
+                while (batch := await batches.get()) is not None:
+                    await post_batch(session, url, batch, max_retries=max_retries, backoff=backoff)
+                    checkpoint.add(batch)
+                    uploaded_count += batch.resource_count
+                    batch_count += 1
+                    if batch_count % CHECKPOINT_EVERY == 0:
+                        checkpoint.save()
+
+            tasks = [asyncio.create_task(produce())] + [asyncio.create_task(work()) for _ in range(concurrency)]
+            try:
+                await asyncio.gather(*tasks)
+            finally:
+                for task in tasks:
+                    task.cancel()
+                checkpoint.save()
+            logger.info(f"uploaded {', '.join(_.name for _ in level)}")
+    return UploadResults(uploaded_count=uploaded_count, batch_count=batch_count, skipped_batch_count=skipped_batch_count)
+
+
+def upload_ndjson(meta_path: pathlib.Path, url: str, headers: Optional[dict] = None, batch_size: int = BATCH_SIZE,
+                  concurrency: int = CONCURRENCY, max_retries: int = MAX_RETRIES, backoff: float = BACKOFF,
+                  checkpoint_path: Optional[pathlib.Path] = STATE_PATH / CHECKPOINT_NAME) -> UploadResults:
+    """Upload the ndjson in meta_path to the FHIR server at url, resume from the checkpoint of an interrupted upload.
+
+    Set checkpoint_path to None to upload everything.
+    """
+    return asyncio.run(upload_async(meta_path, url, headers=headers, batch_size=batch_size, concurrency=concurrency,
+                                    max_retries=max_retries, backoff=backoff, checkpoint_path=checkpoint_path))
@@ -0,0 +1,277 @@
+"""Watch a directory of deliveries, transform each new file into its own META directory as it lands.
+
+A `transform` pays interpreter startup, plugin loading and the template cache before its first row, for a small site
+file that is most of its time. Here a pool of worker processes is started once, each loads the plugin, the compiled
+templates and the transformer modules up front, then transforms the queued deliveries with the streaming engine.
+
+New files are noticed with inotify on Linux (a file is queued when it is closed after writing, or moved in),
+by polling elsewhere (a file is queued once its size and mtime are unchanged between two polls).
+The size and mtime of each transformed delivery are kept in .g3t/state, files already transformed are skipped on restart.
+"""
+import ctypes
+import ctypes.util
+import logging
+import os
+import pathlib
+import select
+import shutil
+import struct
+import sys
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Iterator, NamedTuple, Optional
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+STATE_PATH = pathlib.Path('.g3t/state')
+
+STATE_NAME = 'ucl_stavrinides-watch.json'
+
+SUFFIXES = ('.csv',)
+"""Deliveries, add '.parquet' to transform extracts."""
+
+POLL_INTERVAL = 1.0
+"""Seconds between scans of the directory, and the longest wait for a new file with inotify."""
+
+TICK = 0.05
+"""Seconds between checks for completed deliveries and new files, while deliveries are in flight."""
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+EVENT = struct.Struct('iIII')
+"""struct inotify_event: wd, mask, cookie, len, followed by len bytes of name."""
+
+
+class DeliveryResults(NamedTuple):
+    """The transform of one delivery: its latency from landing to META, and the time it waited for a worker."""
+    input_path: pathlib.Path
+    output_path: pathlib.Path
+    parsed_count: int
+    emitted_count: int
+    latency: float
+    queued: float
+    error: Optional[str] = None
+
+
+class InotifyWatcher:
+    """Names of the files closed after writing, or moved into a directory, with inotify(7)."""
+
+    def __init__(self, path: pathlib.Path) -> None:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        if libc.inotify_add_watch(self._fd, os.fsencode(path), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            errno = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(errno, f"inotify_add_watch {path} failed")
+        self.path = pathlib.Path(path)
+
+    @staticmethod
+    def available() -> bool:
+        return sys.platform.startswith('linux') and ctypes.util.find_library('c') is not None
+
+    def changes(self, timeout: float) -> list[pathlib.Path]:
+        """The files written since the last call, wait up to timeout seconds for one."""
+        if not select.select([self._fd], [], [], timeout)[0]:
+            return []
+        paths = []
+        while True:
+            try:
+                buffer = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(buffer):
+                _, _, _, length = EVENT.unpack_from(buffer, offset)
+                name = buffer[offset + EVENT.size:offset + EVENT.size + length].rstrip(b'\0')
+                offset += EVENT.size + length
+                if name:
+                    paths.append(self.path / os.fsdecode(name))
+        return paths
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+class PollingWatcher:
+    """Names of the files whose size and mtime changed, and then held still for a poll interval."""
+
+    def __init__(self, path: pathlib.Path, interval: float = POLL_INTERVAL) -> None:
+        self.path = pathlib.Path(path)
+        self.interval = interval
+        self._previous = self._scan()
+        self._reported = dict(self._previous)
+        self._scanned = time.monotonic()
+
+    def _scan(self) -> dict[pathlib.Path, tuple[int, int]]:
+        stats = {}
+        for entry in os.scandir(self.path):
+            if entry.is_file():
+                stat = entry.stat()
+                stats[pathlib.Path(entry.path)] = (stat.st_size, stat.st_mtime_ns)
+        return stats
+
+    def changes(self, timeout: float) -> list[pathlib.Path]:
+        """The files written since the last call, wait up to timeout seconds for the next scan."""
+        remaining = self._scanned + self.interval - time.monotonic()
+        if remaining > timeout:
+            time.sleep(timeout)
+            return []
+        time.sleep(max(remaining, 0))
+        current = self._scan()
+        self._scanned = time.monotonic()
+        paths = [path for path, stat in current.items() if self._previous.get(path, None) == stat and self._reported.get(path, None) != stat]
+        for path in paths:
+            self._reported[path] = current[path]
+        self._previous = current
+        return paths
+
+    def close(self) -> None:
+        pass
+
+
+def watcher(path: pathlib.Path, poll: bool = False, poll_interval: float = POLL_INTERVAL) -> InotifyWatcher | PollingWatcher:
+    """An inotify watcher, or a polling watcher if asked to or inotify is not available."""
+    if not poll and InotifyWatcher.available():
+        try:
+            return InotifyWatcher(path)
+        except OSError as e:
+            logger.warning(f"polling {path}, inotify is not available: {e}")
+    return PollingWatcher(path, interval=poll_interval)
+
+
+def _initialize_worker(plugins: list[str]) -> None:
+    """Register the transformer, load the compiled templates and the transformer modules before the first delivery."""
+    from g3t_etl.loader import load_plugins
+    load_plugins(plugins)
+    from ucl_stavrinides.templates import load_compiled_templates
+    load_compiled_templates()
+    import ucl_stavrinides.emission  # noqa - imported to warm the worker
+    import ucl_stavrinides.streaming  # noqa
+
+
+def _ready() -> int:
+    return os.getpid()
+
+
+def _transform_delivery(input_path: pathlib.Path, output_path: pathlib.Path, trusted: bool, validation_rate: float,
+                        exclude_zones: bool) -> tuple[int, int]:
+    """Transform a delivery into a temporary directory, then swap it into output_path. Returns the parsed and emitted counts."""
+    from ucl_stavrinides.streaming import transform_csv_streaming
+    tmp_path = output_path.with_name(f".{output_path.name}.{os.getpid()}.tmp")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    tmp_path.mkdir(parents=True)
+    try:
+        results = transform_csv_streaming(input_path, tmp_path, trusted=trusted, validation_rate=validation_rate,
+                                          exclude_zones=exclude_zones)
+        if output_path.exists():
+            shutil.rmtree(output_path)
+        os.replace(tmp_path, output_path)
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    return results.parsed_count, results.emitted_count
+
+
+class WatchState:
+    """The size and mtime of each transformed delivery, by file name."""
+
+    def __init__(self, path: Optional[pathlib.Path] = STATE_PATH / STATE_NAME) -> None:
+        self.path = pathlib.Path(path) if path else None
+        self._entries: dict[str, list[int]] = {}
+        if self.path and self.path.exists():
+            self._entries = orjson.loads(self.path.read_bytes())
+
+    def is_transformed(self, path: pathlib.Path, stat: os.stat_result) -> bool:
+        return self._entries.get(path.name, None) == [stat.st_size, stat.st_mtime_ns]
+
+    def put(self, path: pathlib.Path, stat: os.stat_result) -> None:
+        """Remember the delivery, written through a temporary file."""
+        self._entries[path.name] = [stat.st_size, stat.st_mtime_ns]
+        if not self.path:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f".{self.path.name}.tmp")
+        tmp_path.write_bytes(orjson.dumps(self._entries))
+        os.replace(tmp_path, self.path)
+
+
+def watch_deliveries(input_path: pathlib.Path,
+                     output_path: pathlib.Path,
+                     concurrency: int = 2,
+                     trusted: bool = False,
+                     validation_rate: float = 0.01,
+                     exclude_zones: bool = False,
+                     suffixes: tuple[str, ...] = SUFFIXES,
+                     poll: bool = False,
+                     poll_interval: float = POLL_INTERVAL,
+                     once: bool = False,
+                     state_path: Optional[pathlib.Path] = STATE_PATH / STATE_NAME,
+                     plugins: tuple[str, ...] = ('ucl_stavrinides.transformer',)) -> Iterator[DeliveryResults]:
+    """Transform each delivery of input_path into output_path/<delivery name>, yield the results as each completes.
+
+    The deliveries already in input_path are queued first. At most `concurrency` deliveries are transformed at a time,
+    the others wait in the queue. If once, return when the deliveries already there are transformed, otherwise watch forever.
+    If exclude_zones, the SV rows are skipped, see streaming.iter_records.
+    """
+    input_path, output_path = pathlib.Path(input_path), pathlib.Path(output_path)
+    output_path.mkdir(parents=True, exist_ok=True)
+    state = WatchState(state_path)
+    watcher_ = None if once else watcher(input_path, poll=poll, poll_interval=poll_interval)
+    queue: deque[tuple[pathlib.Path, float]] = deque()
+    queued: set[pathlib.Path] = set()
+    in_flight: dict[Future, tuple[pathlib.Path, os.stat_result, float, float]] = {}
+
+    def enqueue(paths: list[pathlib.Path], landed: float) -> None:
+        for path in paths:
+            if path in queued or path.name.startswith('.') or path.suffix not in suffixes or not path.is_file():
+                continue
+            if state.is_transformed(path, path.stat()):
+                continue
+            queued.add(path)
+            queue.append((path, landed))
+
+    with ProcessPoolExecutor(max_workers=concurrency, initializer=_initialize_worker, initargs=(list(plugins),)) as executor:
+        started = time.monotonic()
+        for _ in [executor.submit(_ready) for _ in range(concurrency)]:
+            _.result()
+        logger.info(f"started {concurrency} workers in {time.monotonic() - started:.2f}s")
+        enqueue(sorted(input_path.iterdir()), time.monotonic())
+        try:
+            while True:
+                while queue and len(in_flight) < concurrency:
+                    path, landed = queue.popleft()
+                    # the stat of the file transformed, if it changes while in flight it is queued again
+                    stat = path.stat()
+                    future = executor.submit(_transform_delivery, path, output_path / path.stem, trusted, validation_rate,
+                                             exclude_zones)
+                    in_flight[future] = (path, stat, landed, time.monotonic())
+                if once and not in_flight:
+                    return
+                if in_flight:
+                    done, _ = wait(in_flight, timeout=TICK if watcher_ else None, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        path, stat, landed, submitted = in_flight.pop(future)
+                        queued.discard(path)
+                        error = None
+                        parsed_count = emitted_count = 0
+                        try:
+                            parsed_count, emitted_count = future.result()
+                            state.put(path, stat)
+                        except Exception as e:  # noqa - reported, the file is transformed again when it changes
+                            error = f"{type(e).__name__}: {e}"
+                        yield DeliveryResults(input_path=path, output_path=output_path / path.stem, parsed_count=parsed_count,
+                                              emitted_count=emitted_count, latency=time.monotonic() - landed,
+                                              queued=submitted - landed, error=error)
+                        if path.exists() and path.stat().st_mtime_ns != stat.st_mtime_ns:
+                            enqueue([path], time.monotonic())
+                if watcher_:
+                    enqueue(watcher_.changes(0 if in_flight else poll_interval), time.monotonic())
+        finally:
+            if watcher_:
+                watcher_.close()
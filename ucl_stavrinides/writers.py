@@ -0,0 +1,185 @@
+"""Per resource type ndjson writers."""
+import gzip
+import logging
+import pathlib
+import queue
+import threading
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+BUFFER_SIZE = 1 << 20
+"""Bytes buffered per resource type before writing to disk."""
+
+BATCH_SIZE = 1024
+"""Lines per resource type handed to the background writer at a time."""
+
+QUEUE_SIZE = 64
+"""Batches waiting for the background writer, transformation blocks when the writer falls behind."""
+
+COMPRESS_LEVEL = 6
+"""gzip level, 6 is gzip's default, much faster than 9 for a few percent."""
+
+
+class NdjsonWriters:
+    """Write lines to {resource_type}.ndjson files in a directory, a file is opened on its first line."""
+
+    def __init__(self, output_path: pathlib.Path | str, buffer_size: int = BUFFER_SIZE, file_mode: str = 'w') -> None:
+        self.output_path = pathlib.Path(output_path)
+        self.buffer_size = buffer_size
+        self.file_mode = file_mode
+        self._files = {}
+        self.counts: dict[str, int] = {}
+        """Lines written per resource type."""
+
+    def write(self, resource_type: str, line: str) -> None:
+        """Write a line, without trailing newline, to the resource type's file."""
+        fp = self._files.get(resource_type, None)
+        if fp is None:
+            fp = open(self.output_path / f"{resource_type}.ndjson", self.file_mode, buffering=self.buffer_size)
+            self._files[resource_type] = fp
+            self.counts[resource_type] = 0
+        fp.write(line)
+        fp.write('\n')
+        self.counts[resource_type] += 1
+
+    def close(self) -> None:
+        """Flush and close all files."""
+        for fp in self._files.values():
+            fp.close()
+        self._files = {}
+
+    def __enter__(self) -> 'NdjsonWriters':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def open_ndjson(path: pathlib.Path, binary: bool = False):
+    """Open an ndjson file or shard for reading, gzipped if it ends with .gz."""
+    if pathlib.Path(path).suffix == '.gz':
+        return gzip.open(path, 'rb') if binary else gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, 'rb') if binary else open(path)
+
+
+class ShardedNdjsonWriters:
+    """Write lines to {resource_type}.NNN.ndjson[.gz] shards in a directory, from a background thread.
+
+    Lines are batched per resource type, the batches pass through a bounded queue shared by all resource types
+    to a single writer thread, so compression and disk I/O overlap with transformation; zlib and file writes
+    release the GIL. A shard is closed, and the next one opened, once it holds `shard_lines` lines or
+    `shard_bytes` uncompressed bytes, utf-8 encoded. Without either limit each resource type has a single {resource_type}.ndjson[.gz].
+    """
+
+    def __init__(self, output_path: pathlib.Path | str, shard_lines: Optional[int] = None, shard_bytes: Optional[int] = None,
+                 compress: bool = True, compress_level: int = COMPRESS_LEVEL, batch_size: int = BATCH_SIZE,
+                 queue_size: int = QUEUE_SIZE) -> None:
+        self.output_path = pathlib.Path(output_path)
+        self.shard_lines = shard_lines
+        self.shard_bytes = shard_bytes
+        self.compress = compress
+        self.compress_level = compress_level
+        self.batch_size = batch_size
+        self.counts: dict[str, int] = {}
+        """Lines written per resource type."""
+        self.shards: dict[str, list[pathlib.Path]] = {}
+        """Shards written per resource type, in order."""
+        self._batches: dict[str, list[str]] = {}
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, name='ndjson-writer', daemon=True)
+        self._thread.start()
+
+    def write(self, resource_type: str, line: str) -> None:
+        """Write a line, without trailing newline, to the resource type's current shard."""
+        batch = self._batches.get(resource_type, None)
+        if batch is None:
+            batch = self._batches[resource_type] = []
+            self.counts[resource_type] = 0
+        batch.append(line)
+        self.counts[resource_type] += 1
+        if len(batch) >= self.batch_size:
+            self._put(resource_type, batch)
+            self._batches[resource_type] = []
+
+    def _put(self, resource_type: str, batch: list[str]) -> None:
+        if self._error:
+            raise self._error
+        self._queue.put((resource_type, batch))
+
+    def _shard_path(self, resource_type: str, index: int) -> pathlib.Path:
+        name = f"{resource_type}.{index:03d}.ndjson" if self.shard_lines or self.shard_bytes else f"{resource_type}.ndjson"
+        return self.output_path / (name + '.gz' if self.compress else name)
+
+    def _open(self, path: pathlib.Path):
+        if self.compress:
+            return gzip.open(path, 'wt', compresslevel=self.compress_level, encoding='utf-8')
+        return open(path, 'w', buffering=BUFFER_SIZE, encoding='utf-8')
+
+    def _run(self) -> None:
+        """Append each batch to its resource type's shard, rotating full shards; runs in the writer thread."""
+        files = {}
+        sizes = {}
+        try:
+            while (item := self._queue.get()) is not None:
+                resource_type, lines = item
+                while lines:
+                    if resource_type not in files:
+                        path = self._shard_path(resource_type, len(self.shards.setdefault(resource_type, [])))
+                        files[resource_type] = self._open(path)
+                        self.shards[resource_type].append(path)
+                        sizes[resource_type] = [0, 0]
+                    size = sizes[resource_type]
+                    count = self._fit(size, lines)
+                    chunk = '\n'.join(lines[:count]) + '\n'
+                    files[resource_type].write(chunk)
+                    size[0] += count
+                    if self.shard_bytes:
+                        size[1] += len(chunk.encode())
+                    lines = lines[count:]
+                    if self._is_full(size):
+                        files.pop(resource_type).close()
+        except BaseException as e:  # noqa - re-raised in the transforming thread
+            self._error = e
+            # keep draining so the transforming thread does not block
+            while self._queue.get() is not None:
+                pass
+        finally:
+            for fp in files.values():
+                fp.close()
+
+    def _fit(self, size: list[int], lines: list[str]) -> int:
+        """Number of lines, at least one, that fit in a shard holding size [lines, bytes]."""
+        count = len(lines)
+        if self.shard_lines:
+            count = min(count, self.shard_lines - size[0])
+        if self.shard_bytes:
+            written = size[1]
+            for index in range(count):
+                written += len(lines[index].encode()) + 1
+                if written >= self.shard_bytes:
+                    return index + 1
+        return count
+
+    def _is_full(self, size: list[int]) -> bool:
+        return bool((self.shard_lines and size[0] >= self.shard_lines) or (self.shard_bytes and size[1] >= self.shard_bytes))
+
+    def close(self) -> None:
+        """Hand over the remaining lines, wait for the writer thread to close all shards."""
+        if not self._thread.is_alive():
+            return
+        for resource_type, batch in self._batches.items():
+            if batch:
+                self._queue.put((resource_type, batch))
+        self._batches = {}
+        self._queue.put(None)
+        self._thread.join()
+        if self._error:
+            raise self._error
+
+    def __enter__(self) -> 'ShardedNdjsonWriters':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()